@@ -0,0 +1,264 @@
+# Green Grass Bot — Ties the music you're listening to with the concert it's playing at.
+# Copyright (C) 2021-2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""This file contains benchmark of Db methods on large synthetic databases: for each
+users quantity database is generated by large_db.py, then every Db method is called
+with arguments sampled from generated data, and median and p95 of call durations are
+printed as table with column per size, i.e. scaling curves. Run it before and after
+schema or index change. Reads are timed first, then writes, then deletes.
+Run from project root: python -m benchmarks.db_bench --users 100 1000 5000"""
+
+import argparse
+import asyncio
+import random
+import re
+import sqlite3
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+import config as cfg
+from benchmarks.sandbox import setup_i18n_and_logs, setup_sandbox
+
+TMP_DIR = setup_sandbox('db_bench')
+
+# pylint: disable=wrong-import-position
+from benchmarks.large_db import add_shape_arguments, fill_db, shape_from_args
+from db.db_service import Db, dsql_user, dsql_useraccs, shorthands_cache
+from db.queues_service import dsql_joblease, dsql_outbox
+from services.custom_classes import ArtScrobble, BotUser, Event
+from services.timeconv_service import FORMAT_SQL_DATE
+
+#  Call of Db method number i, returns awaitable of the call.
+Call = Callable[[int], Awaitable]
+
+
+@dataclass
+class Samples:
+    """
+    Arguments for Db methods, taken from generated database: users, accounts, recently
+    listened artists as tuples (user_id, art_name, lfm), shorthands and outbox
+    messages.
+    """
+
+    users: List[int]
+    accs: List[Tuple]
+    listened: List[Tuple]
+    shorthands: List[Tuple]
+    messages: List[int]
+    max_user: int
+
+
+def take_samples(db_path: str, rnd: random.Random, qty: int) -> Samples:
+    """
+    Returns qty random samples of each kind from generated database.
+    """
+    con = sqlite3.connect(db_path)
+    try:
+
+        def sample(query: str) -> List[Tuple]:
+            rows = con.execute(query).fetchall()
+            return rnd.sample(rows, min(qty, len(rows)))
+
+        return Samples(
+            users=[row[0] for row in sample('SELECT user_id FROM users')],
+            accs=sample('SELECT user_id, lfm FROM useraccs'),
+            listened=sample(
+                'SELECT DISTINCT user_id, art_name, lfm FROM scrobbles '
+                f'WHERE scrobble_date >= DATE("now", "-{cfg.DAYS_PERIOD_MINLISTENS} days")'
+            ),
+            shorthands=sample('SELECT user_id, shorthand FROM lastarts'),
+            messages=[row[0] for row in sample('SELECT msg_id FROM outbox')],
+            max_user=con.execute('SELECT MAX(user_id) FROM users').fetchone()[0],
+        )
+    finally:
+        con.close()
+
+
+def pick(items: List, index: int):
+    """
+    Returns item number index, going round the list.
+    """
+    return items[index % len(items)]
+
+
+def make_calls(db: Db, samples: Samples) -> Dict[str, Call]:
+    """
+    Returns calls of Db methods in order of timing. save_user() is not here: it needs
+    Tg Update and consists of wsql_users(), wsql_settings() and wsql_useraccs().
+    """
+    today = datetime.now(timezone.utc).strftime(FORMAT_SQL_DATE)
+    users = samples.users
+    accs = samples.accs
+    listened = samples.listened
+
+    async def rsql_jobs(_index: int) -> None:
+        db.rsql_jobs()
+
+    async def rsql_shorthand(index: int) -> None:
+        #  Otherwise cache is timed, not db
+        shorthands_cache.clear()
+        await db.rsql_shorthand(*pick(samples.shorthands, index))
+
+    async def rsql_getallevents(index: int) -> None:
+        shorthands_cache.clear()
+        await db.rsql_getallevents(*pick(samples.shorthands, index))
+
+    def new_user(index: int) -> int:
+        return samples.max_user + 1 + index
+
+    def events(index: int) -> List[Event]:
+        return [
+            Event(
+                today,
+                f'Bench venue {number}',
+                'Bench city',
+                'Bench country',
+                'lastfm',
+                f'https://www.last.fm/event/bench{index}-{number}',
+                [pick(listened, index + number)[1]],
+            )
+            for number in range(10)
+        ]
+
+    def sent_arts(index: int) -> List[Tuple[int, str]]:
+        user_id = pick(listened, index)[0]
+        arts = [art_name for user, art_name, _ in listened if user == user_id]
+        return list(enumerate(arts[:10], start=1))
+
+    async def wsql_last_sent_arts_batch(index: int) -> None:
+        await db.wsql_last_sent_arts_batch(pick(listened, index)[0], sent_arts(index))
+
+    #  Deletes take distinct users from both ends, not to delete twice
+    half = len(users) // 2
+    return {
+        'rsql_users': lambda i: db.rsql_users(pick(users, i)),
+        'rsql_jobs': rsql_jobs,
+        'rsql_duejobs': lambda i: db.rsql_duejobs(today, i % 4, 4),
+        'rsql_outbox': lambda i: db.rsql_outbox(cfg.QTY_OUTBOX_BATCH),
+        'rsql_outbox_depth': lambda i: db.rsql_outbox_depth(),
+        'rsql_locale': lambda i: db.rsql_locale(pick(users, i)),
+        'rsql_settings': lambda i: db.rsql_settings(pick(users, i)),
+        'rsql_maxshorthand': lambda i: db.rsql_maxshorthand(pick(users, i)),
+        'rsql_lfmuser': lambda i: db.rsql_lfmuser(pick(users, i)),
+        'rsql_sync_age': lambda i: db.rsql_sync_age(pick(users, i)),
+        'rsql_recent_arts': lambda i: db.rsql_recent_arts(*pick(accs, i)),
+        'rsql_lastdayscrobble': lambda i: db.rsql_lastdayscrobble(*pick(accs, i)),
+        'rsql_artcheck': lambda i: db.rsql_artcheck(*pick(listened, i)[:2]),
+        'rsql_artdigest': lambda i: db.rsql_artdigest(pick(listened, i)[1]),
+        'rsql_finalquestion': lambda i: db.rsql_finalquestion(*pick(listened, i)[:2]),
+        'rsql_shorthand': rsql_shorthand,
+        'rsql_getallevents': rsql_getallevents,
+        'wsql_users': lambda i: db.wsql_users(
+            BotUser(new_user(i), 'bench', 'Bench', '', cfg.LOCALE_DEFAULT)
+        ),
+        'wsql_settings': lambda i: db.wsql_settings(user_id=new_user(i)),
+        'wsql_useraccs': lambda i: db.wsql_useraccs(new_user(i), f'bench{i}'),
+        'wsql_useraccs_synced': lambda i: db.wsql_useraccs_synced(*pick(accs, i)),
+        'wsql_jobs': lambda i: db.wsql_jobs(new_user(i), new_user(i)),
+        'wsql_joblease': lambda i: db.wsql_joblease(
+            pick(users, i), pick(users, i), today, 'bench'
+        ),
+        'wsql_joblease_done': lambda i: db.wsql_joblease_done(
+            pick(users, i), pick(users, i), today, 'bench'
+        ),
+        'wsql_scrobbles': lambda i: db.wsql_scrobbles(
+            ArtScrobble(*pick(listened, i)[:2], today, pick(listened, i)[2], 1)
+        ),
+        'wsql_events_lups': lambda i: db.wsql_events_lups(events(i)),
+        'wsql_artcheck': lambda i: db.wsql_artcheck(
+            pick(listened, i)[1], f'{i:040d}', i % 2 == 0
+        ),
+        'wsql_outbox': lambda i: db.wsql_outbox(pick(users, i), 'Bench news', 'HTML'),
+        'wsql_outbox_attempt': lambda i: db.wsql_outbox_attempt(
+            pick(samples.messages, i)
+        ),
+        'wsql_last_sent_arts_batch': wsql_last_sent_arts_batch,
+        'dsql_joblease': lambda i: dsql_joblease(db),
+        'dsql_outbox': lambda i: dsql_outbox(db, pick(samples.messages, i)),
+        'dsql_useraccs': lambda i: dsql_useraccs(db, *pick(accs[:half], i)),
+        'dsql_user': lambda i: dsql_user(db, pick(users[half:], i)),
+    }
+
+
+async def time_calls(calls: Dict[str, Call], qty: int) -> Dict[str, List[float]]:
+    """
+    Call each method qty times, one call at a time.
+    Returns:
+        {method name: sorted durations in seconds}
+    """
+    durations: Dict[str, List[float]] = {}
+    for name, call in calls.items():
+        durations[name] = []
+        for index in range(qty):
+            start = time.perf_counter()
+            await call(index)
+            durations[name].append(time.perf_counter() - start)
+        durations[name].sort()
+    return durations
+
+
+async def bench(args: argparse.Namespace) -> None:
+    """
+    Generate database for each size, time methods and print table.
+    """
+    results: Dict[int, Dict[str, List[float]]] = {}
+    for users in args.users:
+        cfg.FILE_DB = f'large_{users}.db'
+        db = Db(initial=True)
+        start = time.perf_counter()
+        counts = fill_db(db.db_path, shape_from_args(args, users), args.seed)
+        print(
+            f'{users} users generated in {time.perf_counter() - start:.1f} s: '
+            + ', '.join(f'{table} {qty}' for table, qty in counts.items())
+        )
+        samples = take_samples(db.db_path, random.Random(args.seed), args.calls)
+        calls = make_calls(db, samples)
+        calls = {
+            name: call for name, call in calls.items() if re.search(args.methods, name)
+        }
+        results[users] = await time_calls(calls, args.calls)
+    print(f'\nms per call, median / p95 of {args.calls} calls, db in {TMP_DIR}')
+    print(f'{"users":26}' + ''.join(f'{users:>16}' for users in args.users))
+    for name in results[args.users[0]]:
+        cells = []
+        for users in args.users:
+            durations = results[users][name]
+            median = durations[len(durations) // 2] * 1000
+            p95 = durations[int(len(durations) * 0.95)] * 1000
+            cells.append(f'{median:>8.2f} /{p95:>6.1f}')
+        print(f'{name:26}' + ''.join(cells))
+
+
+def main() -> None:
+    """
+    Parse arguments and run benchmark.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        '--users', type=int, nargs='+', default=[100, 1000], help='sizes to compare'
+    )
+    parser.add_argument('--calls', type=int, default=50, help='calls of each method')
+    parser.add_argument('--methods', default='', help='regex of methods to time')
+    add_shape_arguments(parser)
+    args = parser.parse_args()
+    setup_i18n_and_logs()
+    print(
+        f'Users {args.users}, {args.artists} artists, {args.days} days, db in {TMP_DIR}'
+    )
+    asyncio.run(bench(args))
+
+
+if __name__ == '__main__':
+    main()
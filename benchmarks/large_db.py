@@ -0,0 +1,458 @@
+# Green Grass Bot — Ties the music you're listening to with the concert it's playing at.
+# Copyright (C) 2021-2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""This file contains generator of large synthetic database with ggb_sqlite.sql schema:
+users with settings, lfm accounts and jobs, days of scrobbles, events with lineups,
+sentarts and lastarts. Artist popularity is Zipfian, both among all users and within
+library of one user. Same arguments and seed give same data, except dates, which are
+counted back from today. Used by db_bench.py, may be run alone to get db file.
+Run from project root: python -m benchmarks.large_db --users 1000"""
+
+import argparse
+import bisect
+import hashlib
+import itertools
+import random
+import sqlite3
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+import config as cfg
+from benchmarks.page_factory import make_artists
+from benchmarks.sandbox import setup_i18n_and_logs, setup_sandbox
+
+if __name__ == '__main__':
+    TMP_DIR = setup_sandbox('large_db')
+
+# pylint: disable=wrong-import-position
+from services.custom_classes import UserSettings
+from services.timeconv_service import FORMAT_SQL_DATE, FORMAT_SQL_TIMESTAMP
+
+
+@dataclass
+class Touring:
+    """
+    Shape of generated events.
+    Args:
+        share: share of artists having events
+        events: mean quantity of events of touring artist
+    """
+
+    share: float = 0.3
+    events: int = 10
+
+
+@dataclass
+class Shape:
+    """
+    Size and shape of generated data.
+    Args:
+        users: quantity of bot users
+        artists: quantity of artists
+        days: days of scrobbles history, up to today
+        library: artists in one user's library, i.e. ever listened
+        daily: mean quantity of artists one account listens a day
+        zipf: exponent of Zipf distribution of artist popularity
+        touring: shape of events
+    """
+
+    users: int = 1000
+    artists: int = 20000
+    days: int = 90
+    library: int = 300
+    daily: int = 10
+    zipf: float = 1.0
+    touring: Touring = field(default_factory=Touring)
+
+
+class Zipf:
+    """
+    Chooses indexes 0..qty-1 with probability proportional to 1/(index+1)**exponent.
+    """
+
+    def __init__(self, qty: int, exponent: float) -> None:
+        weights = (1 / (rank + 1) ** exponent for rank in range(qty))
+        self.cum_weights = list(itertools.accumulate(weights))
+
+    def choose(self, rnd: random.Random) -> int:
+        """
+        Returns one random index.
+        """
+        return bisect.bisect(self.cum_weights, rnd.random() * self.cum_weights[-1])
+
+    def sample(self, rnd: random.Random, qty: int) -> List[int]:
+        """
+        Returns up to qty distinct random indexes, popular ones first chosen.
+        """
+        chosen: Dict[int, None] = {}
+        for _ in range(qty * 4):
+            chosen[self.choose(rnd)] = None
+            if len(chosen) >= qty:
+                break
+        return list(chosen)
+
+
+def sql_date(day: datetime) -> str:
+    """
+    Returns date as written to db.
+    """
+    return day.strftime(FORMAT_SQL_DATE)
+
+
+def sql_timestamp(moment: datetime) -> str:
+    """
+    Returns date and time as written to db.
+    """
+    return moment.strftime(FORMAT_SQL_TIMESTAMP)
+
+
+def make_events(
+    touring: Touring, rnd: random.Random, artists: Sequence[str], now: datetime
+) -> Tuple[List[Tuple], List[Tuple], Dict[str, List[Tuple[int, str]]]]:
+    """
+    Generate events from 180 days ago to a year ahead. Popular artists tour more
+    likely; some events are festivals with several artists.
+    Returns:
+        events rows, lineups rows and {art_name: [(event_id, event_date)]}
+    """
+    events: List[Tuple] = []
+    lineups: List[Tuple] = []
+    art_events: Dict[str, List[Tuple[int, str]]] = {}
+    touring_arts = [
+        art_name
+        for rank, art_name in enumerate(artists)
+        if rnd.random() < touring.share * 2 / (1 + rank / len(artists) * 2)
+    ]
+    event_id = 0
+    for art_name in touring_arts:
+        for _ in range(rnd.randint(1, touring.events * 2 - 1)):
+            event_id += 1
+            event_date = sql_date(now + timedelta(days=rnd.randint(-180, 365)))
+            city = rnd.randint(0, 499)
+            events.append(
+                (
+                    event_id,
+                    event_date,
+                    f'Venue {city}-{rnd.randint(0, 9)}',
+                    f'City {city}',
+                    f'Country {city % 60}',
+                    'lastfm',
+                    f'https://www.last.fm/event/{event_id}',
+                )
+            )
+            lineup = [art_name]
+            if rnd.random() < 0.2:
+                lineup.extend(rnd.sample(touring_arts, min(len(touring_arts), 3)))
+            for lineup_art in dict.fromkeys(lineup):
+                lineups.append((event_id, lineup_art))
+                art_events.setdefault(lineup_art, []).append((event_id, event_date))
+    return events, lineups, art_events
+
+
+class UserMaker:
+    """
+    Generates rows of all the tables for one user at a time, listening artists with
+    Zipfian popularity and sent events of them.
+    Args:
+        shape: size and shape of data
+        rnd: random generator, shared with the rest of data to keep it reproducible
+        artists: artist names, most popular first
+        art_events: {art_name: [(event_id, event_date)]}
+        now: moment data is generated at
+    """
+
+    def __init__(
+        self,
+        shape: Shape,
+        rnd: random.Random,
+        artists: Sequence[str],
+        art_events: Dict[str, List[Tuple[int, str]]],
+        now: datetime,
+    ) -> None:
+        self.shape = shape
+        self.rnd = rnd
+        self.artists = artists
+        self.zipf = Zipf(len(artists), shape.zipf)
+        self.art_events = art_events
+        self.now = now
+
+    def make_user(self, user_id: int) -> Dict[str, List[Tuple]]:
+        """
+        Generate rows of all the tables for one user.
+        Returns:
+            {table: rows}
+        """
+        rnd, now = self.rnd, self.now
+        rows: Dict[str, List[Tuple]] = {}
+        rows['users'] = [
+            (
+                user_id,
+                f'user{user_id}',
+                'Fake',
+                '',
+                cfg.LOCALE_DEFAULT,
+                sql_timestamp(now - timedelta(days=rnd.randint(0, 3 * 365))),
+            )
+        ]
+        settings = asdict(UserSettings(user_id=user_id))
+        settings['min_listens'] = rnd.choice((1, 2, cfg.DEFAULT_MIN_LISTENS, 5, 10))
+        rows['usersettings'] = [tuple(settings.values())]
+        rows['jobs'] = [(user_id, user_id)]
+        accs_range = range(1, cfg.MAX_LFM_ACCOUNT_QTY + 1)
+        accs_qty = rnd.choices(accs_range, [1 / qty**2 for qty in accs_range])[0]
+        lfms = [f'lfm{user_id}' + (f'_{acc}' if acc else '') for acc in range(accs_qty)]
+        rows['useraccs'] = [
+            (user_id, lfm, sql_timestamp(now - timedelta(hours=rnd.randint(0, 48))))
+            for lfm in lfms
+        ]
+        rows['joblease'] = [
+            (
+                user_id,
+                user_id,
+                sql_date(now - timedelta(days=day)),
+                'main',
+                sql_timestamp(now - timedelta(days=day)),
+                sql_timestamp(now - timedelta(days=day)),
+            )
+            for day in range(1, cfg.DAYS_KEEP_JOBLEASE + 1)
+        ]
+        #  User listens to own library with Zipfian popularity too
+        library = [
+            self.artists[index] for index in self.zipf.sample(rnd, self.shape.library)
+        ]
+        rows['scrobbles'] = self.make_scrobbles(user_id, lfms, library)
+        rows['sentarts'], sent_names = self.make_sentarts(user_id, library)
+        rows['lastarts'] = [
+            (
+                user_id,
+                shorthand,
+                art_name,
+                sql_date(now - timedelta(days=shorthand % 7)),
+            )
+            for shorthand, art_name in enumerate(
+                sent_names[: cfg.INTEGER_MAX_SHORTHAND], start=1
+            )
+        ]
+        return rows
+
+    def make_scrobbles(
+        self, user_id: int, lfms: List[str], library: List[str]
+    ) -> List[Tuple]:
+        """
+        Generate scrobbles rows of user accounts for every day of history.
+        """
+        library_zipf = Zipf(len(library), self.shape.zipf)
+        scrobbles: List[Tuple] = []
+        for lfm in lfms:
+            for day in range(self.shape.days):
+                scrobble_date = sql_date(self.now - timedelta(days=day))
+                daily = self.rnd.randint(0, self.shape.daily * 2)
+                for index in library_zipf.sample(self.rnd, daily):
+                    scrobbles.append(
+                        (
+                            user_id,
+                            library[index],
+                            scrobble_date,
+                            lfm,
+                            self.rnd.randint(1, 12),
+                        )
+                    )
+        return scrobbles
+
+    def make_sentarts(
+        self, user_id: int, library: List[str]
+    ) -> Tuple[List[Tuple], List[str]]:
+        """
+        Generate sentarts rows: events of listened artists were sent at some day of
+        history.
+        Returns:
+            sentarts rows and names of artists sent
+        """
+        sentarts: List[Tuple] = []
+        sent_names: List[str] = []
+        for art_name in library:
+            if art_name not in self.art_events or self.rnd.random() < 0.5:
+                continue
+            sent_at = self.now - timedelta(days=self.rnd.randint(0, self.shape.days))
+            for event_id, event_date in self.art_events[art_name]:
+                if event_date >= sql_date(sent_at):
+                    sentarts.append(
+                        (user_id, event_id, art_name, sql_timestamp(sent_at))
+                    )
+            sent_names.append(art_name)
+        return sentarts, sent_names
+
+
+def make_artnames(
+    rnd: random.Random, artists: Sequence[str], now: datetime
+) -> Iterator[Tuple]:
+    """
+    Generate artnames rows: most artists are checked at some time, with growing delay
+    to next check for unchanged ones (see wsql_artcheck()).
+    """
+    for art_name in artists:
+        if rnd.random() < 0.1:
+            yield (art_name, None, None, None, 0)
+            continue
+        unchanged = rnd.randint(0, 4)
+        delay = min(
+            cfg.DAYS_MIN_DELAY_ARTCHECK * 2**unchanged, cfg.DAYS_MAX_DELAY_ARTCHECK
+        )
+        checked = now - timedelta(hours=rnd.randint(0, delay * 24))
+        yield (
+            art_name,
+            sql_timestamp(checked),
+            hashlib.sha1(art_name.encode()).hexdigest(),
+            sql_timestamp(checked + timedelta(days=delay)),
+            unchanged,
+        )
+
+
+def count_rows(con: sqlite3.Connection) -> Dict[str, int]:
+    """
+    Returns:
+        {table: rows quantity}
+    """
+    tables = [
+        row[0]
+        for row in con.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' "
+            "AND name NOT LIKE 'sqlite_%' ORDER BY name"
+        )
+    ]
+    return {
+        table: con.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+        for table in tables
+    }
+
+
+def fill_db(db_path: str, shape: Shape, seed: int = 0) -> Dict[str, int]:
+    """
+    Fill empty database with generated data in one transaction. Rows are written
+    with executemany() directly, not with Db methods, which would take hours at
+    large sizes.
+    Args:
+        db_path: path to database created by Db()
+        shape: size and shape of data
+        seed: random seed
+    Returns:
+        {table: rows quantity}
+    """
+    rnd = random.Random(seed)
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    artists = make_artists(shape.artists)
+    events, lineups, art_events = make_events(shape.touring, rnd, artists, now)
+    maker = UserMaker(shape, rnd, artists, art_events, now)
+    con = sqlite3.connect(db_path)
+    try:
+        con.execute('PRAGMA synchronous = OFF')
+        con.executemany(
+            'INSERT INTO artnames VALUES (?,?,?,?,?)', make_artnames(rnd, artists, now)
+        )
+        con.executemany('INSERT INTO events VALUES (?,?,?,?,?,?,?)', events)
+        con.executemany('INSERT INTO lineups VALUES (?,?)', lineups)
+        for user_id in range(1, shape.users + 1):
+            for table, rows in maker.make_user(user_id).items():
+                if rows:
+                    marks = ','.join('?' * len(rows[0]))
+                    con.executemany(f'INSERT INTO {table} VALUES ({marks})', rows)
+        #  Few messages waiting in outbox, like after Tg flood control
+        con.executemany(
+            'INSERT INTO outbox (chat_id, text, parse_mode, created_datetime) '
+            'VALUES (?,?,?,DATETIME("now"))',
+            [
+                (user_id, f'News {user_id}', 'HTML')
+                for user_id in range(1, shape.users, 10)
+            ],
+        )
+        con.commit()
+        con.execute('ANALYZE')
+        return count_rows(con)
+    finally:
+        con.close()
+
+
+def add_shape_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    Add arguments for Shape fields, except users, and random seed to parser.
+    """
+    shape = Shape()
+    parser.add_argument(
+        '--artists', type=int, default=shape.artists, help='quantity of artists'
+    )
+    parser.add_argument(
+        '--days', type=int, default=shape.days, help='days of scrobbles history'
+    )
+    parser.add_argument(
+        '--library', type=int, default=shape.library, help='artists in user library'
+    )
+    parser.add_argument(
+        '--daily', type=int, default=shape.daily, help='mean artists listened a day'
+    )
+    parser.add_argument(
+        '--zipf', type=float, default=shape.zipf, help='exponent of artist popularity'
+    )
+    parser.add_argument(
+        '--touring',
+        type=float,
+        default=shape.touring.share,
+        help='share of artists having events',
+    )
+    parser.add_argument(
+        '--events',
+        type=int,
+        default=shape.touring.events,
+        help='mean events of touring artist',
+    )
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+
+
+def shape_from_args(args: argparse.Namespace, users: int) -> Shape:
+    """
+    Returns Shape for users quantity with the rest of fields from args.
+    """
+    return Shape(
+        users=users,
+        artists=args.artists,
+        days=args.days,
+        library=args.library,
+        daily=args.daily,
+        zipf=args.zipf,
+        touring=Touring(share=args.touring, events=args.events),
+    )
+
+
+def main() -> None:
+    """
+    Parse arguments, create db in temporary directory and fill it.
+    """
+    # pylint: disable=import-outside-toplevel
+    from db.db_service import Db
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=1000, help='bot users')
+    add_shape_arguments(parser)
+    args = parser.parse_args()
+    setup_i18n_and_logs()
+    db = Db(initial=True)
+    start = time.perf_counter()
+    counts = fill_db(db.db_path, shape_from_args(args, args.users), args.seed)
+    print(f'Generated in {time.perf_counter() - start:.1f} s: {db.db_path}')
+    for table, qty in counts.items():
+        print(f'  {table:14} {qty:10}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,275 @@
+# Green Grass Bot — Ties the music you're listening to with the concert it's playing at.
+# Copyright (C) 2021-2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""This file contains load test of news preparation against fake last.fm server. The
+server answers getrecenttracks with generated XML and /+events with generated HTML,
+with given latency. Synthetic users are created in temporary db, then daily jobs
+(getgigs_job) run for all of them, then news preparation (prepare_gigs_chunks) once
+more. Runs offline.
+Run from project root: python -m benchmarks.lastfm_load --users 1000"""
+
+import argparse
+import asyncio
+import statistics
+import threading
+import time
+import zlib
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Dict, List, Tuple
+from urllib.parse import parse_qs, unquote, urlparse
+
+import i18n
+from telegram.ext import Job
+
+import config as cfg
+from benchmarks.page_factory import (
+    make_artists,
+    make_events_html,
+    make_recenttracks_xml,
+)
+from benchmarks.sandbox import setup_i18n_and_logs, setup_sandbox
+
+TMP_DIR = setup_sandbox('lastfm_load')
+cfg.DB_PROFILING = True
+cfg.MS_SLOW_QUERY = 10**9
+cfg.SEND_QUEUE = False
+
+# pylint: disable=wrong-import-position
+from commands.getgigs import getgigs_job
+from db.db_service import Db
+from services.custom_classes import BotUser
+from services.query_stats_service import query_stats
+from ui.news_builders import prepare_gigs_chunks
+
+#  Different scrobble pages generated, users share them by user_id % PAGE_VARIANTS.
+PAGE_VARIANTS = 16
+
+
+class FakeLastfm:
+    """
+    Fake last.fm: pages are generated once and kept, requests are counted.
+    """
+
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.args = args
+        self.artists = make_artists(args.artists)
+        self.pages: Dict[Tuple, bytes] = {}
+        self.requests: Dict[str, int] = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def answer(self, url: str) -> Tuple[int, bytes]:
+        """
+        Returns status and body for requested url.
+        """
+        parsed = urlparse(url)
+        if parsed.path.endswith('/+events'):
+            art_name = unquote(parsed.path.split('/')[-2]).replace('+', ' ')
+            key: Tuple = ('events', art_name)
+            endpoint = 'events'
+        else:
+            query = parse_qs(parsed.query)
+            user = query.get('user', [''])[0]
+            page = int(query.get('page', ['1'])[0])
+            key = ('tracks', zlib.crc32(user.encode()) % PAGE_VARIANTS, page)
+            endpoint = 'getrecenttracks'
+        with self.lock:
+            self.requests[endpoint] += 1
+            body = self.pages.get(key)
+        if body is None:
+            if endpoint == 'events':
+                body = make_events_html(key[1], self.args.events).encode()
+            else:
+                body = make_recenttracks_xml(
+                    self.artists,
+                    key[2],
+                    self.args.pages,
+                    qty=cfg.QTY_SCROBBLES_XML,
+                    seed=key[1],
+                ).encode()
+            with self.lock:
+                self.pages[key] = body
+        return 200, body
+
+    def start(self) -> int:
+        """
+        Start server in background thread.
+        Returns:
+            port
+        """
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            """
+            Answers with pages of fake last.fm after latency, without logging.
+            """
+
+            def do_GET(self) -> None:  # pylint: disable=invalid-name
+                """
+                Answer GET request.
+                """
+                time.sleep(fake.args.latency / 1000)
+                status, body = fake.answer(self.path)
+                self.send_response(status)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args) -> None:
+                pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server.server_address[1]
+
+
+def point_urls_to(port: int) -> None:
+    """
+    Replace last.fm urls in technical translations with fake server ones.
+    """
+    locale = cfg.LOCALE_TECHNICAL_STORE
+    #  Load translations file first, otherwise it overwrites added keys later
+    i18n.t('parse_services.getrecenttracks', locale=locale)
+    i18n.add_translation(
+        'parse_services.getrecenttracks',
+        f'http://127.0.0.1:{port}/2.0/?method=user.getrecenttracks&limit=%{{limit}}'
+        '&user=%{lfm_noalarm}&page=%{page}&from=%{from_unix}&api_key=%{api_key}',
+        locale=locale,
+    )
+    i18n.add_translation(
+        'parse_services.lastfmeventurl',
+        f'http://127.0.0.1:{port}/music/%{{artist}}/+events',
+        locale=locale,
+    )
+
+
+async def create_users(db: Db, qty: int) -> List[int]:
+    """
+    Save users with default settings and one lfm account each.
+    Returns:
+        user_ids
+    """
+    user_ids = list(range(1, qty + 1))
+    for user_id in user_ids:
+        user = BotUser(user_id, f'user{user_id}', 'Fake', '', cfg.LOCALE_DEFAULT)
+        await db.wsql_users(user)
+        await db.wsql_settings(user_id=user_id)
+        await db.wsql_useraccs(user_id, f'lfm{user_id}')
+    return user_ids
+
+
+async def run_phase(name: str, user_ids: List[int], run_one, fake: FakeLastfm) -> None:
+    """
+    Run run_one(user_id) for all users concurrently and print statistics.
+    """
+    requests_before = dict(fake.requests)
+    db_before = sum(stats.total for stats in query_stats.statements.values())
+    latencies: List[float] = []
+
+    async def timed(user_id: int) -> None:
+        start = time.perf_counter()
+        await run_one(user_id)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(timed(user_id) for user_id in user_ids))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    db_time = sum(stats.total for stats in query_stats.statements.values()) - db_before
+    requests = {
+        endpoint: qty - requests_before.get(endpoint, 0)
+        for endpoint, qty in fake.requests.items()
+    }
+    print(
+        f'{name:8}: {len(user_ids)} users in {elapsed:.1f} s, '
+        f'{len(user_ids) / elapsed:.1f} users/s, latency with queue s '
+        f'p50 {latencies[len(latencies) // 2]:.2f}, '
+        f'p99 {latencies[int(len(latencies) * 0.99)]:.2f}, '
+        f'mean {statistics.mean(latencies):.2f}; db {db_time:.2f} s; '
+        f'requests {requests}'
+    )
+
+
+async def bench(args: argparse.Namespace) -> None:
+    """
+    Start fake server, create users and run both phases.
+    """
+    fake = FakeLastfm(args)
+    point_urls_to(fake.start())
+    db = Db(initial=True)
+    user_ids = await create_users(db, args.users)
+    sent = 0
+
+    async def send_message(*_args, **_kwargs) -> None:
+        nonlocal sent
+        sent += 1
+
+    #  Bot which only counts sent messages
+    bot = SimpleNamespace(send_message=send_message)
+
+    async def job(user_id: int) -> None:
+        context = SimpleNamespace(
+            bot=bot, job=Job(getgigs_job, chat_id=user_id, user_id=user_id)
+        )
+        await getgigs_job(context)
+
+    #  Same concurrency as jobs have
+    semaphore = asyncio.Semaphore(cfg.MAX_CONCURRENT_CONN_ATJOB)
+
+    async def prepare(user_id: int) -> None:
+        async with semaphore:
+            async for _ in prepare_gigs_chunks(user_id, request=False):
+                pass
+
+    await run_phase('job', user_ids, job, fake)
+    await run_phase('prepare', user_ids, prepare, fake)
+    print(f'Messages sent by jobs: {sent}. Slowest statements by total time:')
+    by_total = sorted(query_stats.statements.values(), key=lambda s: -s.total)
+    for stats in by_total[: args.top]:
+        print(
+            f'  {stats.name:28} {stats.total:7.2f} s, {stats.calls:7} calls, '
+            f'mean {stats.mean * 1000:6.2f} ms: {stats.sql[:40]}'
+        )
+
+
+def main() -> None:
+    """
+    Parse arguments and run benchmark.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=200, help='synthetic users')
+    parser.add_argument('--pages', type=int, default=2, help='XML pages per user')
+    parser.add_argument('--artists', type=int, default=2000, help='artists in XML')
+    parser.add_argument('--events', type=int, default=20, help='events per artist')
+    parser.add_argument('--latency', type=float, default=50, help='server ms')
+    parser.add_argument(
+        '--sleep', action='store_true', help='keep SECONDS_SLEEP_* pauses'
+    )
+    parser.add_argument('--top', type=int, default=8, help='statements to show')
+    args = parser.parse_args()
+    if not args.sleep:
+        cfg.SECONDS_SLEEP_XMLLOAD = 0
+        cfg.SECONDS_SLEEP_HTMLLOAD = 0
+    setup_i18n_and_logs()
+    print(
+        f'{args.users} users, {args.pages} XML pages each, {args.artists} artists, '
+        f'{args.events} events per artist, {args.latency} ms latency, '
+        f'{cfg.MAX_CONCURRENT_CONN_ATJOB} concurrent jobs, db in {TMP_DIR}'
+    )
+    asyncio.run(bench(args))
+
+
+if __name__ == '__main__':
+    main()
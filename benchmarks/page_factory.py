@@ -0,0 +1,102 @@
+# Green Grass Bot — Ties the music you're listening to with the concert it's playing at.
+# Copyright (C) 2021-2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""This file contains generators of synthetic last.fm pages: getrecenttracks XML and
+artist's /+events HTML, in the shape parsers.py expects."""
+
+import html
+import random
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+#  Scrobbles of recenttracks pages are spread over this many last days.
+DAYS_SCROBBLED = 4
+
+
+def make_artists(qty: int) -> List[str]:
+    """
+    Generate artist names, some with characters needing escaping.
+    """
+    return [f'Artist {i:05d}' if i % 7 else f'Art & "Band" {i:05d}' for i in range(qty)]
+
+
+def make_recenttracks_xml(
+    artists: List[str],
+    page: int,
+    total_pages: int,
+    qty: int = 200,
+    seed: int = 0,
+) -> str:
+    """
+    Generate one page of user.getrecenttracks answer.
+    Args:
+        artists: artist names to choose from, first ones more often (Zipf-like)
+        page: page number
+        total_pages: totalPages attribute
+        qty: tracks on page
+        seed: random seed, same seed gives same page
+    """
+    rnd = random.Random(seed * 100_003 + page)
+    now = datetime.now(timezone.utc)
+    weights = [1 / (rank + 1) for rank in range(len(artists))]
+    chosen = rnd.choices(artists, weights=weights, k=qty)
+    lines = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        '<lfm status="ok">',
+        f'<recenttracks user="fake" page="{page}" perPage="{qty}" '
+        f'totalPages="{total_pages}" total="{qty * total_pages}">',
+    ]
+    for i, artist in enumerate(chosen):
+        moment = now - timedelta(seconds=rnd.randint(0, DAYS_SCROBBLED * 86400 - 1))
+        nowplaying = ' nowplaying="true"' if page == 1 and i == 0 else ''
+        lines.append(
+            f'<track{nowplaying}><artist mbid="">{html.escape(artist)}</artist>'
+            f'<name>Track {i}</name>'
+            f'<date uts="{int(moment.timestamp())}">'
+            f'{moment.strftime("%d %b %Y, %H:%M")}</date></track>'
+        )
+    lines += ['</recenttracks>', '</lfm>']
+    return '\n'.join(lines)
+
+
+def make_events_html(art_name: str, qty: int, seed: int = 0) -> str:
+    """
+    Generate artist's /+events page with qty future events.
+    Args:
+        art_name: artist name
+        qty: events quantity
+        seed: random seed, same seed gives same page
+    """
+    rnd = random.Random(f'{art_name}{seed}')
+    today = datetime.now(timezone.utc).date()
+    lines = [
+        '<html><body>',
+        f'<h1 class="header-new-title" itemprop="name">{html.escape(art_name)}</h1>',
+        '<table>',
+    ]
+    for i in range(qty):
+        day = today + timedelta(days=rnd.randint(1, 365))
+        lines += [
+            '<tr>',
+            f'<td class="events-list-item-date" itemprop="startDate" '
+            f'content="{day.isoformat()}T20:00">{day.isoformat()}</td>',
+            '<div class="events-list-item-venue--title">',
+            f'    Venue {i} &amp; Hall',
+            '</div>',
+            '<div class="events-list-item-venue--address">',
+            f'    City {rnd.randint(1, 50)}, Country {rnd.randint(1, 20)}',
+            '</div>',
+            '</tr>',
+        ]
+    lines += ['</table>', '</body></html>']
+    return '\n'.join(lines)
@@ -0,0 +1,127 @@
+# Green Grass Bot — Ties the music you're listening to with the concert it's playing at.
+# Copyright (C) 2021-2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""This file contains benchmark of event loop responsiveness while bulk daily run
+parses pages, with cfg.PARSE_IN_PROCESSES off and on. Probe task plays role of update
+handler: it asks to wake up every few ms, and its lateness is handler response delay.
+Run from project root: python -m benchmarks.parse_offload_bench"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from typing import List
+
+import config as cfg
+from benchmarks.page_factory import (
+    make_artists,
+    make_events_html,
+    make_recenttracks_xml,
+)
+from benchmarks.sandbox import setup_i18n_and_logs, setup_sandbox
+
+setup_sandbox('parse_offload')
+
+# pylint: disable=wrong-import-position
+from services.parse_services import parse_pool, run_parser
+from services.parsers import parse_events_page, parse_scrobbles_page
+
+#  Wake up period of probe task.
+SEC_PROBE_PERIOD = 0.005
+
+
+async def user_job(xml_pages: List[str], html_pages: List[str]) -> int:
+    """
+    Parse like one user's daily job does: all scrobble pages, then event pages.
+    Returns:
+        quantity of parsed events, for control
+    """
+    events_qty = 0
+    for xml in xml_pages:
+        await asyncio.sleep(0)
+        await run_parser(parse_scrobbles_page, xml)
+    for page in html_pages:
+        await asyncio.sleep(0)
+        events_qty += len(await run_parser(parse_events_page, page))
+    return events_qty
+
+
+async def probe(lags: List[float], stop: asyncio.Event) -> None:
+    """
+    Measure how late event loop wakes the task up.
+    """
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(SEC_PROBE_PERIOD)
+        lags.append(time.perf_counter() - start - SEC_PROBE_PERIOD)
+
+
+async def bulk_run(args: argparse.Namespace, in_processes: bool) -> None:
+    """
+    Run all users' jobs concurrently with probe and print statistics.
+    """
+    cfg.PARSE_IN_PROCESSES = in_processes
+    artists = make_artists(args.artists)
+    xml_pages = [
+        make_recenttracks_xml(artists, page, args.pages, seed=1)
+        for page in range(1, args.pages + 1)
+    ]
+    html_pages = [make_events_html(art, args.events) for art in artists[: args.arts]]
+    if in_processes:
+        parse_pool.start()
+        #  Warm up pool, not to count processes start
+        await run_parser(parse_events_page, html_pages[0])
+
+    lags: List[float] = []
+    stop = asyncio.Event()
+    probe_task = asyncio.create_task(probe(lags, stop))
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *(user_job(xml_pages, html_pages) for _ in range(args.users))
+    )
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await probe_task
+    assert len(set(results)) == 1
+    lags.sort()
+    print(
+        f'PARSE_IN_PROCESSES={in_processes!s:5}: run {elapsed:6.2f} s, '
+        f'handler delay ms p50 {lags[len(lags) // 2] * 1000:6.1f}, '
+        f'p99 {lags[int(len(lags) * 0.99)] * 1000:6.1f}, '
+        f'max {lags[-1] * 1000:6.1f}, mean {statistics.mean(lags) * 1000:6.1f}'
+    )
+    parse_pool.stop()
+
+
+def main() -> None:
+    """
+    Parse arguments and run benchmark in both modes.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=4, help='concurrent user jobs')
+    parser.add_argument('--pages', type=int, default=20, help='XML pages per user')
+    parser.add_argument('--artists', type=int, default=500, help='artists in XML')
+    parser.add_argument('--arts', type=int, default=20, help='event pages per user')
+    parser.add_argument('--events', type=int, default=50, help='events per page')
+    args = parser.parse_args()
+    setup_i18n_and_logs()
+    print(
+        f'{args.users} users x ({args.pages} XML pages + {args.arts} event pages), '
+        f'{cfg.MAX_PARSE_PROCESSES} parsing processes'
+    )
+    asyncio.run(bulk_run(args, in_processes=False))
+    asyncio.run(bulk_run(args, in_processes=True))
+
+
+if __name__ == '__main__':
+    main()
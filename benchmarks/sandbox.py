@@ -0,0 +1,61 @@
+# Green Grass Bot — Ties the music you're listening to with the concert it's playing at.
+# Copyright (C) 2021-2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""This file contains sandbox setup for benchmarks: temporary db and log files, fake
+tokens, i18n. setup_sandbox() should be called before importing bot modules, because
+they create Db() and logger at import."""
+
+import logging
+import os
+import shutil
+import tempfile
+
+import config as cfg
+
+
+def setup_sandbox(prefix: str) -> str:
+    """
+    Redirect db and log files to new temporary directory and set fake tokens.
+    Args:
+        prefix: prefix of temporary directory name
+    Returns:
+        path to temporary directory
+    """
+    tmp_dir = tempfile.mkdtemp(prefix=f'ggb_{prefix}_')
+    shutil.copy(os.path.join(cfg.PATH_DBFILES, cfg.FILE_DB_SCRIPT), tmp_dir)
+    cfg.PATH_DBFILES = tmp_dir
+    cfg.PATH_LOGGER = tmp_dir
+    os.environ.setdefault('API_KEY', 'fake_api_key')
+    os.environ['BOT_TOKEN'] = '123456:FAKE_TOKEN_FOR_BENCHMARKS'
+    return tmp_dir
+
+
+def setup_i18n_and_logs(console_level: int = logging.WARNING) -> None:
+    """
+    Set up i18n like main.py does and make console logging quiet. Call after bot
+    modules imported.
+    Args:
+        console_level: level for bot log handlers
+    """
+    # pylint: disable=import-outside-toplevel
+    import i18n
+
+    from services.logger import logger
+
+    i18n.load_path.append(cfg.PATH_TRANSLATIONS)
+    #  Default format is yml when PyYAML is installed, translations are json
+    i18n.set('file_format', 'json')
+    i18n.set('filename_format', cfg.FILENAME_FORMAT_I18N)
+    i18n.set('locale', cfg.LOCALE_DEFAULT)
+    for handler in logger.handlers:
+        handler.setLevel(console_level)
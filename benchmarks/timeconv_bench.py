@@ -0,0 +1,97 @@
+# Green Grass Bot — Ties the music you're listening to with the concert it's playing at.
+# Copyright (C) 2021-2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""This file contains benchmark of cached date convertors from timeconv_service.py.
+Run from project root: python -m benchmarks.timeconv_bench"""
+
+import timeit
+from datetime import date, timedelta
+from typing import Callable, List
+
+from benchmarks.sandbox import setup_sandbox
+
+TMP_DIR = setup_sandbox('timeconv_bench')
+
+# pylint: disable=wrong-import-position
+from services.timeconv_service import (
+    FORMAT_LFM,
+    FORMAT_SQL_DATE,
+    lfmdate_to_text,
+    text_to_date,
+    text_to_userdate,
+)
+
+#  Rows to convert in one run: like a user with 100 XML pages of 200 scrobbles.
+QTY_ROWS = 20000
+
+#  Distinct days among rows, i.e. DAYS_INITIAL_TIMEDELAY-like window plus events.
+QTY_DAYS = 120
+
+#  How many runs to take the best time from.
+QTY_REPEATS = 5
+
+
+def make_rows(date_format: str) -> List[str]:
+    """
+    Generate rows of date strings, repeating within QTY_DAYS days.
+    Args:
+        date_format: format of generated strings
+    """
+    start = date(2023, 1, 1)
+    return [
+        (start + timedelta(days=i % QTY_DAYS)).strftime(date_format)
+        for i in range(QTY_ROWS)
+    ]
+
+
+def bench(convertor: Callable, rows: List[str]) -> float:
+    """
+    Time convertor over all rows, both uncached (__wrapped__) and cached. Also check
+    that results are identical.
+    Args:
+        convertor: lru_cache-wrapped function from timeconv_service.py
+        rows: strings to convert
+    Returns:
+        speedup ratio
+    """
+    plain = convertor.__wrapped__
+    assert [plain(row) for row in rows] == [convertor(row) for row in rows]
+    convertor.cache_clear()
+    sec_plain = min(
+        timeit.repeat(lambda: [plain(r) for r in rows], number=1, repeat=QTY_REPEATS)
+    )
+    sec_cached = min(
+        timeit.repeat(
+            lambda: [convertor(r) for r in rows], number=1, repeat=QTY_REPEATS
+        )
+    )
+    ratio = sec_plain / sec_cached
+    print(
+        f'{convertor.__name__:>18}: strptime {sec_plain*1000:8.2f} ms, '
+        f'cached {sec_cached*1000:8.2f} ms, x{ratio:.1f}, {convertor.cache_info()}'
+    )
+    return ratio
+
+
+def main() -> None:
+    """
+    Run all the convertors benchmarks.
+    """
+    print(f'{QTY_ROWS} rows, {QTY_DAYS} distinct dates, best of {QTY_REPEATS}')
+    bench(lfmdate_to_text, make_rows(FORMAT_LFM))
+    bench(text_to_userdate, make_rows(FORMAT_SQL_DATE))
+    bench(text_to_date, make_rows(FORMAT_SQL_DATE))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,288 @@
+# Green Grass Bot — Ties the music you're listening to with the concert it's playing at.
+# Copyright (C) 2021-2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""This file contains load-test harness for webhook mode. It starts fake Tg Bot API
+server, the bot with webhook listener, and replays updates against webhook. Updates
+are read from JSONL file (one Tg Update JSON per line, as Tg sends them) or generated
+as /help commands. Runs offline with temporary db.
+Run from project root: python -m benchmarks.webhook_load --qty 2000 --users 200"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+from collections import defaultdict, deque
+from typing import Deque, Dict, List, Tuple
+
+import httpx
+import tornado.web
+from telegram import Update
+from telegram.ext import Application
+
+import config as cfg
+from benchmarks.sandbox import setup_i18n_and_logs, setup_sandbox
+
+TMP_DIR = setup_sandbox('webhook_load')
+
+# pylint: disable=wrong-import-position
+from db.db_service import Db
+from interactions.loader import load_interactions
+
+SECRET_TOKEN = 'load_test_secret'
+
+
+class FakeTelegram:
+    """
+    Minimal Tg Bot API: answers any method with success and records arrival time of
+    every sendMessage for each chat.
+    """
+
+    def __init__(self) -> None:
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.sent: Dict[int, Deque[float]] = defaultdict(deque)
+        self.message_id = 0
+
+    def answer(self, method: str, params: Dict) -> object:
+        """
+        Returns 'result' field for Bot API method.
+        """
+        self.calls[method] += 1
+        if method == 'getMe':
+            return {
+                'id': 123456,
+                'is_bot': True,
+                'first_name': 'Fake',
+                'username': 'fake_ggb_bot',
+            }
+        if method in ('sendMessage', 'editMessageText'):
+            chat_id = int(params.get('chat_id', 0))
+            self.sent[chat_id].append(time.perf_counter())
+            self.message_id += 1
+            return {
+                'message_id': self.message_id,
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'},
+                'text': params.get('text', ''),
+            }
+        return True
+
+    def replies(self) -> int:
+        """
+        Returns quantity of messages sent and edited.
+        """
+        return sum(len(moments) for moments in self.sent.values())
+
+
+def make_fake_app(fake: FakeTelegram) -> tornado.web.Application:
+    """
+    Wraps FakeTelegram into tornado application with /bot<token>/<method> route.
+    """
+
+    class MethodHandler(tornado.web.RequestHandler):
+        """Handler for all Bot API methods."""
+
+        async def post(self, method: str) -> None:
+            """Form or JSON encoded request, like PTB sends."""
+            if self.request.headers.get('Content-Type', '').startswith(
+                'application/json'
+            ):
+                params = json.loads(self.request.body or b'{}')
+            else:
+                params = {
+                    key: self.get_body_argument(key)
+                    for key in self.request.body_arguments
+                }
+            result = fake.answer(method, params)
+            self.write({'ok': True, 'result': result})
+
+        get = post
+
+        def data_received(self, chunk: bytes) -> None:
+            """Not called: body is not streamed."""
+
+    return tornado.web.Application([(r'/bot[^/]+/(\w+)', MethodHandler)])
+
+
+def generate_updates(qty: int, users: int) -> List[Dict]:
+    """
+    Generates /help command updates from several users, in round robin.
+    """
+    updates = []
+    for update_id in range(1, qty + 1):
+        user_id = 10_000 + update_id % users
+        updates.append(
+            {
+                'update_id': update_id,
+                'message': {
+                    'message_id': update_id,
+                    'date': int(time.time()),
+                    'chat': {'id': user_id, 'type': 'private'},
+                    'from': {'id': user_id, 'is_bot': False, 'first_name': 'Load'},
+                    'text': '/help',
+                    'entities': [{'type': 'bot_command', 'offset': 0, 'length': 5}],
+                },
+            }
+        )
+    return updates
+
+
+def read_updates(filename: str) -> List[Dict]:
+    """
+    Reads recorded updates, one JSON per line.
+    """
+    with open(filename, 'r', encoding='utf-8') as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def chat_of(update: Dict) -> int:
+    """
+    Returns chat_id of update's message, or 0.
+    """
+    return int(update.get('message', {}).get('chat', {}).get('id', 0))
+
+
+def percentile(values: List[float], share: float) -> float:
+    """
+    Returns percentile of values, share in [0, 1].
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(share * len(ordered)))]
+
+
+def reply_latencies(posted: Dict[int, Deque[float]], fake: FakeTelegram) -> List[float]:
+    """
+    Returns latencies from posting update to reply in the same chat, in order.
+    """
+    latencies = []
+    for chat_id, moments in posted.items():
+        for posted_at, sent_at in zip(moments, fake.sent.get(chat_id, [])):
+            latencies.append(sent_at - posted_at)
+    return latencies
+
+
+async def post_updates(
+    args: argparse.Namespace, updates: List[Dict], webhook_url: str, fake: FakeTelegram
+) -> Tuple[Dict[int, Deque[float]], List[float], float, float]:
+    """
+    Posts updates to webhook concurrently and waits for replies.
+    Returns:
+        {chat_id: posting moments}, webhook POST latencies, seconds of posting and
+        seconds until all replies or timeout
+    """
+    posted: Dict[int, Deque[float]] = defaultdict(deque)
+    post_latencies: List[float] = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+    async with httpx.AsyncClient(timeout=30) as client:
+
+        async def post(update: Dict) -> None:
+            async with semaphore:
+                moment = time.perf_counter()
+                posted[chat_of(update)].append(moment)
+                response = await client.post(
+                    webhook_url,
+                    json=update,
+                    headers={'X-Telegram-Bot-Api-Secret-Token': SECRET_TOKEN},
+                )
+                post_latencies.append(time.perf_counter() - moment)
+                assert response.status_code == 200, response.status_code
+
+        start = time.perf_counter()
+        await asyncio.gather(*(post(update) for update in updates))
+        posting_sec = time.perf_counter() - start
+        deadline = time.perf_counter() + args.wait
+        while fake.replies() < len(updates) and time.perf_counter() < deadline:
+            await asyncio.sleep(0.05)
+    return posted, post_latencies, posting_sec, time.perf_counter() - start
+
+
+async def replay(args: argparse.Namespace, updates: List[Dict]) -> None:
+    """
+    Starts fake Tg, bot with webhook, posts updates and prints statistics.
+    """
+    fake = FakeTelegram()
+    fake_server = make_fake_app(fake).listen(args.fake_port, address='127.0.0.1')
+
+    application = (
+        Application.builder()
+        .token(os.environ['BOT_TOKEN'])
+        .base_url(f'http://127.0.0.1:{args.fake_port}/bot')
+        .build()
+    )
+    load_interactions(application)
+    webhook_url = f'http://127.0.0.1:{args.webhook_port}/{cfg.WEBHOOK_PATH}'
+
+    async with application:
+        await application.start()
+        assert application.updater
+        await application.updater.start_webhook(
+            listen='127.0.0.1',
+            port=args.webhook_port,
+            url_path=cfg.WEBHOOK_PATH,
+            webhook_url=webhook_url,
+            secret_token=SECRET_TOKEN,
+            max_connections=cfg.WEBHOOK_MAX_CONNECTIONS,
+            allowed_updates=[Update.MESSAGE],
+        )
+        posted, post_latencies, posting_sec, total_sec = await post_updates(
+            args, updates, webhook_url, fake
+        )
+        await application.updater.stop()
+        await application.stop()
+    fake_server.stop()
+
+    replies = fake.replies()
+    print(f'Updates posted: {len(updates)} in {posting_sec:.2f} s')
+    print(f'Replies received: {replies} in {total_sec:.2f} s')
+    print(f'Throughput: {replies / total_sec:.1f} replies/s')
+    for name, values in (
+        ('webhook POST', post_latencies),
+        ('reply', reply_latencies(posted, fake)),
+    ):
+        if values:
+            print(
+                f'{name:>12} latency ms: p50 {percentile(values, .5)*1000:.1f}, '
+                f'p99 {percentile(values, .99)*1000:.1f}, '
+                f'mean {statistics.mean(values)*1000:.1f}'
+            )
+    print(f'Bot API calls: {dict(fake.calls)}')
+
+
+def main() -> None:
+    """
+    Parse arguments and run load test.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--updates', help='JSONL file with recorded updates')
+    parser.add_argument('--qty', type=int, default=1000, help='updates to generate')
+    parser.add_argument('--users', type=int, default=100, help='users to generate')
+    parser.add_argument('--concurrency', type=int, default=40, help='parallel POSTs')
+    parser.add_argument('--wait', type=float, default=60, help='seconds for replies')
+    parser.add_argument('--webhook-port', type=int, default=18443)
+    parser.add_argument('--fake-port', type=int, default=18081)
+    args = parser.parse_args()
+
+    setup_i18n_and_logs()
+    Db(initial=True)
+
+    updates = read_updates(args.updates) if args.updates else None
+    updates = updates or generate_updates(args.qty, args.users)
+    print(f'Temporary files at: {TMP_DIR}')
+    asyncio.run(replay(args, updates))
+
+
+if __name__ == '__main__':
+    main()
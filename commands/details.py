@@ -20,7 +20,7 @@ from telegram.ext import CallbackContext
 
 from db.db_service import Db
 from services.logger import logger
-from services.message_service import reply, up_full
+from services.message_service import reply, split_text, up_full
 from ui.news_builders import prepare_details_text
 
 db = Db()
@@ -32,13 +32,14 @@ logger.setLevel(logging.DEBUG)
 async def details(update: Update, _context: CallbackContext) -> None:
     """
     Callback function. Sends detailed info about events of the artist, chosen by user
-    with command /xx, where xx called shorthand.
+    with command /xx, where xx called shorthand. Long details are sent page by page.
     Args:
         update, context: standart PTB callback signature
     """
     user_id, _, command, _ = up_full(update)
     shorthand = int(command[1:])
     text = await prepare_details_text(user_id, shorthand)
-    await reply(update, text, disable_web_page_preview=True)
+    for page in split_text(text):
+        await reply(update, page, disable_web_page_preview=True)
     logger.info('Details was sent to %s', user_id)
     return None
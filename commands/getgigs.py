@@ -15,16 +15,24 @@
 
 import asyncio
 import logging
+from functools import partial
+from typing import Awaitable, Callable, Dict, List, Set, Tuple
 
-from telegram import ReplyKeyboardRemove, Update
+from telegram import Message, ReplyKeyboardRemove, Update
+from telegram.constants import ParseMode
+from telegram.error import TelegramError
 from telegram.ext import CallbackContext, Job
 
 import config as cfg
 from db.db_service import Db
 from services.custom_classes import UserSettings
+from services.flight_service import SingleFlight
 from services.logger import logger
 from services.message_service import i34g, reply, send_message, up_full
-from ui.news_builders import prepare_gigs_text
+from services.metrics_service import acquire, gigs_job_seconds, tasks_running
+from services.progress_service import Progress
+from services.send_queue_service import send_queue
+from ui.news_builders import fetch_filter_acc, prepare_gigs_chunks
 
 db = Db()
 
@@ -34,15 +42,71 @@ logger.setLevel(logging.DEBUG)
 sem_atrequest = asyncio.Semaphore(cfg.MAX_CONCURRENT_CONN_ATREQUEST)
 sem_atjob = asyncio.Semaphore(cfg.MAX_CONCURRENT_CONN_ATJOB)
 
+#  News preparations by user_id, for /getgigs and daily jobs. Only one runs for user
+#  at a time, to not load the same twice and not to race on shorthands numbering.
+gigs_flights = SingleFlight('gigs')
+
+#  Background loads of just connected accounts, {user_id: tasks}.
+prefetch_tasks: Dict[int, Set[asyncio.Task]] = {}
+
+
+def start_prefetch(context: CallbackContext, user_id: int, acc: str) -> None:
+    """
+    Start loading scrobbles and events of just connected lfm account in background, so
+    first /getgigs mostly reads db instead of initial DAYS_INITIAL_TIMEDELAY load.
+    Args:
+        context: standart PTB callback context
+        user_id: Tg user_id field
+        acc: lastfm username
+    """
+    task = context.application.create_task(prefetch_acc(user_id, acc))
+    prefetch_tasks.setdefault(user_id, set()).add(task)
+    tasks_running.inc('prefetch')
+
+    def forget(done: asyncio.Task) -> None:
+        tasks_running.inc('prefetch', amount=-1)
+        user_tasks = prefetch_tasks.get(user_id, set())
+        user_tasks.discard(done)
+        if not user_tasks:
+            prefetch_tasks.pop(user_id, None)
+
+    task.add_done_callback(forget)
+
+
+async def prefetch_acc(user_id: int, acc: str) -> None:
+    """
+    Load and save scrobbles and events of one lfm account, nothing sent to user. Runs
+    under sem_atrequest, as /getgigs does: it is user's load, just started earlier.
+    """
+    async with acquire(sem_atrequest, 'atrequest'):
+        logger.info('Start prefetch for user_id %s, lfm %s', user_id, acc)
+        scrobbles_dict, filtered = await fetch_filter_acc(user_id, acc)
+    if isinstance(scrobbles_dict, int):
+        logger.info('Prefetch for %s got error %s', acc, scrobbles_dict)
+    else:
+        logger.info('Prefetch done for %s, %s artists to send', acc, len(filtered))
+    return None
+
+
+async def wait_prefetch(user_id: int) -> None:
+    """
+    Wait for user's background loads, if any, not to load the same twice. Errors of
+    loads are not raised: they will repeat at /getgigs and be shown to user there.
+    """
+    user_tasks = prefetch_tasks.get(user_id)
+    if user_tasks:
+        logger.info('Waiting prefetch for user_id %s', user_id)
+        await asyncio.gather(*user_tasks, return_exceptions=True)
+    return None
+
 
 async def getgigs(update: Update, context: CallbackContext) -> None:
     """
-    Callback function. Send list of artists with new concerts to user.
+    Callback function. Send list of artists with new concerts to user. While news are
+    prepared, "please wait" message shows progress, and at the end it is edited to
+    summary. Concurrent preparations for the same user are joined, see gigs_flight().
     Args:
         update, context: standart PTB callback signature
-    TODO avoid concurrent last.fm requests with context.application.create_task():
-    github.com/python-telegram-bot/python-telegram-bot/wiki/Concurrency
-    TODO self-edited "please wait" message
     """
     user_id, chat_id, _, _ = up_full(update)
     usersettings = await db.rsql_settings(user_id)
@@ -53,24 +117,168 @@ async def getgigs(update: Update, context: CallbackContext) -> None:
 
     assert isinstance(usersettings, UserSettings)
 
-    please_wait_text = await i34g('getgigs.pleasewait', user_id=user_id)
-    please_wait_msg = await send_message(context, chat_id, please_wait_text)
+    if (
+        cfg.GETGIGS_STALE_WHILE_REVALIDATE
+        and not gigs_flights.running(user_id)
+        and await db.rsql_sync_age(user_id) <= cfg.HOURS_MAX_GIGS_STALENESS
+    ):
+        await getgigs_stored(update, context)
+        return None
 
-    async with sem_atrequest:
-        logger.info('Start getgigs() for user_id %s', user_id)
-        text = await prepare_gigs_text(user_id, request=True)
+    #  No awaits between this check and gigs_flight(), otherwise daily job may start
+    #  in between, and this call would attach to it with progress never shown
+    if gigs_flights.running(user_id):
+        logger.info('Repeated getgigs() for user_id %s joined running one', user_id)
+        await reply(update, await i34g('getgigs.in_flight', user_id=user_id))
+        await join_gigs(context, user_id, chat_id)
+        return None
 
-    await context.bot.deleteMessage(
-        message_id=please_wait_msg.message_id, chat_id=chat_id
-    )
-    if text:
-        await reply(update, text, reply_markup=ReplyKeyboardRemove())
-        logger.info('Gigs sent to user %s', user_id)
+    async def deliver() -> List[str]:
+        please_wait_text = await i34g('getgigs.pleasewait', user_id=user_id)
+        please_wait_msg = await send_message(context, chat_id, please_wait_text)
+        report = partial(edit_progress, please_wait_msg, user_id)
+        progress = Progress(report)
+        chunks = []
+        await wait_prefetch(user_id)
+        async with acquire(sem_atrequest, 'atrequest'):
+            logger.info('Start getgigs() for user_id %s', user_id)
+            async for text in prepare_gigs_chunks(
+                user_id, request=True, progress=progress
+            ):
+                await reply(update, text, reply_markup=ReplyKeyboardRemove())
+                chunks.append(text)
+        await report(progress, done=True)
+        return chunks
+
+    sent_count = await gigs_flight(context, user_id, chat_id, deliver)
+
+    if sent_count:
+        logger.info('Gigs sent to user %s in %s messages', user_id, sent_count)
         return None
     logger.warning('Got empty gigs_text on request. Smth wrong with %s', user_id)
     return None
 
 
+async def gigs_flight(
+    context: CallbackContext,
+    user_id: int,
+    chat_id: int,
+    deliver: Callable[[], Awaitable[List[str]]],
+) -> int:
+    """
+    Run deliver() as the only news preparation of user, see gigs_flights. If another
+    one (i.e. daily job at /getgigs) is running, wait for it instead and send its
+    chunks to chat_id, if they were sent to other chat.
+    Args:
+        context: context with bot to send messages with
+        user_id: Tg user_id field
+        chat_id: chat to deliver news to
+        deliver: coroutine function, sends news to chat_id and returns sent chunks
+    Returns:
+        quantity of chunks
+    """
+
+    async def deliver_to_chat() -> Tuple[int, List[str]]:
+        return chat_id, await deliver()
+
+    (sent_chat_id, chunks), _ = await gigs_flights.run(user_id, deliver_to_chat)
+    if sent_chat_id != chat_id:
+        for text in chunks:
+            await send_message(context, chat_id, text)
+    return len(chunks)
+
+
+async def join_gigs(context: CallbackContext, user_id: int, chat_id: int) -> int:
+    """
+    Wait for running news preparation of user, if any, and send its chunks to chat_id,
+    if they were sent to other chat.
+    Returns:
+        quantity of chunks, 0 if nothing was running
+    """
+    joined = await gigs_flights.join(user_id)
+    if joined is None:
+        return 0
+    sent_chat_id, chunks = joined
+    if sent_chat_id != chat_id:
+        for text in chunks:
+            await send_message(context, chat_id, text)
+    return len(chunks)
+
+
+async def edit_progress(
+    message: Message, user_id: int, progress: Progress, done: bool = False
+) -> None:
+    """
+    Edit "please wait" message to show progress. Errors (i.e. message deleted by user
+    or not modified) are not important and only logged.
+    Args:
+        message: message to edit
+        user_id: Tg user_id field, for locale
+        progress: counters to show
+        done: if True, show final summary
+    """
+    text = await i34g(
+        'getgigs.progress_done' if done else 'getgigs.progress',
+        pages_loaded=progress.pages_loaded,
+        pages_total=progress.pages_total,
+        arts_checked=progress.arts_checked,
+        arts_total=progress.arts_total,
+        user_id=user_id,
+    )
+    try:
+        await message.edit_text(text, parse_mode=ParseMode.MARKDOWN_V2)
+    except TelegramError as e:
+        logger.debug('Progress message not edited: %s', e)
+    return None
+
+
+async def getgigs_stored(update: Update, context: CallbackContext) -> None:
+    """
+    Send news built from db at once, without "please wait" and sem_atrequest queue.
+    Then refresh accounts in background, see refresh_gigs().
+    Args:
+        update, context: standart PTB callback signature
+    """
+    user_id, chat_id, _, _ = up_full(update)
+    logger.info('Start getgigs() from db for user_id %s', user_id)
+
+    async def deliver() -> List[str]:
+        chunks = []
+        async for text in prepare_gigs_chunks(user_id, request=True, stored=True):
+            await reply(update, text, reply_markup=ReplyKeyboardRemove())
+            chunks.append(text)
+        return chunks
+
+    sent_count = await gigs_flight(context, user_id, chat_id, deliver)
+    logger.info('Stored gigs sent to user %s in %s messages', user_id, sent_count)
+    context.application.create_task(refresh_gigs(context, user_id, chat_id))
+    return None
+
+
+async def refresh_gigs(context: CallbackContext, user_id: int, chat_id: int) -> None:
+    """
+    Load fresh scrobbles and events after news from db were sent. Artists already sent
+    are filtered out by db, so follow-up message is sent only if new artists found.
+    Args:
+        context: standart PTB callback context
+        user_id: Tg user_id field
+        chat_id: Tg chat_id field
+    """
+
+    async def deliver() -> List[str]:
+        chunks = []
+        async with acquire(sem_atrequest, 'atrequest'):
+            logger.info('Start refresh after stored getgigs() for user_id %s', user_id)
+            async for text in prepare_gigs_chunks(user_id, request=False, quiet=True):
+                await send_message(context, chat_id, text)
+                chunks.append(text)
+        return chunks
+
+    sent_count = await gigs_flight(context, user_id, chat_id, deliver)
+    logger.info('Refresh done for %s, %s follow-up messages', user_id, sent_count)
+    return None
+
+
 async def getgigs_job(context: CallbackContext) -> None:
     """
     Callback function for job scheduler. Send list of artists with new concerts to user.
@@ -90,13 +298,42 @@ async def getgigs_job(context: CallbackContext) -> None:
     assert user_id
     assert chat_id
 
-    async with sem_atjob:
+    async with acquire(sem_atjob, 'atjob'):
+        await send_gigs(context, user_id, chat_id)
+    return None
+
+
+async def send_gigs(context: CallbackContext, user_id: int, chat_id: int) -> int:
+    """
+    Core of daily job: prepare news and send it to user. Does not take sem_atjob, caller
+    should do it. Used by getgigs_job() and by worker processes (worker_service.py).
+    Args:
+        context: context with bot to send messages with
+        user_id: Tg user_id field
+        chat_id: Tg chat_id field
+    Returns:
+        quantity of sent messages
+    """
+
+    async def deliver() -> List[str]:
+        chunks = []
+        await wait_prefetch(user_id)
         logger.info('Start getgigs_job() for user_id %s', user_id)
-        text = await prepare_gigs_text(user_id, request=False)
-    if text:
-        await send_message(context, chat_id, text)
-        logger.info('Job done, gigs sent to user %s', user_id)
-        return None
+        async for text in prepare_gigs_chunks(user_id, request=False):
+            if cfg.SEND_QUEUE:
+                await send_queue.put(chat_id, text)
+            else:
+                await send_message(context, chat_id, text)
+            chunks.append(text)
+        return chunks
+
+    with gigs_job_seconds.time():
+        sent_count = await gigs_flight(context, user_id, chat_id, deliver)
+    if sent_count:
+        logger.info(
+            'Job done, gigs sent to user %s in %s messages', user_id, sent_count
+        )
+        return sent_count
 
     logger.info('Got empty gigs text. Nothing to send to %s', user_id)
-    return None
+    return sent_count
@@ -68,6 +68,41 @@ SEC_READ_TIMEOUT = 30
 #  Max time to wait for a write operation to complete.
 SEC_WRITE_TIMEOUT = 30
 
+#  If True, daily news and error reports are sent through outbox table by one task of
+#  main.py process, respecting Tg flood limits (see send_queue_service.py). Messages
+#  not sent before restart are sent after it.
+SEND_QUEUE = True
+
+#  Max messages per second to all chats sent from outbox. Tg allows about 30.
+MSG_PER_SEC_GLOBAL = 25
+
+#  Min seconds between messages from outbox to one chat. Tg allows about 1 per second.
+SEC_PER_MSG_CHAT = 1.0
+
+#  Outbox messages read at one pass of send queue.
+QTY_OUTBOX_BATCH = 100
+
+#  Attempts to send outbox message on network errors before it is dropped.
+QTY_OUTBOX_ATTEMPTS = 5
+
+#  Max seconds between outbox checks, for messages put by worker processes.
+SEC_OUTBOX_POLL = 5
+
+#  If True, bot receives updates with webhook instead of long polling. WEBHOOK_URL
+#  should be set in '.env', and WEBHOOK_SECRET_TOKEN is recommended.
+WEBHOOK_MODE = False
+
+#  Local address and port for webhook listener (tornado server by PTB). Usually it is
+#  behind reverse proxy with TLS.
+WEBHOOK_LISTEN = '127.0.0.1'
+WEBHOOK_PORT = 8443
+
+#  Path part of webhook URL, i.e. https://example.com/<WEBHOOK_PATH>.
+WEBHOOK_PATH = 'ggb'
+
+#  Maximum simultaneous HTTPS connections Tg will open to webhook, 1-100.
+WEBHOOK_MAX_CONNECTIONS = 40
+
 #  Possible quantity of accounts at last.fm to keep.
 MAX_LFM_ACCOUNT_QTY = 3
 
@@ -75,9 +110,14 @@ MAX_LFM_ACCOUNT_QTY = 3
 #  only DAYS_INITIAL_TIMEDELAY <= DAYS_PERIOD_MINLISTENS make sense.
 DAYS_INITIAL_TIMEDELAY = 4
 
-#  Minimum delay to update info about artist's events.
+#  Minimum delay to update info about artist's events. Artist's delay doubles after
+#  each check with unchanged or empty events, up to DAYS_MAX_DELAY_ARTCHECK, and
+#  returns to minimum when new events found.
 DAYS_MIN_DELAY_ARTCHECK = 2
 
+#  Maximum delay to update info about artist's events.
+DAYS_MAX_DELAY_ARTCHECK = 32
+
 #  How many days consider for min_listens users's config, i.e. it is y in [x
 #  scrobbles in y days] condition, where x is DEFAULT_MIN_LISTENS.
 DAYS_PERIOD_MINLISTENS = 4
@@ -85,6 +125,36 @@ DAYS_PERIOD_MINLISTENS = 4
 # Settings for APScheduler when set daily jobs.
 CRON_JOB_KWARGS = {'misfire_grace_time': 3600 * 12, 'coalesce': True}
 
+#  Quantity of worker processes for daily jobs, see worker.py. Each worker runs jobs
+#  of users with user_id % WORKERS_QTY equal to its index. 0 means daily jobs run in
+#  main process JobQueue, as usual.
+WORKERS_QTY = 0
+
+#  How often worker checks jobs table for due jobs.
+SEC_WORKER_POLL = 60
+
+#  How long worker owns claimed job. After that, job can be claimed again, e.g. when
+#  worker died during job execution.
+SEC_JOB_LEASE = 3600
+
+#  How many days to keep history of job executions in joblease table.
+DAYS_KEEP_JOBLEASE = 7
+
+#  How many rendered /xx details messages to keep in memory. Same artist's details
+#  are shared among all users with same locale.
+QTY_CACHED_DETAILS = 256
+
+#  How many users' shorthand maps (/xx to artist) to keep in memory.
+QTY_CACHED_SHORTHAND_USERS = 1024
+
+#  How many results of last.fm account checks at /connect to keep in memory.
+QTY_CACHED_LFM_CHECKS = 1024
+
+#  Seconds to trust cached result of last.fm account check: valid account, and
+#  private (403) or not existing (404) account. Other errors are not cached.
+SEC_LFM_VALID_TTL = 3600
+SEC_LFM_INVALID_TTL = 600
+
 # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 # # # # # # # # # # #   LOGGER  # # # # # # # # # # # #
 # # # # # # # # # # # # # # # # # # # # # # # # # # # #
@@ -101,9 +171,34 @@ BYTES_MAX_ROTATING_LOGGER = 1024 * 1024 * 20
 #  Quantity of files, keeping by rotating logger.
 QTY_BACKUPS_ROTATING_LOGGER = 5
 
+#  Level of messages to write, for all loggers not listed in LOG_LEVELS.
+LOG_LEVEL = 'DEBUG'
+
+#  Levels by subsystem logger, overriding LOG_LEVEL for it and its descendants, i.e.
+#  {'A.par': 'INFO', 'A.db': 'WARNING', 'A.get': 'DEBUG'} with LOG_LEVEL = 'INFO'.
+LOG_LEVELS: dict = {}
+
+#  If True, messages are put to queue and written to console and file by separate
+#  thread, so event loop does not wait for disk.
+LOG_QUEUE = True
+
+#  If True, file log is written as JSON lines, one object per message.
+LOG_JSON = False
+
+#  If True, metrics (latencies, errors, queues, caches) are collected and exposed in
+#  Prometheus format at http://METRICS_HOST:METRICS_PORT/metrics. Worker with index i
+#  exposes its own metrics at METRICS_PORT + 1 + i.
+METRICS = False
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = 9108
+
 #  Developer contacts to inform about errors or new users.
 DEVELOPER_CHAT_ID = 144297913
 
+#  Min seconds between error digests sent to developer. Errors are counted by kind
+#  between digests, so error storm costs one message per period.
+SEC_ERROR_DIGEST = 300
+
 #  Whether bot should inform about new users.
 NEW_USER_ALARMING = True
 
@@ -123,6 +218,13 @@ FILE_DB = 'ggb_sqlite.db'
 #  Filename of db-creating script.
 FILE_DB_SCRIPT = 'ggb_sqlite.sql'
 
+#  If True, execute_query() counts time and rows of each statement, logs statements
+#  slower than MS_SLOW_QUERY with their query plan. Developer sees QTY_DBSTATS_TOP
+#  slowest statements with /dbstats.
+DB_PROFILING = False
+MS_SLOW_QUERY = 100
+QTY_DBSTATS_TOP = 10
+
 # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 # # # # # # # # # # #   PARSER  # # # # # # # # # # # #
 # # # # # # # # # # # # # # # # # # # # # # # # # # # #
@@ -142,6 +244,50 @@ MAX_CONCURRENT_CONN_ATREQUEST = 1
 #  How many concurrent connections (job executions) allowed for /getgigs_job.
 MAX_CONCURRENT_CONN_ATJOB = 1
 
+#  If True, XML and HTML pages are parsed in separate processes, not blocking event
+#  loop. Makes sense with several concurrent jobs, see benchmarks/parse_offload_bench.py
+PARSE_IN_PROCESSES = False
+
+#  Quantity of processes for parsing, if PARSE_IN_PROCESSES.
+MAX_PARSE_PROCESSES = 2
+
+#  If True, loaded pages and their parsed results are kept in FILE_HTTP_CACHE.
+HTTP_CACHE = True
+
+#  Filename of HTTP cache db, in PATH_DBFILES. May be deleted any time.
+FILE_HTTP_CACHE = 'http_cache.db'
+
+#  Max total size of pages in HTTP cache, least recently used pages are removed.
+KB_MAX_HTTP_CACHE = 50 * 1024
+
+#  How often "please wait" message of /getgigs is edited to show progress, seconds.
+SEC_PROGRESS_EDIT = 3
+
+#  If True, /getgigs answers at once from db when all user's lfm accounts were synced
+#  not more than HOURS_MAX_GIGS_STALENESS ago. Then accounts are refreshed in
+#  background, and follow-up message is sent only if new artists found.
+GETGIGS_STALE_WHILE_REVALIDATE = False
+HOURS_MAX_GIGS_STALENESS = 24
+
+#  Attempts to load page at temporary errors (429, 5xx, network errors).
+QTY_FETCH_ATTEMPTS = 4
+
+#  Base delay between attempts, doubles each attempt (with random jitter).
+SEC_BACKOFF_BASE = 2
+
+#  Max delay between attempts, also limits Retry-After asked by last.fm.
+SEC_BACKOFF_MAX = 60
+
+#  Circuit breaker: if among last QTY_BREAKER_WINDOW loads share of failed ones is not
+#  less than BREAKER_ERROR_RATE, all loads pause for SEC_BREAKER_PAUSE seconds.
+QTY_BREAKER_WINDOW = 20
+BREAKER_ERROR_RATE = 0.5
+SEC_BREAKER_PAUSE = 120
+
+#  Seconds to use cached page without asking last.fm, per endpoint (part of URL).
+#  After that page is revalidated with ETag/Last-Modified. Other URLs are not cached.
+HTTP_CACHE_TTL = {'method=user.getrecenttracks': 600, '/+events': 3600 * 6}
+
 # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 # # # # # # # # #   TRANSLATIONS  # # # # # # # # # # #
 # # # # # # # # # # # # # # # # # # # # # # # # # # # #
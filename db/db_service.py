@@ -13,46 +13,75 @@
 # program.  If not, see <https://www.gnu.org/licenses/>.
 """This file contains class Db and logic related to sqlite database."""
 
+import json
 import logging
 import os
-import sqlite3
-from contextlib import contextmanager
 from dataclasses import asdict
 from datetime import datetime
-from sqlite3 import IntegrityError, OperationalError
-from typing import Any, Iterator, List, Literal, Optional, Tuple, Union
+from typing import List, Optional, Tuple, Union
 
 from telegram import Update
 
 import config as cfg
+from db.queues_service import QueuesDb
+from db.sql_service import (
+    affected_hard_check,
+    execute_query,
+    get_connection,
+    list_hard_check,
+    run_statement,
+    tuple_hard_check,
+)
+from db.sync_service import SyncDb
+from services.cache_service import LruCache
 from services.custom_classes import ArtScrobble, BotUser, Event, UserSettings
 from services.logger import logger
+from services.query_stats_service import Statement
 from services.timeconv_service import timestamp_to_text
 
 logger = logging.getLogger(name='A.db')
 logger.setLevel(logging.DEBUG)
 
+#  Per-user maps {shorthand: (art_name, shorthand_date)}, shared by all Db() objects.
+#  Filled when news sent, and with DB answers at /xx pressing.
+shorthands_cache = LruCache('shorthands', cfg.QTY_CACHED_SHORTHAND_USERS)
 
-@contextmanager
-def get_connection(db_path: str, params: Any = None) -> Iterator[sqlite3.Connection]:
+#  Idempotent statements to bring DB created by older ggb_sqlite.sql up to date.
+UPGRADE_QUERIES = [
+    'CREATE INDEX IF NOT EXISTS "idx_lineups_art_name" ON "lineups" ("art_name");',
     """
-    Context manager for proper executing sqlite queries.
-    Args:
-        db_path: path to database
-        params: optional, parameters to execute query with, for error
-        output (at debugging)
+    CREATE TABLE IF NOT EXISTS "joblease" (
+        "user_id" BIGINT UNSIGNED NOT NULL,
+        "chat_id" BIGINT UNSIGNED NOT NULL,
+        "run_date" DATE NOT NULL,
+        "worker" NVARCHAR(255),
+        "lease_until" DATETIME,
+        "done_datetime" DATETIME,
+        PRIMARY KEY("user_id","chat_id","run_date"),
+        CONSTRAINT "fk_joblease_users" FOREIGN KEY("user_id") REFERENCES "users"("user_id")
+        ON DELETE CASCADE ON UPDATE CASCADE
+    );
+    """,
     """
-    conn = sqlite3.connect(db_path)
-    try:
-        conn.execute("PRAGMA foreign_keys = 1")
-        yield conn
-        conn.commit()
-    except IntegrityError as e:
-        logger.info('CATCHED IntegrityError: %s, params: %s', e, params)
-    except OperationalError as e:
-        logger.info('CATCHED OperationalError: %s, params: %s', e, params)
-    finally:
-        conn.close()
+    CREATE TABLE IF NOT EXISTS "outbox" (
+        "msg_id" INTEGER,
+        "chat_id" BIGINT NOT NULL,
+        "text" TEXT NOT NULL,
+        "parse_mode" NVARCHAR(45),
+        "attempts" SMALLINT DEFAULT 0,
+        "created_datetime" DATETIME,
+        PRIMARY KEY("msg_id" AUTOINCREMENT)
+    );
+    """,
+]
+
+#  Columns (table, column, definition) added to tables after DB could be created.
+UPGRADE_COLUMNS = [
+    ('artnames', 'events_digest', 'CHAR(40)'),
+    ('artnames', 'next_check_at', 'DATETIME'),
+    ('artnames', 'unchanged_checks', 'SMALLINT DEFAULT 0'),
+    ('useraccs', 'sync_datetime', 'DATETIME'),
+]
 
 
 def create_db(db) -> None:
@@ -77,77 +106,30 @@ def create_db(db) -> None:
         return None
 
 
-def execute_query(
-    db,
-    query: str,
-    params: Any = None,
-    mode: Literal['execute', 'selectone', 'selectmany', 'getaffected'] = 'execute',
-) -> Union[Any, List[Any], int, None]:
-    """
-    Execute queries to db. Note, getaffected arg should not be combined with
-    selects.
-    Args:
-        db: database Db()
-        query: single query to execute
-        params: parameters to execute query with
-        mode:
-            execute: if query should not return anything (for consistency)
-            select: if query should return a value OR values
-            selectone: if query should return only one row
-            getaffected: if query should return quantity of affected rows
-    """
-    answer = None
-    with get_connection(db.db_path, params) as con:
-        cursor = con.cursor()
-        cursor.execute(query, params)
-        if mode == 'selectone':
-            answer = cursor.fetchone()
-        elif mode == 'selectmany':
-            answer = cursor.fetchall()
-        elif mode == 'getaffected':
-            answer = cursor.rowcount
-        cursor.close()
-        return answer
-
-
-def affected_hard_check(affected: Union[Any, List[Any], int, None]) -> int:
-    """
-    Provide hard check of "affected" var. Good for linter and for DB control.
-    Args:
-        affected: value returned by _executed_query
-    """
-    if isinstance(affected, int) and affected >= 0:
-        return affected
-    raise TypeError("Affected rows quantity returns non-int! DB fails")
-
-
-def tuple_hard_check(record: Union[Any, List[Any], int, None]) -> tuple:
-    """
-    Provide hard check of db output. Good for linter and for DB control.
-    Args:
-        record: value returned by _executed_query
+def upgrade_db(db) -> None:
     """
-    if isinstance(record, tuple):
-        return record
-    raise TypeError("execute_query() returns not tuple! DB fails")
-
-
-def list_hard_check(record: Union[Any, List[Any], int, None]) -> list:
+    Applies UPGRADE_QUERIES to existing db. Used at start, because create script runs
+    only when db file not found.
     """
-    Provide hard check of db output. Good for linter and for DB control.
-    Args:
-        record: value returned by _executed_query
-    """
-    if isinstance(record, list):
-        return record
-    raise TypeError("execute_query() returns not list! DB fails")
+    for query in UPGRADE_QUERIES:
+        execute_query(db, query=query, params=(), mode='execute')
+    logger.info('%s upgrade queries executed', len(UPGRADE_QUERIES))
+    for table, column, definition in UPGRADE_COLUMNS:
+        columns = execute_query(
+            db, f'PRAGMA table_info("{table}")', params=(), mode='selectmany'
+        )
+        if column not in [row[1] for row in list_hard_check(columns)]:
+            query = f'ALTER TABLE "{table}" ADD COLUMN "{column}" {definition}'
+            execute_query(db, query=query, params=(), mode='execute')
+            logger.info('Column %s added to table %s', column, table)
 
 
-class Db:
+class Db(QueuesDb, SyncDb):
     """
     Class for working with sqlite3 database. Convention for function names is to use
     proper first name symbol(s): r - read, w - write, wr/rw - write and read, d - delete
-    data. After that symbol(s) "sql_" and then function name
+    data. After that symbol(s) "sql_" and then function name. Methods for some tables
+    are in parent classes: QueuesDb (queues_service.py) and SyncDb (sync_service.py).
     """
 
     def __init__(self, initial: bool = False) -> None:
@@ -164,12 +146,14 @@ class Db:
             os.remove(self.db_path)
             logger.info('DB DELETED from: %s', self.db_path)
             create_db(self)
-            return None
-
-        if not os.path.isfile(self.db_path):
+        elif not os.path.isfile(self.db_path):
             logger.info('DB not found in file: %s', self.db_path)
             create_db(self)
-        return None
+        elif initial:
+            upgrade_db(self)
+        if initial and cfg.WORKERS_QTY:
+            #  Readers don't block writer, for several processes sharing db
+            execute_query(self, 'PRAGMA journal_mode=WAL', params=(), mode='selectone')
 
     #################################
     ###### WRITES/WRITE-READS #######
@@ -302,10 +286,12 @@ class Db:
         )
         return None
 
-    async def wsql_events_lups(self, event_list: List[Event]) -> None:
+    async def wsql_events_lups(self, event_list: List[Event]) -> bool:
         """
         Write list of event-rows to event table AND list of lists of art-rows to lineup
-        table.
+        table, all in single transaction.
+        Returns:
+            True if written, False if nothing was written because of db error
         """
         query_ev = """
         INSERT INTO events (event_date, place, locality, country, event_source, link)
@@ -319,28 +305,35 @@ class Db:
             """
         count_lup = 0
         count_ev = 0
-        for ev in event_list:
-            execute_query(self, query=query_ev, params=asdict(ev))
-            for art_name in ev.lineup:
-                execute_query(
-                    self,
-                    query=query_lup,
-                    params=(ev.event_date, ev.place, ev.locality, art_name),
-                    mode='execute',
-                )
+        written = False
+        name = 'wsql_events_lups'
+        with get_connection(self.db_path) as con:
+            for ev in event_list:
+                run_statement(con, Statement(name, query_ev, asdict(ev)))
+                for art_name in ev.lineup:
+                    params = (ev.event_date, ev.place, ev.locality, art_name)
+                    run_statement(con, Statement(name, query_lup, params))
+                    logger.debug(
+                        "Added lineup with art_name: %s, event_date: %s, event_place: %s",
+                        art_name,
+                        ev.event_date,
+                        ev.place,
+                    )
+                    count_lup += 1
                 logger.debug(
-                    "Added lineup with art_name: %s, event_date: %s, event_place: %s",
-                    art_name,
+                    "Added event event_date: %s, event_place: %s",
                     ev.event_date,
                     ev.place,
                 )
-                count_lup += 1
-            logger.debug(
-                "Added event event_date: %s, event_place: %s", ev.event_date, ev.place
-            )
-            count_ev += 1
+                count_ev += 1
+            #  Commit here: get_connection() swallows errors of its own commit
+            con.commit()
+            written = True
+        if not written:
+            logger.warning('Events not saved: %s events', len(event_list))
+            return False
         logger.info('Added to db: %s events, %s line-ups', count_ev, count_lup)
-        return None
+        return True
 
     async def wsql_jobs(self, user_id: int, chat_id: int) -> None:
         """
@@ -362,79 +355,124 @@ class Db:
             logger.info("Not added job in DB: user_id %s, chat_id %s", user_id, chat_id)
         return None
 
-    async def wsql_artcheck(self, art_name: str) -> None:
+    async def wsql_artcheck(
+        self, art_name: str, digest: Optional[str] = None, active: Optional[bool] = None
+    ) -> None:
         """
         Writes or updates info about art_name checking time, for escaping multiple
-        checking. Time delay controlled by cfg.DAYS_MIN_DELAY_ARTCHECK.
+        checking, and time of next check. Delay is cfg.DAYS_MIN_DELAY_ARTCHECK for
+        active artists and doubles with each inactive check in a row, up to
+        cfg.DAYS_MAX_DELAY_ARTCHECK.
         Args:
             art_name: artist name that was checked
+            digest: digest of events part of artist's page, not updated if None
+            active: True if new events found, False if events are unchanged or empty,
+            None if check failed (minimal delay, inactive checks counter kept)
         """
         query = """
-            UPDATE artnames SET check_datetime = datetime("now") 
-            WHERE art_name = ?
+            UPDATE artnames SET check_datetime = datetime("now"),
+                events_digest = COALESCE(:digest, events_digest),
+                next_check_at = datetime("now", "+" || MIN(:max_delay, :min_delay *
+                    (1 << CASE WHEN :active = 0
+                        THEN MIN(COALESCE(unchanged_checks, 0) + 1, 16) ELSE 0 END)
+                    ) || " days"),
+                unchanged_checks = CASE
+                    WHEN :active IS NULL THEN COALESCE(unchanged_checks, 0)
+                    WHEN :active = 1 THEN 0
+                    ELSE COALESCE(unchanged_checks, 0) + 1 END
+            WHERE art_name = :art_name
             """
-        execute_query(self, query=query, params=(art_name,), mode='execute')
+        params = {
+            'art_name': art_name,
+            'digest': digest,
+            'active': active,
+            'min_delay': cfg.DAYS_MIN_DELAY_ARTCHECK,
+            'max_delay': cfg.DAYS_MAX_DELAY_ARTCHECK,
+        }
+        execute_query(self, query=query, params=params, mode='execute')
         logger.debug("Added or updated artcheck: %s", art_name)
         return None
 
-    async def wsql_last_sent_arts(
-        self, user_id: int, shorthand: int, art_name: str
+    async def wsql_last_sent_arts_batch(
+        self, user_id: int, sent_arts: List[Tuple[int, str]]
     ) -> None:
         """
-        Write all fields to lastarts table. It used to access detailed event info with
-        'shortcuts' like: /01 Beatles /02 Sebastian Bach. THEN write all fields to sentarts
-        table. It used to escape multiple send of same events to same user.
+        Write all the artists of one news message to lastarts table. It used to access
+        detailed event info with 'shortcuts' like: /01 Beatles /02 Sebastian Bach. THEN
+        write their events to sentarts table. It used to escape multiple send of same
+        events to same user. All rows are written in single transaction, and listens
+        aggregate (which artists user had listen enough) is computed once for the whole
+        batch. Shorthand that already exists, i.e. after reset to zero at
+        cfg.INTEGER_MAX_SHORTHAND, is replaced with new artist.
         Args:
             user_id: Tg user_id field
-            shorthand: integer shorthand number, max to cfg.INTEGER_MAX_SHORTHAND
-            art_name: corresponding artist name
+            sent_arts: list of tuples (shorthand, art_name)
         """
+        if not sent_arts:
+            return None
         query_lastarts = """
-        INSERT INTO lastarts (user_id, shorthand, art_name, shorthand_date)
+        INSERT OR REPLACE INTO lastarts (user_id, shorthand, art_name, shorthand_date)
         VALUES (?,?,?,date("now"));
         """
-        execute_query(
-            self,
-            query=query_lastarts,
-            params=(user_id, shorthand, art_name),
-            mode='execute',
-        )
-        logger.debug("Added lastarts for user_id: %s", user_id)
-
+        #  Artists are passed as one JSON array, so statement text and plan are the
+        #  same for any quantity of artists, and there is no host parameters limit
         params = {
             'user_id': user_id,
-            'art_name': art_name,
-            'delay': cfg.DAYS_MIN_DELAY_ARTCHECK,
             'period': cfg.DAYS_PERIOD_MINLISTENS,
+            'arts': json.dumps([art_name for _, art_name in sent_arts]),
         }
         query_sentarts = """
-        INSERT INTO sentarts (user_id, sent_datetime, art_name, event_id)
+        INSERT OR IGNORE INTO sentarts (user_id, sent_datetime, art_name, event_id)
+        WITH listened AS
+            (SELECT art_name FROM scrobbles
+            WHERE user_id= :user_id
+                AND JULIANDAY("now")-JULIANDAY(scrobble_date) <= :period
+                AND art_name IN (SELECT value FROM json_each(:arts))
+            GROUP BY art_name
+            HAVING
+                SUM(scrobble_count) >= (SELECT min_listens FROM usersettings WHERE user_id= :user_id))
         SELECT :user_id AS user_id,
                 DATETIME("now") AS sent_datetime,
-                art_name, 
+                lineups.art_name,
                 events.event_id
                 FROM lineups JOIN events
-                ON lineups.event_id = events.event_id 
+                ON lineups.event_id = events.event_id
                 WHERE
-                    lineups.art_name = :art_name
+                    lineups.art_name IN (SELECT art_name FROM listened)
                     AND
                     events.event_date >= DATE("now")
                     AND
-                    events.event_id NOT IN 
-                        (SELECT event_id FROM sentarts WHERE user_id= :user_id AND art_name= :art_name)
-                    AND
-                    :art_name IN
-                        (SELECT art_name FROM scrobbles
-                        WHERE JULIANDAY("now")-JULIANDAY(scrobble_date) <= :period
-                        GROUP BY user_id, art_name
-                        HAVING 
-                        SUM(scrobble_count) >= (SELECT min_listens FROM usersettings WHERE user_id= :user_id)
-                        AND
-                        user_id= :user_id);
-        """
-        execute_query(self, query=query_sentarts, params=params, mode='execute')
-        logger.debug("Added sentarts for user_id: %s", user_id)
-
+                    NOT EXISTS
+                        (SELECT 1 FROM sentarts
+                        WHERE sentarts.user_id= :user_id
+                            AND sentarts.event_id = events.event_id
+                            AND sentarts.art_name = lineups.art_name);
+        """
+        written = False
+        name = 'wsql_last_sent_arts_batch'
+        with get_connection(self.db_path, params) as con:
+            lastarts = [(user_id, shorthand, art) for shorthand, art in sent_arts]
+            run_statement(con, Statement(name, query_lastarts, lastarts, many=True))
+            run_statement(con, Statement(name, query_sentarts, params))
+            shorthand_date = con.execute('SELECT date("now")').fetchone()[0]
+            #  Commit here: get_connection() swallows errors of its own commit
+            con.commit()
+            written = True
+        if not written:
+            logger.warning('Sent artists not saved for user_id: %s', user_id)
+            return None
+        #  Cache only what was written, otherwise shorthands lead to nowhere
+        user_shorthands = shorthands_cache.get(user_id)
+        if user_shorthands is None:
+            user_shorthands = {}
+            shorthands_cache.put(user_id, user_shorthands)
+        for shorthand, art_name in sent_arts:
+            user_shorthands[shorthand] = (art_name, shorthand_date)
+        logger.debug(
+            "Added lastarts and sentarts for user_id: %s, %s artists",
+            user_id,
+            len(sent_arts),
+        )
         return None
 
     #################################
@@ -561,9 +599,10 @@ class Db:
     async def rsql_artcheck(self, user_id: int, art_name: str) -> int:
         """
         Answers should this artist be checked for events. Returns 0 or 1. Conditions for
-        "1": a) no checked for concerts yet OR checked far before
-        DAYS_MIN_DELAY_ARTCHECK b) user had listen this artist much enough, i.e. not
-        less than min_listens times in last DAYS_PERIOD_MINLISTENS days.
+        "1": a) no checked for concerts yet OR its next_check_at time came (see
+        wsql_artcheck(), DAYS_MIN_DELAY_ARTCHECK for rows without it) b) user had
+        listen this artist much enough, i.e. not less than min_listens times in last
+        DAYS_PERIOD_MINLISTENS days.
         Args:
             user_id: Tg user_id field
             art_name: artist_name
@@ -582,8 +621,8 @@ class Db:
                 WHEN
                     ((SELECT check_datetime FROM artnames WHERE art_name = :art_name) IS NULL
                         OR
-                    (SELECT JULIANDAY(DATETIME("NOW")) - JULIANDAY(check_datetime) FROM artnames
-                    WHERE art_name = :art_name) > :delay)
+                    (SELECT COALESCE(JULIANDAY(next_check_at), JULIANDAY(check_datetime) + :delay)
+                    FROM artnames WHERE art_name = :art_name) < JULIANDAY(DATETIME("NOW")))
                 AND (:art_name IN (SELECT art_name FROM scrobbles
                     WHERE JULIANDAY("now")-JULIANDAY(scrobble_date) <= :period
                     GROUP BY user_id, art_name
@@ -599,6 +638,39 @@ class Db:
         record = tuple_hard_check(record)[0]
         return record
 
+    async def rsql_shorthand(
+        self, user_id: int, shorthand: int
+    ) -> Optional[Tuple[str, str]]:
+        """
+        Returns artist name and date when news was sent, for user's quick-link shortcut.
+        Answer is taken from shorthands_cache, or from lastarts table and then cached.
+        Args:
+            user_id: Tg user_id field
+            shorthand: integer shortcut
+        Returns:
+            tuple (art_name, shorthand_date) or None if shortcut not found
+        """
+        #  With worker processes, news are sent (and shorthands reused) by other process
+        user_shorthands = {} if cfg.WORKERS_QTY else shorthands_cache.get(user_id)
+        if user_shorthands is None:
+            user_shorthands = {}
+            shorthands_cache.put(user_id, user_shorthands)
+        if shorthand in user_shorthands:
+            return user_shorthands[shorthand]
+        query = """
+        SELECT art_name, shorthand_date FROM lastarts
+        WHERE user_id = ? AND shorthand = ?
+        """
+        record = execute_query(
+            self, query, params=(user_id, shorthand), mode='selectone'
+        )
+        if record is None:
+            logger.debug('No shorthand %s for user_id %s', shorthand, user_id)
+            return record
+        record = tuple_hard_check(record)
+        user_shorthands[shorthand] = record
+        return record
+
     async def rsql_getallevents(self, user_id: int, shorthand: int) -> List[Tuple]:
         """
         Return all events as answer on user's quick-link shortcut pressing. Conditions
@@ -612,20 +684,22 @@ class Db:
             table
 
         """
-        params = {'user_id': user_id, 'shorthand': shorthand}
+        logger.info('BotUser %s requests shorthand %s', user_id, shorthand)
+        sent_art = await self.rsql_shorthand(user_id, shorthand)
+        if sent_art is None:
+            return []
+        art_name, shorthand_date = sent_art
         query = """
-        SELECT
-        (SELECT art_name FROM lastarts WHERE shorthand= :shorthand AND user_id= :user_id) as artist, 
-        event_date, place, locality, country, link FROM events WHERE
-        event_id IN 
-            (SELECT event_id FROM lineups 
-            WHERE art_name= (SELECT art_name FROM lastarts WHERE shorthand= :shorthand AND user_id= :user_id))
-        AND event_date >= (SELECT shorthand_date FROM lastarts WHERE shorthand= :shorthand AND user_id= :user_id)
+        SELECT lineups.art_name, event_date, place, locality, country, link
+        FROM lineups JOIN events
+        ON lineups.event_id = events.event_id
+        WHERE lineups.art_name = ? AND events.event_date >= ?
         ORDER BY event_date
         """
-        ev = execute_query(self, query, params=params, mode='selectmany')
+        ev = execute_query(
+            self, query, params=(art_name, shorthand_date), mode='selectmany'
+        )
         ev = list_hard_check(ev)
-        logger.info('BotUser %s requests shorthand %s', user_id, shorthand)
         return ev
 
     async def rsql_lastdayscrobble(self, user_id: int, lfm: str) -> Union[str, None]:
@@ -736,6 +810,8 @@ async def dsql_useraccs(db, user_id, lfm) -> Tuple[int, int]:
     execute_query(db, query_del_sa, params=(user_id, user_id, lfm))
 
     execute_query(db, query_del_la, params=(user_id, user_id, lfm))
+    #  After delete, not to cache again shorthands read in between
+    shorthands_cache.pop(user_id)
 
     affected_scr = execute_query(
         db, query_del_scr, params=(user_id, lfm), mode='getaffected'
@@ -775,6 +851,7 @@ async def dsql_user(db, user_id) -> bool:
     affected_users = execute_query(
         db, query_del_user, params=(user_id,), mode='getaffected'
     )
+    shorthands_cache.pop(user_id)
     if not affected_users:
         problem = True
         logger.info('Problem when deleting user_id for %s', user_id)
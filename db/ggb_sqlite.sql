@@ -2,6 +2,9 @@ BEGIN TRANSACTION;
 CREATE TABLE IF NOT EXISTS "artnames" (
 	"art_name"	NVARCHAR(45),
 	"check_datetime"	DATETIME,
+	"events_digest"	CHAR(40),
+	"next_check_at"	DATETIME,
+	"unchanged_checks"	SMALLINT DEFAULT 0,
 	PRIMARY KEY("art_name")
 );
 CREATE TABLE IF NOT EXISTS "events" (
@@ -20,6 +23,16 @@ CREATE TABLE IF NOT EXISTS "jobs" (
 	PRIMARY KEY("user_id","chat_id"),
 	CONSTRAINT "fk_jobs_users" FOREIGN KEY("user_id") REFERENCES "users"("user_id") ON DELETE CASCADE ON UPDATE CASCADE
 );
+CREATE TABLE IF NOT EXISTS "joblease" (
+	"user_id"	BIGINT UNSIGNED NOT NULL,
+	"chat_id"	BIGINT UNSIGNED NOT NULL,
+	"run_date"	DATE NOT NULL,
+	"worker"	NVARCHAR(255),
+	"lease_until"	DATETIME,
+	"done_datetime"	DATETIME,
+	PRIMARY KEY("user_id","chat_id","run_date"),
+	CONSTRAINT "fk_joblease_users" FOREIGN KEY("user_id") REFERENCES "users"("user_id") ON DELETE CASCADE ON UPDATE CASCADE
+);
 CREATE TABLE IF NOT EXISTS "lastarts" (
 	"user_id"	BIGINT UNSIGNED NOT NULL,
 	"shorthand"	SMALLINT NOT NULL,
@@ -36,6 +49,15 @@ CREATE TABLE IF NOT EXISTS "lineups" (
 	PRIMARY KEY("event_id","art_name"),
 	CONSTRAINT "fk_lineups_events" FOREIGN KEY("event_id") REFERENCES "events"("event_id") ON DELETE CASCADE ON UPDATE CASCADE
 );
+CREATE TABLE IF NOT EXISTS "outbox" (
+	"msg_id"	INTEGER,
+	"chat_id"	BIGINT NOT NULL,
+	"text"	TEXT NOT NULL,
+	"parse_mode"	NVARCHAR(45),
+	"attempts"	SMALLINT DEFAULT 0,
+	"created_datetime"	DATETIME,
+	PRIMARY KEY("msg_id" AUTOINCREMENT)
+);
 CREATE TABLE IF NOT EXISTS "scrobbles" (
 	"user_id"	BIGINT UNSIGNED NOT NULL,
 	"art_name"	NVARCHAR(45) NOT NULL,
@@ -59,6 +81,7 @@ CREATE TABLE IF NOT EXISTS "sentarts" (
 CREATE TABLE IF NOT EXISTS "useraccs" (
 	"user_id"	BIGINT UNSIGNED NOT NULL,
 	"lfm"	VARCHAR(45) NOT NULL,
+	"sync_datetime"	DATETIME,
 	PRIMARY KEY("user_id","lfm"),
 	CONSTRAINT "fk_useraccs_users" FOREIGN KEY("user_id") REFERENCES "users"("user_id") ON DELETE CASCADE ON UPDATE CASCADE
 );
@@ -82,6 +105,8 @@ CREATE TABLE IF NOT EXISTS "usersettings" (
 	CONSTRAINT "fk_usersettings_users" FOREIGN KEY("user_id") REFERENCES "users"("user_id") ON DELETE CASCADE ON UPDATE CASCADE
 );
 
+CREATE INDEX IF NOT EXISTS "idx_lineups_art_name" ON "lineups" ("art_name");
+
 CREATE TRIGGER insert_uninserted_artists_lineups
   BEFORE UPDATE ON lineups
   WHEN NEW.art_name NOT IN (SELECT art_name FROM artnames)
@@ -0,0 +1,193 @@
+# Green Grass Bot — Ties the music you're listening to with the concert it's playing at.
+# Copyright (C) 2021-2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""This file contains part of class Db for tables shared by processes: job leases of
+worker processes (see worker_service.py) and outbox of send queue (see
+send_queue_service.py)."""
+
+import logging
+from typing import List, Tuple
+
+import config as cfg
+from db.sql_service import affected_hard_check, execute_query, list_hard_check
+from services.custom_classes import OutboxMessage
+from services.logger import logger
+
+logger = logging.getLogger('A.que')
+logger.setLevel(logging.DEBUG)
+
+
+class QueuesDb:
+    """
+    Db methods for joblease and outbox tables. Not used alone, see class Db.
+    """
+
+    async def wsql_joblease(
+        self, user_id: int, chat_id: int, run_date: str, worker: str
+    ) -> int:
+        """
+        Claims daily job for worker process. Claim succeeds if job was not claimed for
+        this run_date yet, OR previous lease expired and job was not done.
+        Args:
+            user_id: Tg user_id field
+            chat_id: Tg chat_id field
+            run_date: date of daily run, in FORMAT_SQL_DATE
+            worker: worker name
+        Returns:
+            1 if claimed, 0 otherwise
+        """
+        params = {
+            'user_id': user_id,
+            'chat_id': chat_id,
+            'run_date': run_date,
+            'worker': worker,
+            'lease': f'+{cfg.SEC_JOB_LEASE} seconds',
+        }
+        query = """
+        INSERT INTO joblease (user_id, chat_id, run_date, worker, lease_until)
+        VALUES (:user_id, :chat_id, :run_date, :worker, DATETIME("now", :lease))
+        ON CONFLICT (user_id, chat_id, run_date) DO UPDATE
+        SET worker = excluded.worker, lease_until = excluded.lease_until
+        WHERE joblease.done_datetime IS NULL AND joblease.lease_until < DATETIME("now");
+        """
+        affected = execute_query(self, query=query, params=params, mode='getaffected')
+        return affected_hard_check(affected)
+
+    async def wsql_joblease_done(
+        self, user_id: int, chat_id: int, run_date: str, worker: str
+    ) -> None:
+        """
+        Marks daily job claimed by worker as done, so it will not run again this day.
+        Args:
+            user_id: Tg user_id field
+            chat_id: Tg chat_id field
+            run_date: date of daily run, in FORMAT_SQL_DATE
+            worker: worker name
+        """
+        query = """
+        UPDATE joblease SET done_datetime = DATETIME("now")
+        WHERE user_id = ? AND chat_id = ? AND run_date = ? AND worker = ?
+        """
+        execute_query(self, query=query, params=(user_id, chat_id, run_date, worker))
+        logger.debug("Job done for user_id %s, run_date %s", user_id, run_date)
+        return None
+
+    async def wsql_outbox(self, chat_id: int, text: str, parse_mode: str) -> None:
+        """
+        Saves message to send later by send queue (send_queue_service.py).
+        Args:
+            chat_id: Tg chat_id to send to
+            text: message text
+            parse_mode: Tg parse mode of text
+        """
+        query = """
+            INSERT INTO outbox (chat_id, text, parse_mode, created_datetime)
+            VALUES (?, ?, ?, datetime("now"))
+            """
+        params = (chat_id, text, parse_mode)
+        execute_query(self, query=query, params=params, mode='execute')
+        return None
+
+    async def wsql_outbox_attempt(self, msg_id: int) -> None:
+        """
+        Counts failed attempt to send message from outbox.
+        Args:
+            msg_id: outbox message id
+        """
+        query = """
+            UPDATE outbox SET attempts = attempts + 1
+            WHERE msg_id = ?
+            """
+        execute_query(self, query=query, params=(msg_id,), mode='execute')
+        return None
+
+    async def rsql_duejobs(self, run_date: str, index: int, total: int) -> List[Tuple]:
+        """
+        Returns jobs of worker's partition that are not done for run_date yet.
+        Args:
+            run_date: date of daily run, in FORMAT_SQL_DATE
+            index: worker index, from 0 to total-1
+            total: quantity of workers
+        Returns:
+            List of tuples in format (user_id, chat_id) or empty list
+        """
+        query = """
+        SELECT jobs.user_id, jobs.chat_id FROM jobs
+        LEFT JOIN joblease
+        ON jobs.user_id = joblease.user_id
+            AND jobs.chat_id = joblease.chat_id
+            AND joblease.run_date = :run_date
+        WHERE jobs.user_id % :total = :index AND joblease.done_datetime IS NULL
+        """
+        params = {'run_date': run_date, 'index': index, 'total': total}
+        records = execute_query(self, query, params=params, mode='selectmany')
+        records = list_hard_check(records)
+        logger.debug('Due jobs for worker %s/%s: %s', index, total, len(records))
+        return records
+
+    async def rsql_outbox(self, limit: int) -> List[OutboxMessage]:
+        """
+        Returns oldest messages waiting in outbox.
+        Args:
+            limit: max quantity of messages
+        """
+        query = """
+        SELECT msg_id, chat_id, text, parse_mode, attempts FROM outbox
+        ORDER BY msg_id
+        LIMIT ?
+        """
+        record = execute_query(self, query, params=(limit,), mode='selectmany')
+        return [OutboxMessage(*row) for row in list_hard_check(record)]
+
+    async def rsql_outbox_depth(self) -> int:
+        """
+        Returns quantity of messages waiting in outbox.
+        """
+        query = """
+        SELECT COUNT(*) FROM outbox
+        """
+        record = execute_query(self, query, params=(), mode='selectone')
+        return record[0] if record else 0
+
+
+async def dsql_joblease(db) -> int:
+    """
+    Delete job executions history older than cfg.DAYS_KEEP_JOBLEASE days.
+    Args:
+        db: database Db()
+    Returns:
+        quantity of deleted rows
+    """
+    query = """
+    DELETE FROM joblease WHERE run_date < DATE("now", ?)
+    """
+    affected = execute_query(
+        db, query, params=(f'-{cfg.DAYS_KEEP_JOBLEASE} days',), mode='getaffected'
+    )
+    return affected_hard_check(affected)
+
+
+async def dsql_outbox(db, msg_id: int) -> int:
+    """
+    Delete message from outbox, when it is sent or can not be sent at all.
+    Args:
+        db: database Db()
+        msg_id: outbox message id
+    Returns:
+        quantity of deleted rows
+    """
+    query = """
+    DELETE FROM outbox WHERE msg_id = ?
+    """
+    affected = execute_query(db, query, params=(msg_id,), mode='getaffected')
+    return affected_hard_check(affected)
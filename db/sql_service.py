@@ -0,0 +1,148 @@
+# Green Grass Bot — Ties the music you're listening to with the concert it's playing at.
+# Copyright (C) 2021-2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""This file contains execution of sqlite statements for class Db: connection with
+errors handling, execution with timing, and checks of answers."""
+
+import logging
+import sqlite3
+import time
+from contextlib import contextmanager
+from sqlite3 import IntegrityError, OperationalError
+from typing import Any, Iterator, List, Literal, Union
+
+import config as cfg
+from services.logger import logger
+from services.query_stats_service import Statement, caller_name, observe_statement
+
+logger = logging.getLogger('A.sql')
+logger.setLevel(logging.DEBUG)
+
+
+@contextmanager
+def get_connection(db_path: str, params: Any = None) -> Iterator[sqlite3.Connection]:
+    """
+    Context manager for proper executing sqlite queries.
+    Args:
+        db_path: path to database
+        params: optional, parameters to execute query with, for error
+        output (at debugging)
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("PRAGMA foreign_keys = 1")
+        yield conn
+        conn.commit()
+    except IntegrityError as e:
+        logger.info('CATCHED IntegrityError: %s, params: %s', e, params)
+    except OperationalError as e:
+        logger.info('CATCHED OperationalError: %s, params: %s', e, params)
+    finally:
+        conn.close()
+
+
+def execute_query(
+    db,
+    query: str,
+    params: Any = None,
+    mode: Literal['execute', 'selectone', 'selectmany', 'getaffected'] = 'execute',
+) -> Union[Any, List[Any], int, None]:
+    """
+    Execute queries to db. Note, getaffected arg should not be combined with
+    selects.
+    Args:
+        db: database Db()
+        query: single query to execute
+        params: parameters to execute query with
+        mode:
+            execute: if query should not return anything (for consistency)
+            select: if query should return a value OR values
+            selectone: if query should return only one row
+            getaffected: if query should return quantity of affected rows
+    """
+    answer = None
+    name = caller_name() if cfg.METRICS or cfg.DB_PROFILING else ''
+    with get_connection(db.db_path, params) as con:
+        answer = run_statement(con, Statement(name, query, params), mode)
+    return answer
+
+
+def run_statement(
+    con: sqlite3.Connection,
+    statement: Statement,
+    mode: Literal['execute', 'selectone', 'selectmany', 'getaffected'] = 'execute',
+) -> Union[Any, List[Any], int, None]:
+    """
+    Execute one statement with open connection and count it, see observe_statement()
+    in query_stats_service.py. Used by execute_query() and by Db methods running
+    several statements in one transaction.
+    Args:
+        con: open connection
+        statement: statement to execute
+        mode: see execute_query()
+    """
+    answer = None
+    start = time.perf_counter()
+    cursor = con.cursor()
+    try:
+        if statement.many:
+            cursor.executemany(statement.query, statement.params)
+        else:
+            cursor.execute(statement.query, statement.params)
+        if mode == 'selectone':
+            answer = cursor.fetchone()
+            rows = int(answer is not None)
+        elif mode == 'selectmany':
+            answer = cursor.fetchall()
+            rows = len(answer)
+        else:
+            rows = max(0, cursor.rowcount)
+            if mode == 'getaffected':
+                answer = cursor.rowcount
+        observe_statement(con, statement, time.perf_counter() - start, rows)
+    finally:
+        cursor.close()
+    return answer
+
+
+def affected_hard_check(affected: Union[Any, List[Any], int, None]) -> int:
+    """
+    Provide hard check of "affected" var. Good for linter and for DB control.
+    Args:
+        affected: value returned by _executed_query
+    """
+    if isinstance(affected, int) and affected >= 0:
+        return affected
+    raise TypeError("Affected rows quantity returns non-int! DB fails")
+
+
+def tuple_hard_check(record: Union[Any, List[Any], int, None]) -> tuple:
+    """
+    Provide hard check of db output. Good for linter and for DB control.
+    Args:
+        record: value returned by _executed_query
+    """
+    if isinstance(record, tuple):
+        return record
+    raise TypeError("execute_query() returns not tuple! DB fails")
+
+
+def list_hard_check(record: Union[Any, List[Any], int, None]) -> list:
+    """
+    Provide hard check of db output. Good for linter and for DB control.
+    Args:
+        record: value returned by _executed_query
+    """
+    if isinstance(record, list):
+        return record
+    raise TypeError("execute_query() returns not list! DB fails")
@@ -0,0 +1,95 @@
+# Green Grass Bot — Ties the music you're listening to with the concert it's playing at.
+# Copyright (C) 2021-2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""This file contains part of class Db about freshness of loaded data: sync time of
+lfm accounts, artists scrobbled recently and digests of artists' event pages. It lets
+news be built from db without loading from last.fm again."""
+
+from typing import List, Optional
+
+import config as cfg
+from db.sql_service import execute_query, list_hard_check, tuple_hard_check
+
+
+class SyncDb:
+    """
+    Db methods about freshness of loaded data. Not used alone, see class Db.
+    """
+
+    async def wsql_useraccs_synced(self, user_id: int, lfm: str) -> None:
+        """
+        Saves time when scrobbles and events of account were loaded successfully.
+        Args:
+            user_id: Tg user_id field
+            lfm: last.fm account name
+        """
+        query = """
+            UPDATE useraccs SET sync_datetime = datetime("now")
+            WHERE user_id = ? AND lfm = ?
+            """
+        execute_query(self, query=query, params=(user_id, lfm), mode='execute')
+        return None
+
+    async def rsql_sync_age(self, user_id: int) -> float:
+        """
+        Returns hours passed since the least recent sync of user's lfm accounts, see
+        wsql_useraccs_synced().
+        Args:
+            user_id: Tg user_id field
+        Returns:
+            hours, or float('inf') if some account was never synced or no accounts
+        """
+        query = """
+        SELECT MAX(COALESCE(
+            (JULIANDAY("now") - JULIANDAY(sync_datetime)) * 24, 1e9))
+        FROM useraccs
+        WHERE user_id = ?
+        """
+        record = execute_query(self, query, params=(user_id,), mode='selectone')
+        hours = tuple_hard_check(record)[0]
+        return float('inf') if hours is None or hours >= 1e9 else hours
+
+    async def rsql_recent_arts(self, user_id: int, lfm: str) -> List[str]:
+        """
+        Returns artists scrobbled by account in last DAYS_PERIOD_MINLISTENS days, as
+        they are stored in db.
+        Args:
+            user_id: Tg user_id field
+            lfm: last.fm account name
+        Returns:
+            list of artist names
+        """
+        query = """
+        SELECT DISTINCT art_name FROM scrobbles
+        WHERE user_id = ? AND lfm = ?
+            AND JULIANDAY("now") - JULIANDAY(scrobble_date) <= ?
+        """
+        params = (user_id, lfm, cfg.DAYS_PERIOD_MINLISTENS)
+        record = execute_query(self, query, params=params, mode='selectmany')
+        return [row[0] for row in list_hard_check(record)]
+
+    async def rsql_artdigest(self, art_name: str) -> Optional[str]:
+        """
+        Returns digest of events part of artist's page at last check, see
+        events_section_digest() in parsers.py.
+        Args:
+            art_name: artist name
+        Returns:
+            digest or None if artist was not checked yet
+        """
+        query = """
+            SELECT events_digest FROM artnames
+            WHERE art_name = ?
+            """
+        record = execute_query(self, query=query, params=(art_name,), mode='selectone')
+        return record[0] if record else None
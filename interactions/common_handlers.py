@@ -13,7 +13,6 @@
 # program.  If not, see <https://www.gnu.org/licenses/>.
 """This file contains callback functions for auxiliary handlers."""
 
-import html
 import json
 import logging
 import traceback
@@ -23,8 +22,10 @@ from telegram.constants import ParseMode
 from telegram.ext import CallbackContext, ContextTypes, ConversationHandler
 
 import config as cfg
+from services.error_report_service import error_reports
 from services.logger import logger
 from services.message_service import i34g, reply, send_message, up
+from services.send_queue_service import send_queue
 
 logger = logging.getLogger(name='A.com')
 logger.setLevel(logging.DEBUG)
@@ -59,31 +60,41 @@ async def unknown_handler(update: Update, _context: ContextTypes.DEFAULT_TYPE):
 
 async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
-    Log the error and send a telegram message to notify the developer. Source:
+    Log the error and count it in error_reports, which notifies the developer with
+    digest of errors. Based on:
     docs.python-telegram-bot.org/en/v20.6/examples.errorhandlerbot.html
     """
     assert context.error
     logger.warning('Update %s caused error %s', update, context.error)
-    tb_list = traceback.format_exception(
-        None, context.error, context.error.__traceback__
-    )
-    tb_string = "".join(tb_list)
-
-    update_str = update.to_dict() if isinstance(update, Update) else str(update)
-    message = (
-        "An exception was raised while handling an update\n"
-        f"<pre>update = {html.escape(json.dumps(update_str, indent=2, ensure_ascii=False))}"
-        "</pre>\n\n"
-        f"<pre>context.chat_data = {html.escape(str(context.chat_data))}</pre>\n\n"
-        f"<pre>context.user_data = {html.escape(str(context.user_data))}</pre>\n\n"
-        f"<pre>{html.escape(tb_string)}</pre>"
-    )
 
-    logger.warning('ERROR HANDLER MESSAGE: %s', message)
-
-    await send_message(
-        context,
-        chat_id=cfg.DEVELOPER_CHAT_ID,
-        text=message[:4095],
-        parse_mode=ParseMode.HTML,
-    )
+    def describe() -> str:
+        update_str = update.to_dict() if isinstance(update, Update) else str(update)
+        return (
+            f'update = {json.dumps(update_str, ensure_ascii=False)[:1000]}\n'
+            f'context.chat_data = {str(context.chat_data)[:300]}\n'
+            f'context.user_data = {str(context.user_data)[:300]}'
+        )
+
+    if error_reports.record(context.error, describe):
+        logger.warning(
+            'New kind of error:\n%s',
+            ''.join(
+                traceback.format_exception(
+                    None, context.error, context.error.__traceback__
+                )
+            ),
+        )
+
+    async def send_digest(text: str) -> None:
+        if cfg.SEND_QUEUE:
+            await send_queue.put(cfg.DEVELOPER_CHAT_ID, text, parse_mode=ParseMode.HTML)
+            return None
+        await send_message(
+            context,
+            chat_id=cfg.DEVELOPER_CHAT_ID,
+            text=text,
+            parse_mode=ParseMode.HTML,
+        )
+        return None
+
+    error_reports.schedule(send_digest)
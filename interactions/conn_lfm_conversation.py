@@ -26,6 +26,7 @@ from telegram.ext import (
 )
 
 import config as cfg
+from commands.getgigs import start_prefetch
 from db.db_service import Db
 from interactions.common_handlers import cancel_handle
 from services.logger import logger
@@ -72,7 +73,7 @@ async def username(update: Update, context: CallbackContext) -> int:
     """
     Second step. Gets lastfm username and check it. Variants possible: a) Name already
     in db -> Message -> END b) Name give error -> Message -> END c) Ok in lastfm and
-    added -> Message -> add_daily.
+    added -> Message -> add_daily and start_prefetch.
     Args:
         update, context: standart PTB callback signature
     Returns:
@@ -112,6 +113,7 @@ async def username(update: Update, context: CallbackContext) -> int:
                 user_id=user_id,
             )
         await add_daily(update, context)
+        start_prefetch(context, user_id, acc)
         await reply(update, text)
         logger.info('BotUser: %s have added lfm account:  %s', user_id, acc)
     else:
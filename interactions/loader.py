@@ -17,6 +17,8 @@ import logging
 
 from telegram.ext import Application, CommandHandler, MessageHandler, filters
 
+import config as cfg
+from commands.dbstats import dbstats
 from commands.details import details
 from commands.getgigs import getgigs
 from commands.help import help_call
@@ -65,6 +67,11 @@ def load_commands(application: Application) -> None:
     Loads all command handlers on start.
     Args: application: application for adding handlers to.
     """
+    application.add_handler(
+        CommandHandler(
+            'dbstats', dbstats, filters.Chat(cfg.DEVELOPER_CHAT_ID), block=False
+        )
+    )
     application.add_handler(CommandHandler('getgigs', getgigs, block=False))
     application.add_handler(CommandHandler('help', help_call, block=False))
     application.add_handler(CommandHandler('nonewevents', nonewevents, block=False))
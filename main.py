@@ -23,8 +23,12 @@ from telegram.ext import Application
 import config as cfg
 from db.db_service import Db
 from interactions.loader import load_interactions
-from services.logger import logger
+from services.app_service import app_builder
+from services.logger import apply_log_levels, logger
+from services.metrics_service import start_metrics_server
+from services.parse_services import parse_pool
 from services.schedule_service import reschedule_jobs
+from services.send_queue_service import start_send_queue
 from ui.commands_setter import set_commands
 from ui.descriptions_setter import set_descriptions
 
@@ -36,25 +40,59 @@ logger = logging.getLogger('A.A')
 logger.setLevel(logging.DEBUG)
 
 
+async def post_init(application: Application) -> None:
+    """
+    Start background services of main process, when application is initialized.
+    """
+    if cfg.SEND_QUEUE:
+        await start_send_queue(application)
+    if cfg.METRICS:
+        await start_metrics_server(cfg.METRICS_PORT)
+    parse_pool.start()
+    return None
+
+
+async def post_shutdown(_application: Application) -> None:
+    """
+    Stop background services of main process, when application is shut down.
+    """
+    parse_pool.stop()
+    return None
+
+
 def main() -> None:
     """
-    Produce program launch. Shu!
+    Produce program launch. Shu! Updates are received with long polling, or with
+    webhook if cfg.WEBHOOK_MODE.
     """
+    apply_log_levels()
     token = os.environ['BOT_TOKEN']
     db = Db(initial=True)
     application = (
-        Application.builder()
-        .token(token)
-        .read_timeout(cfg.SEC_READ_TIMEOUT)
-        .write_timeout(cfg.SEC_WRITE_TIMEOUT)
-        .build()
+        app_builder(token).post_init(post_init).post_shutdown(post_shutdown).build()
     )
     load_interactions(application)
     reschedule_jobs(application, db)
     set_descriptions(application)
     set_commands(application)
+    if cfg.WEBHOOK_MODE:
+        secret_token = os.environ.get('WEBHOOK_SECRET_TOKEN')
+        if not secret_token:
+            logger.warning('WEBHOOK_SECRET_TOKEN not set. Webhook is not protected')
+        logger.info('App started in webhook mode')
+        application.run_webhook(
+            listen=cfg.WEBHOOK_LISTEN,
+            port=cfg.WEBHOOK_PORT,
+            url_path=cfg.WEBHOOK_PATH,
+            webhook_url=os.environ['WEBHOOK_URL'],
+            secret_token=secret_token,
+            max_connections=cfg.WEBHOOK_MAX_CONNECTIONS,
+            allowed_updates=[Update.MESSAGE],
+        )
+        return None
     logger.info('App started')
     application.run_polling(allowed_updates=[Update.MESSAGE])
+    return None
 
 
 if __name__ == '__main__':
@@ -0,0 +1,33 @@
+# Green Grass Bot — Ties the music you're listening to with the concert it's playing at.
+# Copyright (C) 2021-2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""This file contains application setup common for main.py process and workers."""
+
+from telegram.ext import Application, ApplicationBuilder
+
+import config as cfg
+
+
+def app_builder(token: str) -> ApplicationBuilder:
+    """
+    Returns application builder with settings common for all the processes. Caller
+    adds own settings and builds application.
+    Args:
+        token: Tg bot token
+    """
+    return (
+        Application.builder()
+        .token(token)
+        .read_timeout(cfg.SEC_READ_TIMEOUT)
+        .write_timeout(cfg.SEC_WRITE_TIMEOUT)
+    )
@@ -0,0 +1,95 @@
+# Green Grass Bot — Ties the music you're listening to with the concert it's playing at.
+# Copyright (C) 2021-2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""This file contains in-memory caches used to avoid repeated work."""
+
+import logging
+from collections import OrderedDict
+from typing import Any, Hashable, List
+
+from services.logger import logger
+
+logger = logging.getLogger('A.cac')
+logger.setLevel(logging.DEBUG)
+
+#  All caches created, for metrics (see metrics_service.py).
+caches: List['LruCache'] = []
+
+
+class LruCache:
+    """
+    Dict-like in-memory storage with bounded size. When full, least recently used
+    item is removed. Not thread-safe, should be used from event loop only.
+    """
+
+    def __init__(self, name: str, maxsize: int) -> None:
+        """
+        Args:
+            name: cache name, for logging
+            maxsize: maximum quantity of items to keep
+        """
+        self.name = name
+        self.maxsize = maxsize
+        self.data: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        caches.append(self)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Returns value for key and mark it as recently used, or default if not found.
+        Args:
+            key: key to look for
+            default: value to return if key not found
+        """
+        if key in self.data:
+            self.data.move_to_end(key)
+            self.hits += 1
+            return self.data[key]
+        self.misses += 1
+        return default
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """
+        Saves value for key. Removes least recently used item if cache is full.
+        Args:
+            key: key to save value for
+            value: value to save
+        """
+        self.data[key] = value
+        self.data.move_to_end(key)
+        if len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> Any:
+        """
+        Removes key from cache, if exists.
+        Args:
+            key: key to remove
+        Returns:
+            removed value or None
+        """
+        return self.data.pop(key, None)
+
+    def clear(self) -> None:
+        """
+        Removes all items from cache.
+        """
+        self.data.clear()
+        logger.debug('Cache %s cleared', self.name)
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.data
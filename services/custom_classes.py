@@ -14,7 +14,7 @@
 """This file contains @dataclass classes definitions."""
 
 from dataclasses import dataclass, field
-from typing import List
+from typing import List, Optional
 
 import config as cfg
 
@@ -98,3 +98,22 @@ class UserSettings:
     notice_time: str = cfg.DEFAULT_NOTICE_TIME
     nonewevents: int = cfg.DEFAULT_NONEWEVENTS
     locale: str = cfg.LOCALE_DEFAULT
+
+
+@dataclass
+class OutboxMessage:
+    """
+    Class for keeping message waiting in outbox, see send_queue_service.py.
+    Args:
+        msg_id: outbox row id
+        chat_id: Tg chat_id to send to
+        text: message text
+        parse_mode: mode to parse the text
+        attempts: quantity of failed sending attempts
+    """
+
+    msg_id: int
+    chat_id: int
+    text: str
+    parse_mode: Optional[str]
+    attempts: int
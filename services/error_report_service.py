@@ -0,0 +1,177 @@
+# Green Grass Bot — Ties the music you're listening to with the concert it's playing at.
+# Copyright (C) 2021-2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""This file contains aggregator of error reports to developer: errors are grouped by
+traceback signature and sent as one digest not more often than cfg.SEC_ERROR_DIGEST."""
+
+import asyncio
+import hashlib
+import html
+import logging
+import time
+import traceback
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from telegram.constants import MessageLimit
+
+import config as cfg
+from services.logger import logger
+
+logger = logging.getLogger('A.err')
+logger.setLevel(logging.DEBUG)
+
+
+def error_fingerprint(error: BaseException) -> str:
+    """
+    Returns signature of error: hash of its type and traceback frames (file, function,
+    line). Errors raised at the same place have the same signature, whatever message.
+    """
+    frames = traceback.extract_tb(error.__traceback__)
+    signature = [type(error).__qualname__]
+    signature.extend(f'{f.filename}:{f.name}:{f.lineno}' for f in frames)
+    return hashlib.sha1('|'.join(signature).encode()).hexdigest()[:8]
+
+
+@dataclass
+class ErrorKind:
+    """
+    Errors with one fingerprint, happened since last digest.
+    Args:
+        title: type and message of first error of kind
+        sample: description of update caused it, only for never reported kind
+        trace: traceback of first error, only for never reported kind
+        count: quantity of errors of kind
+    """
+
+    title: str
+    sample: Optional[str] = None
+    trace: Optional[str] = None
+    count: int = 0
+
+
+def error_kind(error: BaseException, sample: Optional[str]) -> ErrorKind:
+    """
+    Returns new kind for first error of it. Traceback is kept only along with sample,
+    i.e. for never reported kind.
+    Args:
+        error: first error of kind
+        sample: description of update caused it, only for never reported kind
+    """
+    trace = None
+    if sample is not None:
+        trace = ''.join(traceback.format_exception(None, error, error.__traceback__))
+    return ErrorKind(f'{type(error).__name__}: {error}', sample, trace)
+
+
+class ErrorReports:
+    """
+    Counts errors by fingerprint and sends digest with send() callback. First digest
+    after quiet period goes at once, next ones not earlier than cfg.SEC_ERROR_DIGEST
+    after previous. Full traceback is sent only for kinds never reported before, so
+    error storm costs one message per period. Should be used from event loop only.
+    """
+
+    def __init__(self) -> None:
+        self.kinds: Dict[str, ErrorKind] = {}
+        self.reported: Dict[str, int] = {}
+        self.last_sent = -float(cfg.SEC_ERROR_DIGEST)
+        self.flush_task: Optional[asyncio.Task] = None
+
+    def record(self, error: BaseException, describe: Callable[[], str]) -> bool:
+        """
+        Count error.
+        Args:
+            error: raised exception
+            describe: function returning description of update, called only for new
+                kind of errors
+        Returns:
+            True if error of this kind was never seen before
+        """
+        fingerprint = error_fingerprint(error)
+        kind = self.kinds.get(fingerprint)
+        new = fingerprint not in self.reported and kind is None
+        if kind is None:
+            kind = error_kind(error, describe() if new else None)
+            self.kinds[fingerprint] = kind
+        kind.count += 1
+        return new
+
+    def schedule(self, send: Callable[[str], Awaitable[None]]) -> None:
+        """
+        Start delayed sending of digest, if not started yet.
+        Args:
+            send: coroutine function to send digest text (HTML)
+        """
+        if self.flush_task is not None:
+            return None
+        delay = max(0.0, self.last_sent + cfg.SEC_ERROR_DIGEST - time.monotonic())
+        self.flush_task = asyncio.ensure_future(self.flush(send, delay))
+        return None
+
+    async def flush(self, send: Callable[[str], Awaitable[None]], delay: float) -> None:
+        """
+        Wait delay seconds, then send digest of errors counted.
+        """
+        try:
+            await asyncio.sleep(delay)
+            text = self.digest()
+            self.last_sent = time.monotonic()
+        finally:
+            self.flush_task = None
+        try:
+            await send(text)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            #  Not raised: error handler would be called again for it
+            logger.warning('Error digest not sent: %s', e)
+        return None
+
+    def digest(self) -> str:
+        """
+        Build digest text of errors counted and start counting anew. Text is cut to
+        fit one Tg message: at most half of it for the list of kinds, the rest is
+        shared by tracebacks of new kinds. Full tracebacks are in the log anyway.
+        """
+        kinds, self.kinds = self.kinds, {}
+        total = sum(kind.count for kind in kinds.values())
+        text = f'<b>{total} errors of {len(kinds)} kinds</b>\n'
+        limit = MessageLimit.MAX_TEXT_LENGTH - 100
+        shown: List[ErrorKind] = []
+        for fingerprint, kind in sorted(kinds.items(), key=lambda i: -i[1].count):
+            self.reported[fingerprint] = self.reported.get(fingerprint, 0) + kind.count
+            mark = 'NEW ' if kind.trace else ''
+            line = (
+                f'\n{mark}<code>{fingerprint}</code> x{kind.count}: '
+                f'{html.escape(kind.title[:200])}'
+            )
+            if len(text) + len(line) > limit // 2:
+                text += f'\n...and {len(kinds) - len(shown)} kinds more'
+                break
+            text += line
+            shown.append(kind)
+        traced = [kind for kind in shown if kind.trace]
+        for index, kind in enumerate(traced):
+            room = (limit - len(text)) // (len(traced) - index) - 20
+            if room < 200:
+                break
+            #  Tail of traceback is the most useful part. Cut at line start, not to
+            #  break escaped chars.
+            sample = html.escape(f'{kind.sample}\n\n{kind.trace}')
+            if len(sample) > room:
+                sample = sample[-room:].partition('\n')[2]
+            text += f'\n\n<pre>{sample}</pre>'
+        logger.info('Error digest: %s errors of %s kinds', total, len(kinds))
+        return text
+
+
+error_reports = ErrorReports()
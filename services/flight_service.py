@@ -0,0 +1,87 @@
+# Green Grass Bot — Ties the music you're listening to with the concert it's playing at.
+# Copyright (C) 2021-2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""This file contains single-flight registry: not more than one running computation
+per key, later callers get result of running one."""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from services.logger import logger
+from services.metrics_service import tasks_running
+
+logger = logging.getLogger('A.fli')
+logger.setLevel(logging.DEBUG)
+
+
+class SingleFlight:
+    """
+    Registry of running computations by key. Should be used from event loop only.
+    Computation is a task: if its caller is cancelled, it still finishes for others.
+    """
+
+    def __init__(self, name: str) -> None:
+        """
+        Args:
+            name: registry name, for logging
+        """
+        self.name = name
+        self.flights: Dict[Hashable, asyncio.Future] = {}
+
+    def running(self, key: Hashable) -> bool:
+        """
+        Returns True if computation for key is running.
+        """
+        return key in self.flights
+
+    async def run(
+        self, key: Hashable, func: Callable[[], Awaitable[Any]]
+    ) -> Tuple[Any, bool]:
+        """
+        Start func() for key, or attach to running computation for key.
+        Args:
+            key: computation key, i.e. user_id
+            func: coroutine function to start if nothing runs for key
+        Returns:
+            tuple with result and True if func() was started by this call, False if
+            attached. Exception of computation is raised to all callers.
+        """
+        flight = self.flights.get(key)
+        if flight is not None:
+            logger.info('Flight %s: attached to running %s', self.name, key)
+            return await asyncio.shield(flight), False
+        flight = asyncio.ensure_future(func())
+        self.flights[key] = flight
+        tasks_running.inc(self.name)
+        flight.add_done_callback(lambda done: self.forget(key, done))
+        return await asyncio.shield(flight), True
+
+    def forget(self, key: Hashable, flight: asyncio.Future) -> None:
+        """
+        Remove finished computation from registry.
+        """
+        tasks_running.inc(self.name, amount=-1)
+        if self.flights.get(key) is flight:
+            del self.flights[key]
+
+    async def join(self, key: Hashable) -> Optional[Any]:
+        """
+        Wait for running computation for key.
+        Returns:
+            its result, or None if nothing runs for key
+        """
+        flight = self.flights.get(key)
+        if flight is None:
+            return None
+        return await asyncio.shield(flight)
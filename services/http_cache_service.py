@@ -0,0 +1,233 @@
+# Green Grass Bot — Ties the music you're listening to with the concert it's playing at.
+# Copyright (C) 2021-2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""This file contains persistent HTTP cache for last.fm pages. It lives in separate
+sqlite file, not in bot's db: it is disposable and may be deleted any time."""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, NamedTuple, Optional
+
+import config as cfg
+from services.logger import logger
+
+logger = logging.getLogger('A.htc')
+logger.setLevel(logging.DEBUG)
+
+CREATE_QUERY = """
+    CREATE TABLE IF NOT EXISTS "pages" (
+        "url_key" CHAR(40) NOT NULL,
+        "body" TEXT NOT NULL,
+        "digest" CHAR(40) NOT NULL,
+        "etag" NVARCHAR(255),
+        "last_modified" NVARCHAR(255),
+        "fetched_at" REAL NOT NULL,
+        "last_used" REAL NOT NULL,
+        "size" INTEGER NOT NULL,
+        "parser" NVARCHAR(45),
+        "parsed" TEXT,
+        PRIMARY KEY("url_key")
+    );
+    """
+
+
+class CachedPage(NamedTuple):
+    """
+    Page saved in cache.
+    """
+
+    body: str
+    digest: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    fresh: bool
+
+
+def page_digest(body: str) -> str:
+    """
+    Returns hex digest of page text, to tell changed pages from unchanged ones.
+    """
+    return hashlib.sha1(body.encode()).hexdigest()
+
+
+def endpoint_ttl(url: str) -> Optional[int]:
+    """
+    Returns time to live of url pages according cfg.HTTP_CACHE_TTL, or None if url
+    should not be cached.
+    """
+    for endpoint, ttl in cfg.HTTP_CACHE_TTL.items():
+        if endpoint in url:
+            return ttl
+    return None
+
+
+class HttpCache:
+    """
+    Size-bounded storage of pages with validators (ETag, Last-Modified) and results
+    of parsing. When size exceeds cfg.KB_MAX_HTTP_CACHE, least recently used pages are
+    removed. Key is hash of url, so urls with api_key are not stored. Methods open own
+    connection, so they may be called from thread pool (see page_loader()).
+    """
+
+    def __init__(self) -> None:
+        self.db_path = os.path.join(cfg.PATH_DBFILES, cfg.FILE_HTTP_CACHE)
+        self.ready = False
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """
+        Context manager to execute queries in one transaction. Creates table at first
+        call. Cache errors are logged, not raised: page is loaded without cache then.
+        """
+        conn = sqlite3.connect(self.db_path)
+        try:
+            if not self.ready:
+                conn.execute(CREATE_QUERY)
+                self.ready = True
+            yield conn
+            conn.commit()
+        except sqlite3.Error as e:
+            logger.warning('HTTP cache error: %s', e)
+        finally:
+            conn.close()
+
+    def get(self, url: str) -> Optional[CachedPage]:
+        """
+        Returns cached page for url and mark it as recently used.
+        Args:
+            url: page url
+        Returns:
+            CachedPage with fresh=True if page is younger than endpoint TTL, or None
+            if page is not cached
+        """
+        ttl = endpoint_ttl(url)
+        if ttl is None:
+            return None
+        url_key = page_digest(url)
+        row = None
+        with self.connection() as conn:
+            row = conn.execute(
+                """
+                SELECT body, digest, etag, last_modified, fetched_at
+                FROM pages WHERE url_key = ?
+                """,
+                (url_key,),
+            ).fetchone()
+            if row:
+                conn.execute(
+                    'UPDATE pages SET last_used = ? WHERE url_key = ?',
+                    (time.time(), url_key),
+                )
+        if row is None:
+            return None
+        body, digest, etag, last_modified, fetched_at = row
+        fresh = time.time() - fetched_at < ttl
+        return CachedPage(body, digest, etag, last_modified, fresh)
+
+    def put(self, url: str, body: str, headers: Dict[str, str]) -> None:
+        """
+        Saves loaded page with its validators and removes old pages if cache is too
+        big. Parsed result of previous page version is dropped.
+        Args:
+            url: page url
+            body: page text
+            headers: response headers
+        """
+        if endpoint_ttl(url) is None:
+            return None
+        now = time.time()
+        with self.connection() as conn:
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO pages (url_key, body, digest, etag,
+                    last_modified, fetched_at, last_used, size, parser, parsed)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, NULL, NULL)
+                """,
+                (
+                    page_digest(url),
+                    body,
+                    page_digest(body),
+                    headers.get('ETag'),
+                    headers.get('Last-Modified'),
+                    now,
+                    now,
+                    len(body),
+                ),
+            )
+            conn.execute(
+                """
+                DELETE FROM pages WHERE url_key IN (
+                    SELECT url_key FROM (
+                        SELECT url_key, SUM(size) OVER (ORDER BY last_used DESC)
+                            AS total
+                        FROM pages)
+                    WHERE total > ?)
+                """,
+                (cfg.KB_MAX_HTTP_CACHE * 1024,),
+            )
+        return None
+
+    def touch(self, url: str) -> None:
+        """
+        Marks cached page as fresh again, after server answered 304 Not Modified.
+        """
+        now = time.time()
+        with self.connection() as conn:
+            conn.execute(
+                'UPDATE pages SET fetched_at = ?, last_used = ? WHERE url_key = ?',
+                (now, now, page_digest(url)),
+            )
+
+    def get_parsed(self, url: str, parser: str, digest: str) -> Optional[Any]:
+        """
+        Returns saved result of parsing of this very page version, if any.
+        Args:
+            url: page url
+            parser: name of parsing function
+            digest: digest of page text which is going to be parsed
+        """
+        row = None
+        with self.connection() as conn:
+            row = conn.execute(
+                """
+                SELECT parsed FROM pages
+                WHERE url_key = ? AND digest = ? AND parser = ?
+                """,
+                (page_digest(url), digest, parser),
+            ).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return json.loads(row[0])
+
+    def put_parsed(self, url: str, parser: str, digest: str, parsed: Any) -> None:
+        """
+        Saves result of parsing, if cached page is still the same version.
+        Args:
+            url: page url
+            parser: name of parsing function
+            digest: digest of parsed page text
+            parsed: json-serializable result
+        """
+        with self.connection() as conn:
+            conn.execute(
+                """
+                UPDATE pages SET parser = ?, parsed = ?
+                WHERE url_key = ? AND digest = ?
+                """,
+                (parser, json.dumps(parsed), page_digest(url), digest),
+            )
@@ -13,19 +13,80 @@
 # program.  If not, see <https://www.gnu.org/licenses/>.
 """This file contains logger logic."""
 
+import atexit
+import json
 import logging
 import os
+import queue
+from datetime import datetime, timezone
 from logging import Logger
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
 import config as cfg
 
 
+def subsystem_level(name: str) -> int:
+    """
+    Returns level for logger name: from cfg.LOG_LEVELS for the logger or its nearest
+    ancestor, or cfg.LOG_LEVEL.
+    """
+    while name:
+        if name in cfg.LOG_LEVELS:
+            return logging.getLevelName(cfg.LOG_LEVELS[name])
+        name = name.rpartition('.')[0]
+    return logging.getLevelName(cfg.LOG_LEVEL)
+
+
+def check_log_levels() -> None:
+    """
+    Raise ValueError if cfg.LOG_LEVEL or level in cfg.LOG_LEVELS is not a level name,
+    i.e. 'debug' or 'WARN_ONLY', to fail at start instead of dropping messages.
+    """
+    for name, level in [('LOG_LEVEL', cfg.LOG_LEVEL), *cfg.LOG_LEVELS.items()]:
+        if not isinstance(logging.getLevelName(level), int):
+            raise ValueError(f'Unknown log level {level!r} for {name}')
+
+
+def apply_log_levels() -> None:
+    """
+    Set levels of logger A and its descendants from cfg.LOG_LEVEL and cfg.LOG_LEVELS.
+    Modules set their loggers to DEBUG at import, so call it after bot modules are
+    imported. Messages below level are dropped by logger, before record is created.
+    """
+    for name in list(logging.root.manager.loggerDict):
+        if name == 'A' or name.startswith('A.'):
+            logging.getLogger(name).setLevel(subsystem_level(name))
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats message as one-line JSON object.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'logger': record.name,
+            'level': record.levelname,
+            'file': record.filename,
+            'line': record.lineno,
+            'func': record.funcName,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
 def start_logger() -> Logger:
     """
     Loggers definition. Logger in logger.py is the highest (A), other are descendants:
-    A.uti, A.db, etc.
+    A.uti, A.db, etc. If cfg.LOG_QUEUE, logger A only puts messages to queue, and
+    console and file handlers are run by QueueListener thread. Levels from config are
+    checked here and set by apply_log_levels().
     """
+    check_log_levels()
     gen_logger = logging.getLogger('A')
     gen_logger.setLevel(logging.DEBUG)
     gen_logger.propagate = False
@@ -53,9 +114,18 @@ def start_logger() -> Logger:
     ch.setLevel(logging.DEBUG)
     rh.setLevel(logging.DEBUG)
     ch.setFormatter(ch_formatter)
-    rh.setFormatter(rh_formatter)
-    gen_logger.addHandler(ch)
-    gen_logger.addHandler(rh)
+    rh.setFormatter(JsonFormatter() if cfg.LOG_JSON else rh_formatter)
+    if not cfg.LOG_QUEUE:
+        for handler in (ch, rh):
+            gen_logger.addHandler(handler)
+        return gen_logger
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    qh = QueueHandler(log_queue)
+    listener = QueueListener(log_queue, ch, rh, respect_handler_level=True)
+    listener.start()
+    #  Write what is left in queue at exit
+    atexit.register(listener.stop)
+    gen_logger.addHandler(qh)
     return gen_logger
 
 
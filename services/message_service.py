@@ -14,11 +14,11 @@
 """This file contains functions related to text messages: reading, sending, i18n."""
 
 import logging
-from typing import Tuple, Union
+from typing import List, Tuple, Union
 
 import i18n
 from telegram import Message, ReplyKeyboardMarkup, ReplyKeyboardRemove, Update, User
-from telegram.constants import ParseMode
+from telegram.constants import MessageLimit, ParseMode
 from telegram.ext import CallbackContext
 
 import config as cfg
@@ -132,6 +132,99 @@ async def send_message(
     )
 
 
+def tg_len(text: str) -> int:
+    """
+    Returns text length as Tg counts it for message limit: in UTF-16 code units, so
+    emoji and other characters outside BMP count twice.
+    """
+    return len(text.encode('utf-16-le')) // 2
+
+
+def fit_length(text: str, limit: int) -> int:
+    """
+    Returns length of the longest text prefix with tg_len() not more than limit.
+    """
+    units = 0
+    for index, char in enumerate(text):
+        units += 2 if ord(char) > 0xFFFF else 1
+        if units > limit:
+            return index
+    return len(text)
+
+
+def split_text(text: str, limit: int = MessageLimit.MAX_TEXT_LENGTH) -> List[str]:
+    """
+    Splits MarkdownV2 text to chunks not longer than Tg message limit, measured by
+    tg_len(). Splits at line breaks where possible: all the entities (*bold*,
+    _italic_, links) in bot messages are inside one line, so they stay unbroken. Too
+    long lines are split at spaces or, at last, hard. Chunk never ends with escaping
+    backslash.
+    Args:
+        text: text to split
+        limit: maximum chunk length
+    Returns:
+        list of non-empty chunks
+    """
+    chunks = []
+    fit = fit_length(text, limit)
+    while fit < len(text):
+        cut = text.rfind('\n', 0, fit)
+        if cut <= 0:
+            cut = text.rfind(' ', 0, fit)
+        if cut <= 0:
+            cut = fit - 1
+        chunk = text[: cut + 1]
+        #  Odd quantity of trailing backslashes means escape sequence is broken
+        while (len(chunk) - len(chunk.rstrip('\\'))) % 2 and len(chunk) > 1:
+            chunk = chunk[:-1]
+        chunks.append(chunk)
+        text = text[len(chunk) :]
+        fit = fit_length(text, limit)
+    chunks.append(text)
+    return [chunk for chunk in chunks if chunk.strip()]
+
+
+class TextChunker:
+    """
+    Streaming message builder. Collects text parts as they are produced and gives away
+    Tg-sized chunks as soon as they are complete, so the first message can be sent
+    before the whole text is built.
+    """
+
+    def __init__(self, limit: int = MessageLimit.MAX_TEXT_LENGTH) -> None:
+        """
+        Args:
+            limit: maximum chunk length
+        """
+        self.limit = limit
+        self.buffer = ''
+
+    def add(self, text: str) -> List[str]:
+        """
+        Appends text part to buffer.
+        Args:
+            text: text part
+        Returns:
+            list of complete chunks ready to send, may be empty
+        """
+        self.buffer += text
+        if tg_len(self.buffer) <= self.limit:
+            return []
+        chunks = split_text(self.buffer, self.limit)
+        self.buffer = chunks.pop() if chunks else ''
+        return chunks
+
+    def flush(self) -> List[str]:
+        """
+        Gives away the rest of buffer.
+        Returns:
+            list with last chunk or empty list
+        """
+        chunks = split_text(self.buffer, self.limit)
+        self.buffer = ''
+        return chunks
+
+
 def alarm_char(text: Union[str, int], escape='\\') -> str:
     """
     Provides pre-escaping alarm characters in output messages with '/', accordin:
@@ -0,0 +1,384 @@
+# Green Grass Bot — Ties the music you're listening to with the concert it's playing at.
+# Copyright (C) 2021-2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""This file contains metrics of bot, exposed in Prometheus text format at local HTTP
+endpoint if cfg.METRICS. Without cfg.METRICS metrics are not collected at all."""
+
+import asyncio
+import logging
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager, contextmanager
+from typing import (
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+import config as cfg
+from services.logger import logger
+
+logger = logging.getLogger('A.met')
+logger.setLevel(logging.DEBUG)
+
+#  Upper bounds of latency histogram buckets, seconds.
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+#  All metrics, in order of exposition.
+registry: List['Metric'] = []
+
+
+def format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    """
+    Returns labels part of sample line, i.e. {endpoint="events"}, or empty string.
+    """
+    if not names:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(
+            name,
+            str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'),
+        )
+        for name, value in zip(names, values)
+    )
+    return '{' + pairs + '}'
+
+
+class Metric(ABC):
+    """
+    Base of metrics: name, help, labels and lock. Values may be changed from thread
+    pool (i.e. by page_loader()), so changes are made under lock.
+    """
+
+    kind = 'untyped'
+
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = ()) -> None:
+        """
+        Args:
+            name: metric name, with ggb_ prefix
+            doc: HELP text
+            labels: label names
+        """
+        self.name = name
+        self.doc = doc
+        self.labels = tuple(labels)
+        self.lock = threading.Lock()
+        registry.append(self)
+
+    @abstractmethod
+    def samples(self) -> List[str]:
+        """
+        Returns sample lines of metric.
+        """
+
+    def render(self) -> str:
+        """
+        Returns metric in Prometheus text format.
+        """
+        lines = [f'# HELP {self.name} {self.doc}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(self.samples())
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    """
+    Monotonic counter with labels.
+    """
+
+    kind = 'counter'
+
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = ()) -> None:
+        super().__init__(name, doc, labels)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        """
+        Add amount to counter of label values.
+        """
+        if not cfg.METRICS:
+            return None
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+        return None
+
+    def samples(self) -> List[str]:
+        with self.lock:
+            values = list(self.values.items())
+        return [
+            f'{self.name}{format_labels(self.labels, key)} {value}'
+            for key, value in values
+        ]
+
+
+class Gauge(Metric):
+    """
+    Gauge, set directly or read at scrape time from collect() callback, which returns
+    {label values: value}.
+    """
+
+    kind = 'gauge'
+
+    def __init__(
+        self,
+        name: str,
+        doc: str,
+        labels: Sequence[str] = (),
+        collect: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None,
+    ) -> None:
+        super().__init__(name, doc, labels)
+        self.values: Dict[Tuple[str, ...], float] = {}
+        self.collect = collect
+
+    def set(self, value: float, *label_values: str) -> None:
+        """
+        Set gauge of label values.
+        """
+        if not cfg.METRICS:
+            return None
+        with self.lock:
+            self.values[label_values] = value
+        return None
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        """
+        Add amount (may be negative) to gauge of label values.
+        """
+        if not cfg.METRICS:
+            return None
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+        return None
+
+    def samples(self) -> List[str]:
+        with self.lock:
+            values = dict(self.values)
+        if self.collect is not None:
+            values.update(self.collect())
+        return [
+            f'{self.name}{format_labels(self.labels, key)} {value}'
+            for key, value in values.items()
+        ]
+
+
+class Histogram(Metric):
+    """
+    Histogram with labels and LATENCY_BUCKETS buckets, for durations in seconds.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = ()) -> None:
+        super().__init__(name, doc, labels)
+        #  {label values: [count per bucket..., count in +Inf, sum]}
+        self.values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        """
+        Count observed value for label values.
+        """
+        if not cfg.METRICS:
+            return None
+        with self.lock:
+            counts = self.values.get(label_values)
+            if counts is None:
+                counts = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0]
+                self.values[label_values] = counts
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            else:
+                counts[len(LATENCY_BUCKETS)] += 1
+            counts[-1] += value
+        return None
+
+    @contextmanager
+    def time(self, *label_values: str) -> Iterator[None]:
+        """
+        Context manager to observe duration of its block. Works inside coroutines too.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *label_values)
+
+    def samples(self) -> List[str]:
+        with self.lock:
+            values = {key: list(counts) for key, counts in self.values.items()}
+        lines = []
+        for key, counts in values.items():
+            cumulative = 0
+            bounds = [str(bound) for bound in LATENCY_BUCKETS] + ['+Inf']
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                labels = format_labels(self.labels + ('le',), key + (bound,))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = format_labels(self.labels, key)
+            lines.append(f'{self.name}_sum{labels} {counts[-1]}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+def endpoint_name(url: str) -> str:
+    """
+    Returns short name of last.fm endpoint for url, for metric labels.
+    """
+    method = re.search(r'method=([\w.]+)', url)
+    if method:
+        return method.group(1)
+    if '/+events' in url:
+        return 'events'
+    return 'other'
+
+
+page_load_seconds = Histogram(
+    'ggb_page_load_seconds', 'One attempt to load last.fm page', ['endpoint']
+)
+lastfm_errors = Counter(
+    'ggb_lastfm_errors_total', 'Last.fm loads failed, by error code', ['code']
+)
+http_cache_lookups = Counter(
+    'ggb_http_cache_lookups_total', 'HTTP cache lookups by result', ['result']
+)
+query_seconds = Histogram(
+    'ggb_query_seconds', 'SQL statement duration by Db method', ['query']
+)
+gigs_prepare_seconds = Histogram(
+    'ggb_gigs_prepare_seconds',
+    'Preparing news for one user, until last part is consumed',
+    ['mode'],
+)
+gigs_job_seconds = Histogram(
+    'ggb_gigs_job_seconds', 'Daily job for one user: prepare and send news'
+)
+semaphore_wait_seconds = Histogram(
+    'ggb_semaphore_wait_seconds', 'Wait to acquire semaphore', ['semaphore']
+)
+semaphore_in_use = Gauge(
+    'ggb_semaphore_in_use', 'Semaphore slots taken now', ['semaphore']
+)
+semaphore_waiting = Gauge(
+    'ggb_semaphore_waiting', 'Tasks waiting for semaphore now', ['semaphore']
+)
+tasks_running = Gauge(
+    'ggb_tasks_running', 'Running news preparations and prefetches', ['kind']
+)
+outbox_depth = Gauge(
+    'ggb_outbox_depth', 'Messages waiting in outbox, at last pass of send queue'
+)
+
+
+@asynccontextmanager
+async def acquire(semaphore: asyncio.Semaphore, name: str) -> AsyncIterator[None]:
+    """
+    Acquire semaphore like "async with semaphore", counting wait time and slots in use.
+    Args:
+        semaphore: semaphore to acquire
+        name: semaphore name for labels
+    """
+    start = time.perf_counter()
+    semaphore_waiting.inc(name)
+    try:
+        await semaphore.acquire()
+    finally:
+        semaphore_waiting.inc(name, amount=-1)
+    try:
+        semaphore_wait_seconds.observe(time.perf_counter() - start, name)
+        semaphore_in_use.inc(name)
+        try:
+            yield
+        finally:
+            semaphore_in_use.inc(name, amount=-1)
+    finally:
+        semaphore.release()
+
+
+def cache_ratios() -> Dict[Tuple[str, ...], float]:
+    """
+    Returns hit ratios of in-memory caches (see cache_service.py) by name.
+    """
+    # pylint: disable=import-outside-toplevel
+    from services.cache_service import caches
+
+    return {
+        (cache.name,): cache.hits / (cache.hits + cache.misses)
+        for cache in caches
+        if cache.hits + cache.misses
+    }
+
+
+cache_hit_ratio = Gauge(
+    'ggb_cache_hit_ratio', 'Hit ratio of in-memory caches', ['cache'], cache_ratios
+)
+
+
+def render_metrics() -> str:
+    """
+    Returns all metrics in Prometheus text format.
+    """
+    parts = []
+    for metric in registry:
+        try:
+            parts.append(metric.render())
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logger.warning('Metric %s not rendered: %s', metric.name, e)
+    return '\n'.join(parts) + '\n'
+
+
+async def handle_scrape(
+    reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+) -> None:
+    """
+    Answer one HTTP request: metrics at /metrics, 404 for other paths.
+    """
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+        while (await asyncio.wait_for(reader.readline(), timeout=5)).strip():
+            pass
+        parts = request_line.decode('latin-1').split()
+        if len(parts) >= 2 and parts[1].split('?')[0] == '/metrics':
+            status = '200 OK'
+            body = render_metrics().encode()
+        else:
+            status = '404 Not Found'
+            body = b'Not found\n'
+        writer.write(
+            f'HTTP/1.1 {status}\r\n'
+            'Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n'
+            f'Content-Length: {len(body)}\r\n'
+            'Connection: close\r\n\r\n'.encode() + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError) as e:
+        logger.debug('Metrics request failed: %s', e)
+    finally:
+        writer.close()
+
+
+async def start_metrics_server(port: int) -> asyncio.AbstractServer:
+    """
+    Start HTTP endpoint with metrics at cfg.METRICS_HOST and port.
+    Args:
+        port: port to listen, cfg.METRICS_PORT for main.py process
+    """
+    server = await asyncio.start_server(handle_scrape, cfg.METRICS_HOST, port)
+    logger.info('Metrics at http://%s:%s/metrics', cfg.METRICS_HOST, port)
+    return server
@@ -14,22 +14,42 @@
 """This file contains functions to access last.fm service, both API and HTTP ways."""
 
 import asyncio
-import html
 import logging
+import multiprocessing
 import os
+import time
 import urllib.parse
-import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta, timezone
-from typing import Dict, List, Optional, Tuple, Union, cast
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 from urllib.error import HTTPError, URLError
-from urllib.request import urlopen
-from xml.etree.ElementTree import Element
+from urllib.request import Request, urlopen
 
 import config as cfg
 from db.db_service import Db
+from services.cache_service import LruCache
 from services.custom_classes import Event
-from services.logger import logger
+from services.http_cache_service import HttpCache, page_digest
+from services.logger import apply_log_levels, logger
 from services.message_service import i34g
+from services.metrics_service import (
+    endpoint_name,
+    http_cache_lookups,
+    lastfm_errors,
+    page_load_seconds,
+)
+from services.parsers import (
+    events_section_digest,
+    parse_events_page,
+    parse_scrobbles_page,
+)
+from services.progress_service import Progress
+from services.retry_service import (
+    RETRYABLE_CODES,
+    CircuitBreaker,
+    backoff_delay,
+    parse_retry_after,
+)
 from services.timeconv_service import text_to_date, unix_to_text
 from ui.error_builder import error_text
 
@@ -40,34 +60,41 @@ logger.setLevel(logging.DEBUG)
 api_key = os.environ["API_KEY"]
 
 db = Db()
+http_cache = HttpCache()
+lastfm_breaker = CircuitBreaker('last.fm')
+
+#  Results of check_valid_lfm(), {lfm: (expire monotonic time, error code or 0)}.
+lfm_check_cache = LruCache('lfm_check', cfg.QTY_CACHED_LFM_CHECKS)
 
 
 async def check_valid_lfm(lfm: str, user_id: int) -> Tuple[bool, str]:
     """
-    Check if lastfm account is valid and notprivate
+    Check if lastfm account is valid and notprivate. Loads the same first page of
+    scrobbles as initial sync will, so with cfg.HTTP_CACHE the page is reused by
+    parser_scrobbles() right after. Result is cached for a while: lfm_check_cache.
     Args:
         lfm: last.fm account to check
     Returns:
         tuple with bool and string: (valid or not, error text)
     # TODO UnicodeEncodeError when non-unicode characters in nickname
     """
-    lfm_quoted = artist_at_url(name_to_url=lfm)
-    if lfm == lfm_quoted:
-        lfm_api_url = await i34g(
-            'parse_services.getrecenttracks',
-            limit=10,
-            lfm_noalarm=lfm_quoted,
-            page=1,
-            from_unix=0,
-            api_key=api_key,
-            locale=cfg.LOCALE_TECHNICAL_STORE,
-        )
-        loaded_page = page_loader(lfm_api_url)
+    cached = lfm_check_cache.get(lfm)
+    if cached and cached[0] > time.monotonic():
+        logger.debug('Validity of %s from cache: %s', lfm, cached[1])
+        checked_code = cached[1]
+    elif lfm == artist_at_url(name_to_url=lfm):
+        loaded_page = await page_loader_async(await scrobbles_url(user_id, lfm, 1))
+        checked_code = loaded_page if isinstance(loaded_page, int) else 0
+        if checked_code == 0:
+            lfm_check_cache.put(lfm, (time.monotonic() + cfg.SEC_LFM_VALID_TTL, 0))
+        elif checked_code in (403, 404):
+            expire = time.monotonic() + cfg.SEC_LFM_INVALID_TTL
+            lfm_check_cache.put(lfm, (expire, checked_code))
     else:
-        loaded_page = int(93)
+        checked_code = int(93)
     return (
-        (False, await error_text(loaded_page, lfm, user_id=user_id))
-        if isinstance(loaded_page, int)
+        (False, await error_text(checked_code, lfm, user_id=user_id))
+        if checked_code
         else (True, '')
     )
 
@@ -139,11 +166,33 @@ async def load_scr_moment(user_id: int, lfm: str) -> int:
     return from_unix
 
 
-async def parser_scrobbles(user_id: int, lfm: str) -> Union[int, Dict]:
+async def scrobbles_url(user_id: int, lfm: str, page: int) -> str:
+    """
+    Returns url of scrobbles page to load, from load_scr_moment() moment.
+    Args:
+        user_id: Tg user_id field
+        lfm: lastfm username
+        page: page number, from 1
+    """
+    return await i34g(
+        'parse_services.getrecenttracks',
+        limit=cfg.QTY_SCROBBLES_XML,
+        lfm_noalarm=artist_at_url(name_to_url=lfm),
+        page=page,
+        from_unix=await load_scr_moment(user_id, lfm),
+        api_key=api_key,
+        locale=cfg.LOCALE_TECHNICAL_STORE,
+    )
+
+
+async def parser_scrobbles(
+    user_id: int, lfm: str, progress: Optional[Progress] = None
+) -> Union[int, Dict]:
     """
     Obtain scrobbles for last time, from load_scr_moment() moment.
     Args:
         lfm: lastfm username
+        progress: counters to update with loaded pages, if any
     Returns:
         Dict with structure {artist_name: {date:count} } if there is events, or empty
         dict, or int with error code.
@@ -152,73 +201,199 @@ async def parser_scrobbles(user_id: int, lfm: str) -> Union[int, Dict]:
     artist_dict = {}
 
     while current_page <= total_pages:
-        lfm_url = await i34g(
-            'parse_services.getrecenttracks',
-            limit=cfg.QTY_SCROBBLES_XML,
-            lfm_noalarm=artist_at_url(name_to_url=lfm),
-            page=current_page,
-            from_unix=await load_scr_moment(user_id, lfm),
-            api_key=api_key,
-            locale=cfg.LOCALE_TECHNICAL_STORE,
-        )
-        xml = page_loader(url=lfm_url)
+        lfm_url = await scrobbles_url(user_id, lfm, current_page)
+        xml = await page_loader_async(url=lfm_url)
         await asyncio.sleep(cfg.SECONDS_SLEEP_XMLLOAD)
         if isinstance(xml, int):
             return xml
 
-        root = ET.fromstring(xml)
+        total_pages_xml, tracks_qty, page_dict = await run_parser(
+            parse_scrobbles_page, xml, lfm_url
+        )
         if current_page == 1:
-            total_pages_xml = root[0].get("totalPages")
-            total_pages = min(100, int(cast(int, total_pages_xml)))
+            total_pages = min(100, total_pages_xml)
             logger.info(
                 "Parser will load %s XMLs for user_id: %s, lfm: %s",
                 total_pages,
                 user_id,
                 lfm,
             )
+            if progress:
+                await progress.update(pages_total=total_pages)
+        if progress:
+            await progress.update(pages_loaded=1)
 
-        tracks = root[0].findall("track")
-        if not tracks:
+        if not tracks_qty:
             return {}
 
-        for track in root[0].findall("track"):
-            if not track.attrib.get("nowplaying") == "true":
-                track_element = track.find("artist")
-                assert isinstance(track_element, Element)
-                assert isinstance(track_element.text, str)
-                artist = html.unescape(track_element.text)
-                date_element = track.find("date")
-                assert isinstance(date_element, Element)
-                assert isinstance(date_element.text, str)
-                date = date_element.text.split(",")[0]
-                if not isinstance(artist_dict.get(artist), dict):
-                    artist_dict[artist] = {}
-                artist_dict[artist][date] = artist_dict[artist].get(date, 0) + 1
+        for artist, dates in page_dict.items():
+            if not isinstance(artist_dict.get(artist), dict):
+                artist_dict[artist] = {}
+            for date, count in dates.items():
+                artist_dict[artist][date] = artist_dict[artist].get(date, 0) + count
         current_page += 1
     logger.info("All XMLs are loaded for user_id %s, lfm %s", user_id, lfm)
     return artist_dict
 
 
-def page_loader(url: str) -> Union[int, str]:
+def page_loader(url: str) -> Tuple[Union[int, str], float]:
     """
-    Load pages at url.
+    Load pages at url, one attempt. If cfg.HTTP_CACHE, page fresh in cache is returned
+    without request, and stale one is revalidated with If-None-Match/If-Modified-Since.
     Args:
         url
     Returns:
-        page text OR integer error code given by urlopen OR 90
+        tuple with: page text OR integer error code given by urlopen OR 90-92, and
+        seconds from Retry-After header (0 if none)
         #TODO alarm admin about these
     """
+    cached = http_cache.get(url) if cfg.HTTP_CACHE else None
+    if cached and cached.fresh:
+        logger.debug("URL from cache: ...%s", url[-95:])
+        http_cache_lookups.inc('fresh')
+        return cached.body, 0
+    if cfg.HTTP_CACHE:
+        http_cache_lookups.inc('stale' if cached else 'miss')
+    headers: Dict[str, str] = {}
+    if cached and cached.etag:
+        headers['If-None-Match'] = cached.etag
+    if cached and cached.last_modified:
+        headers['If-Modified-Since'] = cached.last_modified
     try:
-        with urlopen(url) as page_bytes:
+        with urlopen(Request(url, headers=headers)) as page_bytes:
             page_text = page_bytes.read().decode()
+            response_headers = dict(page_bytes.headers.items())
     except HTTPError as e:
-        return e.code if isinstance(e.code, int) else int(90)
+        if e.code == 304 and cached:
+            http_cache.touch(url)
+            logger.debug("URL not modified: ...%s", url[-95:])
+            return cached.body, 0
+        retry_after = parse_retry_after(
+            e.headers.get('Retry-After') if e.headers else None
+        )
+        return (e.code if isinstance(e.code, int) else int(90)), retry_after
     except URLError:
-        return int(91)
+        return int(91), 0
     except OSError:
-        return int(92)
+        return int(92), 0
     logger.debug("URL loaded: ...%s", url[-95:])
-    return page_text
+    if cfg.HTTP_CACHE:
+        http_cache.put(url, page_text, response_headers)
+    return page_text, 0
+
+
+async def page_loader_async(url: str) -> Union[int, str]:
+    """
+    Load page with page_loader() in default thread pool executor, so event loop is free
+    while page loads, and several pages (i.e. user's lfm accounts) can be loaded
+    concurrently. At temporary errors (RETRYABLE_CODES) retries up to
+    cfg.QTY_FETCH_ATTEMPTS times with jittered exponential backoff, respecting
+    Retry-After. All loads wait while lastfm_breaker is open.
+    Args:
+        url
+    Returns:
+        page text OR integer error code of last attempt, see page_loader()
+    """
+    loop = asyncio.get_running_loop()
+    attempt = 0
+    while True:
+        probe = await lastfm_breaker.wait()
+        attempt += 1
+        with page_load_seconds.time(endpoint_name(url)):
+            page, retry_after = await loop.run_in_executor(None, page_loader, url)
+        if isinstance(page, int):
+            lastfm_errors.inc(str(page))
+        failed = isinstance(page, int) and page in RETRYABLE_CODES
+        lastfm_breaker.record(success=not failed, probe=probe)
+        if not failed or attempt >= cfg.QTY_FETCH_ATTEMPTS:
+            return page
+        delay = backoff_delay(attempt, retry_after)
+        logger.info(
+            'Error %s at attempt %s, retry in %.1f s: ...%s',
+            page,
+            attempt,
+            delay,
+            url[-95:],
+        )
+        await asyncio.sleep(delay)
+
+
+def init_parse_process() -> None:
+    """
+    Runs in each parsing process at start. Unpickling it imports this module, so
+    loggers of parsers exist when levels from config are set.
+    """
+    apply_log_levels()
+
+
+class ParsePool:
+    """
+    Process pool for parsing, if cfg.PARSE_IN_PROCESSES. Started and stopped along
+    with application (see post_init() in main.py and start_worker()), not at first
+    use, not to leave processes behind. Processes are spawned, not forked: fork of
+    process with running event loop and threads is not safe.
+    """
+
+    def __init__(self) -> None:
+        self.executor: Optional[ProcessPoolExecutor] = None
+
+    def start(self) -> None:
+        """
+        Start processes, if cfg.PARSE_IN_PROCESSES and not started yet.
+        """
+        if not cfg.PARSE_IN_PROCESSES or self.executor is not None:
+            return None
+        logger.info('Starting %s parsing processes', cfg.MAX_PARSE_PROCESSES)
+        self.executor = ProcessPoolExecutor(
+            max_workers=cfg.MAX_PARSE_PROCESSES,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_parse_process,
+        )
+        return None
+
+    def stop(self) -> None:
+        """
+        Wait for parsing in progress and stop processes, if started.
+        """
+        if self.executor is None:
+            return None
+        self.executor.shutdown()
+        self.executor = None
+        logger.info('Parsing processes stopped')
+        return None
+
+
+parse_pool = ParsePool()
+
+
+async def run_parser(parse_func: Callable, page: str, url: Optional[str] = None) -> Any:
+    """
+    Run pure parsing function from parsers.py for page text. If parse_pool is started,
+    page is sent to process pool and only compact parsed result comes back, so event
+    loop is not blocked by CPU work. Otherwise parsed right here, as before. If url
+    given and cfg.HTTP_CACHE, result is saved along with cached page, and parsing of
+    the same page version (fresh in cache or not modified) is skipped.
+    Args:
+        parse_func: function from parsers.py
+        page: page text
+        url: url page was loaded from
+    Returns:
+        result of parse_func, with lists instead of tuples if taken from cache
+    """
+    digest = ''
+    if url and cfg.HTTP_CACHE:
+        digest = page_digest(page)
+        parsed = http_cache.get_parsed(url, parse_func.__name__, digest)
+        if parsed is not None:
+            return parsed
+    if parse_pool.executor is None:
+        parsed = parse_func(page)
+    else:
+        loop = asyncio.get_running_loop()
+        parsed = await loop.run_in_executor(parse_pool.executor, parse_func, page)
+    if url and digest:
+        http_cache.put_parsed(url, parse_func.__name__, digest, parsed)
+    return parsed
 
 
 def artist_at_url(name_to_url: str) -> str:
@@ -233,57 +408,46 @@ def artist_at_url(name_to_url: str) -> str:
     return urllib.parse.quote(name_to_url, safe='')
 
 
-async def parser_event(art_name: str) -> Union[int, List[Event]]:
+async def parser_event(
+    art_name: str, known_digest: Optional[str] = None
+) -> Union[int, Tuple[str, Optional[List[Event]]]]:
     """
-    Load event pages and parse html file. Return list of Event objects or int if
-
+    Load event pages and parse html file. If events part of page is the same as at
+    last check (see events_section_digest()), page is not parsed.
     Args:
         art_name: artist name to load events for
+        known_digest: digest of events part of page at last check, if any
     Returns:
-        list of Events objects of integer with error
+        integer with error, or tuple with digest of events part of page and list of
+        Events objects. List is None if digest equals known_digest.
     """
     url = await i34g(
         'parse_services.lastfmeventurl',
         artist=artist_at_url(art_name),
         locale=cfg.LOCALE_TECHNICAL_STORE,
     )
-    page = page_loader(url)
+    page = await page_loader_async(url)
 
     await asyncio.sleep(cfg.SECONDS_SLEEP_HTMLLOAD)
     if isinstance(page, int):
         return page
 
-    iterator = iter(page.splitlines())
-    line = next(iterator)
-    events = []
-    try:
-        while 'class="header-new-title" itemprop="name">' not in line:
-            line = next(iterator)
-        for _ in range(0, 1000):
-            while 'class="events-list-item-date"' not in line:
-                line = next(iterator)
-            event_date = line.split('"')[5][:10]
-            while 'class="events-list-item-venue--title"' not in line:
-                line = next(iterator)
-            line = next(iterator)
-            event_venue = html.unescape(line.strip())
-            while 'class="events-list-item-venue--address"' not in line:
-                line = next(iterator)
-            line = next(iterator)
-            event_address = line.strip()
-            event_city = html.unescape(event_address.rsplit(",", maxsplit=1)[0])
-            event_country = html.unescape(event_address.rsplit(", ", maxsplit=1)[1])
-            events.append(
-                Event(
-                    place=event_venue,
-                    locality=event_city,
-                    country=event_country,
-                    event_date=event_date,
-                    event_source='lastfm',
-                    link=url,
-                    lineup=[art_name],
-                )
-            )
-    except StopIteration:
-        logger.debug('Parsed event page for %s', art_name)
-    return events
+    digest = events_section_digest(page)
+    if digest == known_digest:
+        logger.debug('Events not changed for %s', art_name)
+        return digest, None
+    parsed = await run_parser(parse_events_page, page, url)
+    events = [
+        Event(
+            place=event_venue,
+            locality=event_city,
+            country=event_country,
+            event_date=event_date,
+            event_source='lastfm',
+            link=url,
+            lineup=[art_name],
+        )
+        for event_date, event_venue, event_city, event_country in parsed
+    ]
+    logger.debug('Parsed event page for %s', art_name)
+    return digest, events
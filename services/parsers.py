@@ -0,0 +1,108 @@
+# Green Grass Bot — Ties the music you're listening to with the concert it's playing at.
+# Copyright (C) 2021-2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""This file contains pure parsing functions for last.fm pages. They don't touch db,
+i18n, network or config, and return compact builtin types, so they can run in worker
+processes (see run_parser() in parse_services.py)."""
+
+import hashlib
+import html
+import xml.etree.ElementTree as ET
+from typing import Dict, List, Tuple
+from xml.etree.ElementTree import Element
+
+
+def parse_scrobbles_page(xml: str) -> Tuple[int, int, Dict[str, Dict[str, int]]]:
+    """
+    Parse one page of user.getrecenttracks XML answer.
+    Args:
+        xml: page text
+    Returns:
+        tuple with: total pages quantity, tracks quantity on page (including now
+        playing), dict with structure {artist_name: {date:count} }
+    """
+    root = ET.fromstring(xml)
+    total_pages = int(root[0].get("totalPages", 0))
+    tracks = root[0].findall("track")
+    artist_dict: Dict[str, Dict[str, int]] = {}
+    for track in tracks:
+        if not track.attrib.get("nowplaying") == "true":
+            track_element = track.find("artist")
+            assert isinstance(track_element, Element)
+            assert isinstance(track_element.text, str)
+            artist = html.unescape(track_element.text)
+            date_element = track.find("date")
+            assert isinstance(date_element, Element)
+            assert isinstance(date_element.text, str)
+            date = date_element.text.split(",")[0]
+            if not isinstance(artist_dict.get(artist), dict):
+                artist_dict[artist] = {}
+            artist_dict[artist][date] = artist_dict[artist].get(date, 0) + 1
+    return total_pages, len(tracks), artist_dict
+
+
+def parse_events_page(page: str) -> List[Tuple[str, str, str, str]]:
+    """
+    Parse artist's /+events HTML page.
+    Args:
+        page: page text
+    Returns:
+        list of tuples (event_date, place, locality, country)
+    """
+    iterator = iter(page.splitlines())
+    events = []
+    try:
+        line = next(iterator)
+        while 'class="header-new-title" itemprop="name">' not in line:
+            line = next(iterator)
+        for _ in range(0, 1000):
+            while 'class="events-list-item-date"' not in line:
+                line = next(iterator)
+            event_date = line.split('"')[5][:10]
+            while 'class="events-list-item-venue--title"' not in line:
+                line = next(iterator)
+            line = next(iterator)
+            event_venue = html.unescape(line.strip())
+            while 'class="events-list-item-venue--address"' not in line:
+                line = next(iterator)
+            line = next(iterator)
+            event_address = line.strip()
+            event_city = html.unescape(event_address.rsplit(",", maxsplit=1)[0])
+            event_country = html.unescape(event_address.rsplit(", ", maxsplit=1)[1])
+            events.append((event_date, event_venue, event_city, event_country))
+    except StopIteration:
+        pass
+    return events
+
+
+def events_section_digest(page: str) -> str:
+    """
+    Calculate digest of artist's /+events HTML page part with events, from artist name
+    to the last event's address. Rest of page (ads, tokens, counters) changes all the
+    time and is ignored. Cheap: no parsing, just search of borders.
+    Args:
+        page: page text
+    Returns:
+        hex digest
+    """
+    start = page.find('class="header-new-title" itemprop="name">')
+    end = page.rfind('class="events-list-item-venue--address"')
+    if start < 0:
+        section = ''
+    elif end < start:
+        section = page[start : page.find('\n', start)]
+    else:
+        #  Include address line, it is the next after marker
+        end = page.find('\n', page.find('\n', end) + 1)
+        section = page[start:end] if end > 0 else page[start:]
+    return hashlib.sha1(section.encode()).hexdigest()
@@ -0,0 +1,82 @@
+# Green Grass Bot — Ties the music you're listening to with the concert it's playing at.
+# Copyright (C) 2021-2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""This file contains progress counters of news preparation, shown to user."""
+
+import logging
+import time
+from typing import Awaitable, Callable
+
+import config as cfg
+from services.logger import logger
+
+logger = logging.getLogger('A.pro')
+logger.setLevel(logging.DEBUG)
+
+
+class Progress:
+    """
+    Counters of news preparation for one user, updated by parser_scrobbles() and
+    filter_artists(). Report callback (i.e. "please wait" message edit) is called not
+    more often than once in cfg.SEC_PROGRESS_EDIT.
+    """
+
+    def __init__(self, report: Callable[['Progress'], Awaitable[None]]) -> None:
+        """
+        Args:
+            report: coroutine function to show progress, gets this object
+        """
+        self.report = report
+        self.pages_loaded = 0
+        self.pages_total = 0
+        self.arts_checked = 0
+        self.arts_total = 0
+        self.last_report = time.monotonic()
+
+    async def update(
+        self,
+        pages_loaded: int = 0,
+        pages_total: int = 0,
+        arts_checked: int = 0,
+        arts_total: int = 0,
+    ) -> None:
+        """
+        Add to counters and report, if it was not reported recently.
+        Args:
+            pages_loaded: scrobble pages loaded
+            pages_total: scrobble pages to load
+            arts_checked: artists filtered
+            arts_total: artists to filter
+        """
+        self.pages_loaded += pages_loaded
+        self.pages_total += pages_total
+        self.arts_checked += arts_checked
+        self.arts_total += arts_total
+        if time.monotonic() - self.last_report >= cfg.SEC_PROGRESS_EDIT:
+            await self.force_report()
+        return None
+
+    async def force_report(self) -> None:
+        """
+        Report current counters now.
+        """
+        self.last_report = time.monotonic()
+        logger.debug(
+            'Progress: pages %s/%s, artists %s/%s',
+            self.pages_loaded,
+            self.pages_total,
+            self.arts_checked,
+            self.arts_total,
+        )
+        await self.report(self)
+        return None
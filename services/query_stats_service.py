@@ -0,0 +1,205 @@
+# Green Grass Bot — Ties the music you're listening to with the concert it's playing at.
+# Copyright (C) 2021-2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""This file contains statistics of sql statements, collected by run_statement() of
+db/sql_service.py: duration for query_seconds metric and, if cfg.DB_PROFILING, totals
+and query plans shown to developer with /dbstats."""
+
+import html
+import inspect
+import logging
+import re
+import sqlite3
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from telegram.constants import MessageLimit
+
+import config as cfg
+from services.logger import logger
+from services.metrics_service import query_seconds
+
+logger = logging.getLogger('A.qst')
+logger.setLevel(logging.DEBUG)
+
+
+#  List of placeholders in IN (...), which length differs from call to call.
+PLACEHOLDERS_LIST = re.compile(r'IN \(\s*(?::\w+|\?)(?:\s*,\s*(?::\w+|\?))*\s*\)')
+
+
+def normalize_sql(query: str) -> str:
+    """
+    Returns query with collapsed whitespace and placeholders lists, so one statement
+    has one text whatever its params.
+    """
+    return PLACEHOLDERS_LIST.sub('IN (...)', re.sub(r'\s+', ' ', query).strip())
+
+
+@dataclass
+class Statement:
+    """
+    Class for keeping sql statement to execute.
+    Args:
+        name: statement name, i.e. name of Db method
+        query: sql
+        params: parameters of sql, list of them if many
+        many: if True, statement is executed with executemany()
+    """
+
+    name: str
+    query: str
+    params: Any
+    many: bool = False
+
+
+@dataclass
+class StatementStats:
+    """
+    Totals of one statement of one Db method. Durations are in seconds.
+    """
+
+    name: str
+    sql: str
+    calls: int = 0
+    rows: int = 0
+    total: float = 0.0
+    max: float = 0.0
+    slow: int = 0
+
+    @property
+    def mean(self) -> float:
+        """
+        Mean duration of call.
+        """
+        return self.total / self.calls if self.calls else 0.0
+
+
+class QueryStats:
+    """
+    Statements statistics of this process, by (Db method name, normalized sql): method
+    may run several statements. Statements slower than cfg.MS_SLOW_QUERY are logged,
+    and query plan is saved for the slowest call of each.
+    """
+
+    def __init__(self) -> None:
+        self.statements: Dict[Tuple[str, str], StatementStats] = {}
+        #  Query plans of the slowest calls, by the same keys
+        self.plans: Dict[Tuple[str, str], str] = {}
+
+    def record(
+        self, con: sqlite3.Connection, statement: Statement, seconds: float, rows: int
+    ) -> None:
+        """
+        Count executed statement.
+        Args:
+            con: connection statement was executed with, to explain slow one
+            statement: executed statement
+            seconds: duration of execute and fetch
+            rows: quantity of rows fetched or affected
+        """
+        key = (statement.name, normalize_sql(statement.query))
+        stats = self.statements.get(key)
+        if stats is None:
+            stats = StatementStats(*key)
+            self.statements[key] = stats
+        stats.calls += 1
+        stats.rows += rows
+        stats.total += seconds
+        if seconds * 1000 < cfg.MS_SLOW_QUERY:
+            stats.max = max(stats.max, seconds)
+            return None
+        stats.slow += 1
+        #  Statement of executemany() is explained with its first parameters
+        params = statement.params
+        if statement.many:
+            params = params[0] if params else ()
+        logger.warning(
+            'Slow query %s: %.0f ms, %s rows, params: %s',
+            statement.name,
+            seconds * 1000,
+            rows,
+            str(params)[:200],
+        )
+        if seconds > stats.max:
+            stats.max = seconds
+            plan = explain(con, statement.query, params)
+            if plan:
+                self.plans[key] = plan
+                logger.info('Query plan of %s: %s', statement.name, plan)
+        return None
+
+    def top(self, qty: int) -> List[StatementStats]:
+        """
+        Returns qty statements with the longest max duration.
+        """
+        return sorted(self.statements.values(), key=lambda stats: -stats.max)[:qty]
+
+    def report(self, qty: int) -> str:
+        """
+        Returns HTML text with qty slowest statements, for /dbstats.
+        """
+        if not self.statements:
+            return 'No statements recorded. Is DB_PROFILING on?'
+        text = f'<b>Top {qty} slowest of {len(self.statements)} statements</b>\n'
+        for stats in self.top(qty):
+            part = (
+                f'\n<b>{stats.name}</b>: max {stats.max * 1000:.1f} ms, '
+                f'mean {stats.mean * 1000:.1f} ms, {stats.calls} calls, '
+                f'{stats.slow} slow, {stats.rows / stats.calls:.1f} rows per call\n'
+                f'<code>{html.escape(stats.sql[:150])}</code>\n'
+            )
+            plan = self.plans.get((stats.name, stats.sql))
+            if plan:
+                part += f'<pre>{html.escape(plan)}</pre>\n'
+            if len(text) + len(part) > MessageLimit.MAX_TEXT_LENGTH:
+                break
+            text += part
+        return text
+
+
+def explain(con: sqlite3.Connection, query: str, params: Any) -> Optional[str]:
+    """
+    Returns EXPLAIN QUERY PLAN of query as text, one step per line, or None if query
+    can't be explained (i.e. DDL).
+    """
+    try:
+        steps = con.execute(f'EXPLAIN QUERY PLAN {query}', params).fetchall()
+    except sqlite3.Error as e:
+        logger.debug('Query not explained: %s', e)
+        return None
+    return '\n'.join(str(step[-1]) for step in steps) or None
+
+
+query_stats = QueryStats()
+
+
+def caller_name() -> str:
+    """
+    Returns name of Db method (or function) which called execute_query(), to name its
+    statement in metrics and statistics.
+    """
+    frame = inspect.currentframe()
+    caller = frame.f_back.f_back if frame and frame.f_back else None
+    return caller.f_code.co_name if caller else 'unknown'
+
+
+def observe_statement(
+    con: sqlite3.Connection, statement: Statement, seconds: float, rows: int
+) -> None:
+    """
+    Count executed statement in query_seconds metric and, if cfg.DB_PROFILING, in
+    query_stats. Arguments are the same as of QueryStats.record().
+    """
+    query_seconds.observe(seconds, statement.name)
+    if cfg.DB_PROFILING:
+        query_stats.record(con, statement, seconds, rows)
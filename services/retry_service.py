@@ -0,0 +1,149 @@
+# Green Grass Bot — Ties the music you're listening to with the concert it's playing at.
+# Copyright (C) 2021-2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""This file contains retry policy and circuit breaker for last.fm page loads."""
+
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Deque, Optional
+
+import config as cfg
+from services.logger import logger
+
+logger = logging.getLogger('A.ret')
+logger.setLevel(logging.DEBUG)
+
+#  Error codes of page_loader() worth to retry: rate limit, server and network errors.
+RETRYABLE_CODES = {429, 500, 502, 503, 504, 91, 92}
+
+
+def parse_retry_after(value: Optional[str]) -> float:
+    """
+    Convert Retry-After header to seconds.
+    Args:
+        value: header value, seconds or HTTP-date
+    Returns:
+        seconds to wait, 0 if header absent or malformed
+    """
+    if not value:
+        return 0
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        moment = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return 0
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return max(0.0, (moment - datetime.now(timezone.utc)).total_seconds())
+
+
+def backoff_delay(attempt: int, retry_after: float = 0) -> float:
+    """
+    Calculate delay before next attempt: exponential with full jitter, but not less
+    than server asked in Retry-After. Both limited by cfg.SEC_BACKOFF_MAX.
+    Args:
+        attempt: number of failed attempt, from 1
+        retry_after: seconds from Retry-After header
+    """
+    exponential = min(cfg.SEC_BACKOFF_MAX, cfg.SEC_BACKOFF_BASE * 2 ** (attempt - 1))
+    return min(cfg.SEC_BACKOFF_MAX, max(retry_after, random.uniform(0, exponential)))
+
+
+class CircuitBreaker:
+    """
+    Shared by all loads of one process. Keeps results of last cfg.QTY_BREAKER_WINDOW
+    loads. When share of failed is at least cfg.BREAKER_ERROR_RATE, breaker opens and
+    all loads wait cfg.SEC_BREAKER_PAUSE. Then one probe load goes; breaker closes if
+    it succeeds and opens again if not. Probe is known by token given by wait(), so
+    loads started before breaker opened and finished late don't count as probe. Not
+    thread-safe, should be used from event loop only.
+    """
+
+    def __init__(self, name: str) -> None:
+        """
+        Args:
+            name: breaker name, for logging
+        """
+        self.name = name
+        self.results: Deque[bool] = deque(maxlen=cfg.QTY_BREAKER_WINDOW)
+        self.open_until = 0.0
+        #  Token of current probe load, 0 if no probe is going
+        self.probe = 0
+        self.probes_issued = 0
+
+    @property
+    def is_open(self) -> bool:
+        """
+        True if breaker is open: loads wait, except probe.
+        """
+        return self.open_until > 0
+
+    async def wait(self) -> int:
+        """
+        Wait until load is allowed. Returns at once if breaker is closed.
+        Returns:
+            probe token to pass to record() if this load is the probe, otherwise 0
+        """
+        while self.is_open:
+            pause = self.open_until - time.monotonic()
+            if pause <= 0:
+                #  Others wait for probe result. If probe is lost (i.e. task
+                #  cancelled), next waiter will be the probe after one more pause.
+                self.open_until = time.monotonic() + cfg.SEC_BREAKER_PAUSE
+                self.probes_issued += 1
+                self.probe = self.probes_issued
+                logger.info('Breaker %s: probe load', self.name)
+                return self.probe
+            await asyncio.sleep(pause)
+        return 0
+
+    def record(self, success: bool, probe: int = 0) -> None:
+        """
+        Save result of load and open or close breaker.
+        Args:
+            success: False if load failed with one of RETRYABLE_CODES
+            probe: token returned by wait() for this load
+        """
+        if probe and probe == self.probe:
+            self.probe = 0
+            if success:
+                self.results.clear()
+                self.open_until = 0
+                logger.info('Breaker %s closed', self.name)
+            else:
+                self.open(reason='probe failed')
+            return None
+        if self.is_open:
+            #  Load started before breaker opened, or lost probe: result is stale
+            return None
+        self.results.append(success)
+        failed = self.results.count(False)
+        full = len(self.results) == self.results.maxlen
+        if full and failed >= cfg.BREAKER_ERROR_RATE * len(self.results):
+            self.open(reason=f'{failed} of {len(self.results)} loads failed')
+        return None
+
+    def open(self, reason: str) -> None:
+        """
+        Pause all loads for cfg.SEC_BREAKER_PAUSE.
+        """
+        self.open_until = time.monotonic() + cfg.SEC_BREAKER_PAUSE
+        logger.warning(
+            'Breaker %s opened for %s s: %s', self.name, cfg.SEC_BREAKER_PAUSE, reason
+        )
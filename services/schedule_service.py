@@ -48,13 +48,17 @@ def run_daily_job(
     user_id: int, chat_id: int, job_src: Union[CallbackContext, Application]
 ) -> None:
     """
-    Add job getgigs_job to scheduler.
+    Add job getgigs_job to scheduler. Not needed if worker processes run daily jobs
+    from jobs table (cfg.WORKERS_QTY > 0).
     Args:
         user_id: Tg field user_id
         chat_id: Tg field chat_id
         job_src: object with "current_jobs" method to obtain current jobs
     """
     logger.debug('Entered to run_daily_job() for: %s, %s', user_id, chat_id)
+    if cfg.WORKERS_QTY:
+        logger.debug('Job is left to worker processes: %s, %s', user_id, chat_id)
+        return None
     queue = job_src.job_queue
     if isinstance(queue, JobQueue):
         queue.run_daily(
@@ -67,6 +71,7 @@ def run_daily_job(
         )
     else:
         logger.warning('Can not access JobQueue. Something wrong')
+    return None
 
 
 async def add_daily(update: Update, context: CallbackContext) -> int:
@@ -0,0 +1,181 @@
+# Green Grass Bot — Ties the music you're listening to with the concert it's playing at.
+# Copyright (C) 2021-2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""This file contains outbound queue of not interactive messages (daily news, error
+reports). Messages are saved to outbox table first and sent by one task of main.py
+process, with respect to Tg flood limits. Unsent messages survive restart. Delivery
+is at-least-once: message is deleted from outbox after it is sent, so if process stops
+in between, message is sent again after restart."""
+
+import asyncio
+import logging
+import time
+from typing import Dict, Optional, Set
+
+from telegram import Bot
+from telegram.constants import ParseMode
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+from telegram.ext import Application
+
+import config as cfg
+from db.db_service import Db
+from db.queues_service import dsql_outbox
+from services.custom_classes import OutboxMessage
+from services.logger import logger
+from services.metrics_service import outbox_depth
+
+db = Db()
+
+logger = logging.getLogger('A.snd')
+logger.setLevel(logging.DEBUG)
+
+
+class SendQueue:
+    """
+    Sender of outbox messages. Keeps not more than cfg.MSG_PER_SEC_GLOBAL messages per
+    second in total and one message per cfg.SEC_PER_MSG_CHAT to each chat. On
+    RetryAfter all sending is paused for time asked by Tg, message stays in outbox.
+    Messages to one chat are sent in order they were put.
+    """
+
+    def __init__(self) -> None:
+        self.next_global = 0.0
+        self.next_chat: Dict[int, float] = {}
+        self.wakeup: Optional[asyncio.Event] = None
+
+    async def put(
+        self, chat_id: int, text: str, parse_mode: str = ParseMode.MARKDOWN_V2
+    ) -> None:
+        """
+        Save message to outbox. It is sent by run() of main.py process, so it may be
+        called from worker processes as well.
+        Args:
+            chat_id: Tg chat_id to send to
+            text: message text
+            parse_mode: mode to parse the text
+        """
+        await db.wsql_outbox(chat_id, text, parse_mode)
+        if self.wakeup is not None:
+            self.wakeup.set()
+        return None
+
+    async def run(self, bot: Bot) -> None:
+        """
+        Endless loop: send due messages, then sleep until next message may be sent or
+        new one is put, but not more than cfg.SEC_OUTBOX_POLL (messages from workers).
+        """
+        self.wakeup = asyncio.Event()
+        logger.info('Send queue started')
+        while True:
+            try:
+                pause = await self.send_due(bot)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                logger.warning('Send queue error: %s', e)
+                pause = cfg.SEC_OUTBOX_POLL
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=pause)
+            except asyncio.TimeoutError:
+                pass
+
+    async def send_due(self, bot: Bot) -> float:
+        """
+        One pass over oldest cfg.QTY_OUTBOX_BATCH messages of outbox.
+        Returns:
+            seconds to wait before next pass
+        """
+        rows = await db.rsql_outbox(cfg.QTY_OUTBOX_BATCH)
+        if cfg.METRICS:
+            outbox_depth.set(await db.rsql_outbox_depth())
+        if not rows:
+            return cfg.SEC_OUTBOX_POLL
+        held: Set[int] = set()
+        for message in rows:
+            chat_id = message.chat_id
+            if chat_id in held:
+                continue
+            now = time.monotonic()
+            if self.next_chat.get(chat_id, 0) > now:
+                held.add(chat_id)
+                continue
+            if self.next_global > now:
+                await asyncio.sleep(self.next_global - now)
+            self.next_global = time.monotonic() + 1 / cfg.MSG_PER_SEC_GLOBAL
+            if not await self.send_one(bot, message):
+                held.add(chat_id)
+            self.next_chat[chat_id] = time.monotonic() + cfg.SEC_PER_MSG_CHAT
+            if self.next_global - time.monotonic() > 1:
+                #  Flood control: do not wait with rows read before it
+                break
+        now = time.monotonic()
+        self.next_chat = {
+            chat_id: moment
+            for chat_id, moment in self.next_chat.items()
+            if moment > now
+        }
+        pause = self.next_global - now
+        if len(rows) < cfg.QTY_OUTBOX_BATCH:
+            if not held:
+                return cfg.SEC_OUTBOX_POLL
+            #  Only held chats left: wait for the first of them
+            pause = max(pause, min(self.next_chat.get(c, now) for c in held) - now)
+        return max(0.0, pause)
+
+    async def send_one(self, bot: Bot, message: OutboxMessage) -> bool:
+        """
+        Send one message and remove it from outbox, if sent or can't be sent at all.
+        Returns:
+            True if message left outbox
+        """
+        msg_id, chat_id = message.msg_id, message.chat_id
+        try:
+            await bot.send_message(
+                chat_id,
+                message.text,
+                parse_mode=message.parse_mode,
+                disable_web_page_preview=False,
+            )
+        except RetryAfter as e:
+            retry_after = float(e.retry_after)
+            self.next_global = time.monotonic() + retry_after
+            logger.warning('Flood control, sending paused for %s s', retry_after)
+            return False
+        except (Forbidden, BadRequest) as e:
+            #  Retry will not help. BadRequest is subclass of NetworkError, so goes first
+            logger.warning('Message %s to %s dropped: %s', msg_id, chat_id, e)
+        except TelegramError as e:
+            if message.attempts + 1 < cfg.QTY_OUTBOX_ATTEMPTS:
+                logger.info('Message %s to %s not sent: %s', msg_id, chat_id, e)
+                await db.wsql_outbox_attempt(msg_id)
+                return False
+            logger.warning(
+                'Message %s to %s dropped after %s attempts: %s',
+                msg_id,
+                chat_id,
+                cfg.QTY_OUTBOX_ATTEMPTS,
+                e,
+            )
+        await dsql_outbox(db, msg_id)
+        return True
+
+
+send_queue = SendQueue()
+
+
+async def start_send_queue(application: Application) -> None:
+    """
+    Start sending of outbox as application task. Used as post_init of main.py
+    application: only one process should send.
+    """
+    application.create_task(send_queue.run(application.bot))
+    return None
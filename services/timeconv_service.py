@@ -15,6 +15,7 @@
 
 import logging
 from datetime import datetime
+from functools import lru_cache
 
 from services.logger import logger
 
@@ -30,6 +31,9 @@ FORMAT_LFM = '%d %b %Y'
 FORMAT_SQL_DATE = '%Y-%m-%d'
 #  Format to store timestamps in SQL
 FORMAT_SQL_TIMESTAMP = '%Y-%m-%d %H:%M:%S'
+#  How many distinct dates to keep per convertor. Scrobbles and events cover only a
+#  few months, so the set of distinct dates is tiny and strptime() calls are skipped.
+QTY_CACHED_DATES = 1024
 
 
 def timestamp_to_text(timestamp: datetime) -> str:
@@ -44,6 +48,7 @@ def timestamp_to_text(timestamp: datetime) -> str:
     return timestamp.strftime(FORMAT_SQL_TIMESTAMP)
 
 
+@lru_cache(maxsize=QTY_CACHED_DATES)
 def text_to_userdate(text: str) -> str:
     """
     Convertor from SQL-storing format to  for humans. Used
@@ -56,6 +61,7 @@ def text_to_userdate(text: str) -> str:
     return datetime.strptime(text, FORMAT_SQL_DATE).strftime(FORMAT_HUMAN)
 
 
+@lru_cache(maxsize=QTY_CACHED_DATES)
 def lfmdate_to_text(lfmdate: str) -> str:
     """
     Convertor for saving dates from last.fm to SQL. Used when
@@ -68,9 +74,11 @@ def lfmdate_to_text(lfmdate: str) -> str:
     return datetime.strptime(lfmdate, FORMAT_LFM).strftime(FORMAT_SQL_DATE)
 
 
+@lru_cache(maxsize=QTY_CACHED_DATES)
 def text_to_date(text: str) -> datetime:
     """
-    Convertor for saved date in SQL to timestamp
+    Convertor for saved date in SQL to timestamp. Returned datetime is shared between
+    callers through cache, it is immutable so it is safe.
     """
     return datetime.strptime(text, FORMAT_SQL_DATE)
 
@@ -0,0 +1,167 @@
+# Green Grass Bot — Ties the music you're listening to with the concert it's playing at.
+# Copyright (C) 2021-2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""This file contains logic of worker processes running daily jobs (see worker.py)."""
+
+import asyncio
+import logging
+import os
+import socket
+from datetime import datetime, time, timedelta, timezone
+from typing import Optional
+
+from telegram.ext import Application, CallbackContext
+
+import config as cfg
+from commands.getgigs import sem_atjob, send_gigs
+from db.db_service import Db
+from db.queues_service import dsql_joblease
+from services.app_service import app_builder
+from services.logger import logger
+from services.metrics_service import acquire, start_metrics_server
+from services.parse_services import parse_pool
+from services.timeconv_service import FORMAT_SQL_DATE
+
+logger = logging.getLogger('A.wor')
+logger.setLevel(logging.DEBUG)
+
+
+db = Db()
+
+
+def due_run_date(now: Optional[datetime] = None) -> Optional[str]:
+    """
+    Determine which daily run should be executed now. It is the day of last passed
+    cfg.DEFAULT_NOTICE_TIME moment, if it passed not later than misfire_grace_time ago
+    (like APScheduler does with cfg.CRON_JOB_KWARGS).
+    Args:
+        now: moment to check, utcnow by default
+    Returns:
+        run date in FORMAT_SQL_DATE or None if there is no due run
+    """
+    now = now or datetime.now(timezone.utc)
+    notice_time = time.fromisoformat(cfg.DEFAULT_NOTICE_TIME)
+    moment = datetime.combine(now.date(), notice_time, tzinfo=timezone.utc)
+    if now < moment:
+        moment -= timedelta(days=1)
+    grace = timedelta(seconds=cfg.CRON_JOB_KWARGS['misfire_grace_time'])
+    if now - moment > grace:
+        return None
+    return moment.strftime(FORMAT_SQL_DATE)
+
+
+def get_worker_name(index: int) -> str:
+    """
+    Provide unique worker name to write in joblease table.
+    Args:
+        index: worker index
+    """
+    return f'{socket.gethostname()}_{os.getpid()}_{index}'
+
+
+async def run_job(
+    context: CallbackContext, user_id: int, chat_id: int, run_date: str, worker: str
+) -> None:
+    """
+    Claim job and execute it. If other process claimed it already, do nothing. If
+    job fails, it is not marked as done and will be claimed again after lease expired.
+    Args:
+        context: context with bot to send messages with
+        user_id: Tg user_id field
+        chat_id: Tg chat_id field
+        run_date: date of daily run, in FORMAT_SQL_DATE
+        worker: worker name
+    """
+    async with acquire(sem_atjob, 'atjob'):
+        try:
+            if not await db.wsql_joblease(user_id, chat_id, run_date, worker):
+                logger.debug('Job for %s claimed by other worker', user_id)
+                return None
+            await send_gigs(context, user_id, chat_id)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logger.warning('Job for %s failed, will be retried: %s', user_id, e)
+            return None
+        await db.wsql_joblease_done(user_id, chat_id, run_date, worker)
+    return None
+
+
+async def worker_loop(application: Application, index: int, total: int) -> None:
+    """
+    Endless loop of worker: every cfg.SEC_WORKER_POLL seconds takes due jobs of own
+    partition (user_id % total == index) and runs them.
+    Args:
+        application: initialized application, to send messages with its bot
+        index: worker index, from 0 to total-1
+        total: quantity of workers
+    """
+    worker = get_worker_name(index)
+    context = CallbackContext(application)
+    logger.info('Worker %s started, partition %s/%s', worker, index, total)
+    while True:
+        #  Error of one poll, i.e. locked db, should not stop the worker
+        try:
+            await poll_jobs(context, index, total, worker)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logger.error('Worker %s poll failed: %s', worker, e)
+        await asyncio.sleep(cfg.SEC_WORKER_POLL)
+
+
+async def poll_jobs(
+    context: CallbackContext, index: int, total: int, worker: str
+) -> None:
+    """
+    Run due jobs of own partition concurrently and delete old joblease rows.
+    Args:
+        context: context with bot to send messages with
+        index: worker index, from 0 to total-1
+        total: quantity of workers
+        worker: worker name
+    """
+    run_date = due_run_date()
+    if run_date is not None:
+        jobs = await db.rsql_duejobs(run_date, index, total)
+        if jobs:
+            logger.info('Worker %s: %s due jobs', worker, len(jobs))
+        results = await asyncio.gather(
+            *(
+                run_job(context, user_id, chat_id, run_date, worker)
+                for user_id, chat_id in jobs
+            ),
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, BaseException):
+                logger.error('Worker %s job failed: %s', worker, result)
+    deleted = await dsql_joblease(db)
+    if deleted:
+        logger.debug('Deleted %s old joblease rows', deleted)
+
+
+async def start_worker(token: str, index: int, total: int) -> None:
+    """
+    Create application without updater (only front process receives updates) and run
+    worker loop with it.
+    Args:
+        token: Tg bot token
+        index: worker index, from 0 to total-1
+        total: quantity of workers
+    """
+    application = app_builder(token).updater(None).job_queue(None).build()
+    if cfg.METRICS:
+        await start_metrics_server(cfg.METRICS_PORT + 1 + index)
+    parse_pool.start()
+    try:
+        async with application:
+            await worker_loop(application, index, total)
+    finally:
+        parse_pool.stop()
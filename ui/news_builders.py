@@ -13,15 +13,23 @@
 # program.  If not, see <https://www.gnu.org/licenses/>.
 """This file contains fns to build messages for user at /getgigs and /xx commands."""
 
+import asyncio
 import logging
-from typing import Dict, KeysView, List
+import time
+from functools import partial
+from typing import AsyncIterator, Dict, KeysView, List, Optional, Tuple, Union
 
 import config as cfg
 from db.db_service import Db
+from services.cache_service import LruCache
 from services.custom_classes import ArtScrobble
+from services.flight_service import SingleFlight
 from services.logger import logger
-from services.message_service import i34g
+from services.message_service import TextChunker, i34g
+from services.metrics_service import gigs_prepare_seconds
 from services.parse_services import artist_at_url, parser_event, parser_scrobbles
+from services.progress_service import Progress
+from services.retry_service import RETRYABLE_CODES
 from services.timeconv_service import lfmdate_to_text, text_to_userdate
 from ui.error_builder import error_text
 
@@ -31,35 +39,68 @@ logger.setLevel(logging.DEBUG)
 
 db = Db()
 
+details_cache = LruCache('details', cfg.QTY_CACHED_DETAILS)
 
-async def filter_artists(user_id: int, art_names: KeysView) -> List[str]:
+#  Artist scrobbled by several accounts or users at once is loaded once
+events_flights = SingleFlight('events')
+
+
+async def load_events(art_name: str) -> bool:
+    """
+    Load new events of artist from lastfm, save them and mark artist as checked.
+    Args:
+        art_name: artist name
+    Returns:
+        False if events were not loaded because of error
+    """
+    loaded = await parser_event(art_name, await db.rsql_artdigest(art_name))
+    #  Temporary error doesn't count as check, so artist is checked again at next
+    #  run; permanent one does.
+    if isinstance(loaded, int):
+        logger.warning("OOOP! Error %s when load events for %s", loaded, art_name)
+        if loaded not in RETRYABLE_CODES:
+            await db.wsql_artcheck(art_name)
+        return False
+    #  Events are None if page not changed since last check: nothing to write
+    digest, events = loaded
+    #  If events are not saved, neither is digest: otherwise unchanged page would not
+    #  be parsed again and events would be lost
+    if events and not await db.wsql_events_lups(events):
+        return False
+    #  Write timestamp to db, that artist was checked
+    await db.wsql_artcheck(art_name, digest, active=bool(events))
+    return True
+
+
+async def filter_artists(
+    user_id: int, art_names: KeysView, progress: Optional[Progress] = None
+) -> List[str]:
     """
     Takes list of scrobbled artists and filters it to those who match conditions to be
     sent to user: rsql_finalquestion() = 1. But before this, load events from lastfm.
     Args:
         user_id: Tg user_id field
         artists: list of scrobbled artists
+        progress: counters to update with checked artists, if any
     Returns:
         list of artists to sent to user
     """
     filtered = []
+    if progress:
+        await progress.update(arts_total=len(art_names))
     for art_name in art_names:
+        if progress:
+            await progress.update(arts_checked=1)
         #  First, check if we need to load events for the artists
         if await db.rsql_artcheck(user_id, art_name):
             #  Second, load new events
             logger.debug('Will check: %s', art_name)
-            events = await parser_event(art_name)
+            loaded, _ = await events_flights.run(
+                art_name, partial(load_events, art_name)
+            )
             #  At error, go to next artist
-            if isinstance(events, int):
-                logger.warning(
-                    "OOOP! Error %s when load events for %s", events, art_name
-                )
-                await db.wsql_artcheck(art_name)
+            if not loaded:
                 continue
-            #  Write timestamp to db, that artist was checked
-            if events:
-                await db.wsql_events_lups(events)
-            await db.wsql_artcheck(art_name)
         else:
             logger.debug("Won't check: %s", art_name)
         #  For each of artist in origin list, check if it should be sent to user
@@ -97,83 +138,210 @@ async def save_scrobbles(user_id: int, lfm: str, scrobbles_dict: Dict) -> None:
     return None
 
 
-async def prepare_gigs_text(user_id: int, request: bool) -> str:
+async def fetch_filter_acc(
+    user_id: int, acc: str, progress: Optional[Progress] = None
+) -> Tuple[Union[int, Dict], List]:
+    """
+    Load and save scrobbles of one lfm account, then load events and filter artists.
+    Accounts are independent at this step, so it runs concurrently for all of them.
+    Args:
+        user_id: Tg user_id field
+        acc: lastfm username
+        progress: counters to update, if any
+    Returns:
+        tuple with result of parser_scrobbles() and list of filtered artists
+    """
+    scrobbles_dict = await parser_scrobbles(user_id, acc, progress)
+    if not isinstance(scrobbles_dict, dict):
+        return scrobbles_dict, []
+    if len(scrobbles_dict.keys()):
+        await save_scrobbles(user_id, acc, scrobbles_dict)
+    filtered = await filter_artists(user_id, scrobbles_dict.keys(), progress)
+    await db.wsql_useraccs_synced(user_id, acc)
+    return scrobbles_dict, filtered
+
+
+async def stored_filter_acc(user_id: int, acc: str) -> Tuple[Dict, List]:
+    """
+    Same as fetch_filter_acc(), but nothing is loaded from last.fm: artists scrobbled
+    in last DAYS_PERIOD_MINLISTENS days are taken from db and filtered with events
+    already in db.
+    Args:
+        user_id: Tg user_id field
+        acc: lastfm username
+    Returns:
+        tuple with dict {artist_name: {}} of stored artists and list of filtered ones
+    """
+    art_names = await db.rsql_recent_arts(user_id, acc)
+    filtered = [art for art in art_names if await db.rsql_finalquestion(user_id, art)]
+    return {art_name: {} for art_name in art_names}, sorted(filtered)
+
+
+async def assign_shorthands(
+    user_id: int, art_names: List[str], shorthand_count: int
+) -> Tuple[List[str], int]:
+    """
+    Give shorthands to artists, continuing from last given one, and save them along
+    with info about sent artists, all at once.
+    Args:
+        user_id: Tg user_id field
+        art_names: artists to send
+        shorthand_count: last given shorthand number
+    Returns:
+        tuple with lines "/01 Artist" and last given shorthand number
     """
-    Prepare main bot message — news about events.
-    Return:
+    max_shorthand = cfg.INTEGER_MAX_SHORTHAND
+    fill_numbers = 2 if max_shorthand < 100 else 3
+    gig_list = []
+    sent_arts = []
+    for art_name in art_names:
+        shorthand_count = shorthand_count + 1 if shorthand_count < max_shorthand else 1
+        gig_list.append(f"/{str(shorthand_count).zfill(fill_numbers)} {art_name}")
+        sent_arts.append((shorthand_count, art_name))
+    await db.wsql_last_sent_arts_batch(user_id, sent_arts)
+    return gig_list, shorthand_count
+
+
+async def iter_gigs_text(
+    user_id: int,
+    request: bool,
+    stored: bool = False,
+    quiet: bool = False,
+    progress: Optional[Progress] = None,
+) -> AsyncIterator[str]:
+    """
+    Prepare main bot message — news about events, part by part. Scrobbles and events
+    for all user's lfm accounts are loaded concurrently, then each account gives one
+    part, strictly in accounts order, as soon as it processed. Shorthands are assigned
+    in same order, so numbering is deterministic.
+    Args:
+        user_id: Tg user_id field
+        request: True if user asked with /getgigs, False for daily job
+        stored: if True, use only data stored in db, see stored_filter_acc()
+        quiet: if True, yield only news about artists, without errors and "no news"
+        progress: counters to update while loading, if any
+    Yields:
         Markdown-formatted string with artists OR String "No new concerts" OR String
     with error info for user, for each of it lfm accountss
     """
-    logger.info('Entered prepare_gigs_text() for %s', user_id)
+    logger.info('Entered iter_gigs_text() for %s', user_id)
+    start = time.perf_counter()
     usersettings = await db.rsql_settings(user_id)
     assert usersettings
     shorthand_count = int(await db.rsql_maxshorthand(user_id))
-    max_shorthand = cfg.INTEGER_MAX_SHORTHAND
-    fill_numbers = 2 if max_shorthand < 100 else 3
-    lfm_accs = await db.rsql_lfmuser(user_id)
-    gigs_text = ''
-    for acc in lfm_accs:
-        #  Get scrobbles
-        scrobbles_dict = await parser_scrobbles(user_id, acc)
-        #  Save scrobbles or add error
-        if isinstance(scrobbles_dict, dict) and len(scrobbles_dict.keys()):
-            await save_scrobbles(user_id, acc, scrobbles_dict)
-        elif isinstance(scrobbles_dict, dict):
-            if usersettings.nonewevents or request:
-                gigs_text += await i34g(
-                    "news_builders.no_scrobbles", acc=acc, user_id=user_id
-                )
+    tasks = {
+        acc: asyncio.create_task(
+            stored_filter_acc(user_id, acc)
+            if stored
+            else fetch_filter_acc(user_id, acc, progress)
+        )
+        for acc in await db.rsql_lfmuser(user_id)
+    }
+    #  Artists already listed for previous accounts. When processed one by one, they
+    #  were filtered out as sent; now all the accounts are filtered at once.
+    listed_arts = set()
+    try:
+        for acc, task in tasks.items():
+            scrobbles_dict, filtered = await task
+            #  Add error or "no scrobbles" message
+            if isinstance(scrobbles_dict, int):
+                if not quiet:
+                    yield await error_text(scrobbles_dict, acc, user_id)
                 continue
-        elif isinstance(scrobbles_dict, int):
-            gigs_text += await error_text(scrobbles_dict, acc, user_id)
-            continue
-        else:
-            logger.warning('OOOOF! Strange error when loading scrobbles')
-            continue
-        #  Get and save events
-        filtered = await filter_artists(user_id, scrobbles_dict.keys())
-        #  Create text for user
-        if filtered:
-            gig_list = []
-            for art_name in filtered:
-                shorthand_count = (
-                    shorthand_count + 1 if shorthand_count < max_shorthand else 1
-                )
-                shorthand = f"/{str(shorthand_count).zfill(fill_numbers)}"
-                gig_list.append(f"{shorthand} {art_name}")
-                #  Save shorthands and info about sent artist
-                await db.wsql_last_sent_arts(user_id, shorthand_count, art_name)
-            news_header = await i34g(
-                "news_builders.news_header", acc=acc, user_id=user_id
-            )
-            #  For each acc add new events =)
-            gigs_text += news_header + " \n".join(gig_list) + "\n"
-        else:
-            #  Add "no_news" message if appropriated
-            if usersettings.nonewevents or request:
-                gigs_text += await i34g(
-                    "news_builders.no_news", acc=acc, user_id=user_id
+            if not isinstance(scrobbles_dict, dict):
+                logger.warning('OOOOF! Strange error when loading scrobbles')
+                continue
+            if not scrobbles_dict:
+                if (usersettings.nonewevents or request) and not quiet:
+                    yield await i34g(
+                        "news_builders.no_scrobbles", acc=acc, user_id=user_id
+                    )
+                continue
+            filtered = [art for art in filtered if art not in listed_arts]
+            listed_arts.update(filtered)
+            #  Create text for user
+            if filtered:
+                gig_list, shorthand_count = await assign_shorthands(
+                    user_id, filtered, shorthand_count
                 )
-    return gigs_text
+                #  For each acc add new events =)
+                yield await i34g(
+                    "news_builders.news_header", acc=acc, user_id=user_id
+                ) + " \n".join(gig_list) + "\n"
+            else:
+                #  Add "no_news" message if appropriated
+                if (usersettings.nonewevents or request) and not quiet:
+                    yield await i34g("news_builders.no_news", acc=acc, user_id=user_id)
+    finally:
+        #  If consumer stopped early or error raised, don't leave loads in background
+        for task in tasks.values():
+            task.cancel()
+        gigs_prepare_seconds.observe(
+            time.perf_counter() - start,
+            'stored' if stored else 'request' if request else 'job',
+        )
+
+
+async def prepare_gigs_chunks(
+    user_id: int,
+    request: bool,
+    stored: bool = False,
+    quiet: bool = False,
+    progress: Optional[Progress] = None,
+) -> AsyncIterator[str]:
+    """
+    Same as iter_gigs_text(), but yields Tg-sized chunks ready to send. Chunk is given
+    away as soon as it is full, not waiting for the rest accounts.
+    """
+    chunker = TextChunker()
+    async for part in iter_gigs_text(user_id, request, stored, quiet, progress):
+        for chunk in chunker.add(part):
+            yield chunk
+    for chunk in chunker.flush():
+        yield chunk
 
 
 async def prepare_details_text(user_id: int, shorthand: int) -> str:
     """
-    Prepare secondary bot message — detailed info about artist's events.
+    Prepare secondary bot message — detailed info about artist's events. Rendered text
+    is cached by (artist, locale, event-set version) and shared among users. Version is
+    the event rows themselves, so any new or changed event gives new key, and outdated
+    texts are evicted by LRU.
     Args:
         user_id: Tg user_id field
         shorthand: quick link pressed by user
-    # TODO 4096 symbols no more
+    Returns:
+        text which may be longer than Tg message limit, see split_text()
     """
     events = await db.rsql_getallevents(user_id, shorthand)
+    locale = await db.rsql_locale(user_id) or cfg.LOCALE_DEFAULT
 
     if not events:
-        return await i34g("news_builders.no_events_shortcut", user_id=user_id)
+        return await i34g("news_builders.no_events_shortcut", locale=locale)
 
+    events_artist = events[0][0]
+    cache_key = (events_artist, locale, tuple(events))
+    news_text = details_cache.get(cache_key)
+    if news_text is None:
+        news_text = await render_details_text(events, locale)
+        details_cache.put(cache_key, news_text)
+        logger.debug('Details rendered for %s, locale %s', events_artist, locale)
+    else:
+        logger.debug('Details taken from cache for %s', events_artist)
+    return news_text
+
+
+async def render_details_text(events: List[Tuple], locale: str) -> str:
+    """
+    Build details text for events of one artist. Locale is resolved by caller once, so
+    there is no locale lookup for each event row.
+    Args:
+        events: rows returned by rsql_getallevents()
+        locale: locale to render text in
+    """
     prev_country = None
     news_text = []
     for event in events:
-        events_artist = event[0]
         event_date = text_to_userdate(event[1])
         event_venue = event[2]
         event_city = event[3]
@@ -184,7 +352,7 @@ async def prepare_details_text(user_id: int, shorthand: int) -> str:
                 await i34g(
                     "news_builders.in_country",
                     event_country=event_country,
-                    user_id=user_id,
+                    locale=locale,
                 )
             )
         prev_country = event_country
@@ -195,14 +363,14 @@ async def prepare_details_text(user_id: int, shorthand: int) -> str:
                 event_date=event_date,
                 event_city=event_city,
                 event_venue=event_venue,
-                user_id=user_id,
+                locale=locale,
             )
         )
     events_artist = events[0][0]
     events_url = await i34g(
         "parse_services.lastfmeventurl",
         artist=artist_at_url(events_artist),
-        user_id=user_id,
+        locale=locale,
     )
     #  David Bowie events
     news_text.insert(
@@ -211,8 +379,7 @@ async def prepare_details_text(user_id: int, shorthand: int) -> str:
             "news_builders.details_header",
             events_artist=events_artist,
             events_url=events_url,
-            user_id=user_id,
+            locale=locale,
         ),
     )
-    news_text = "".join(news_text)
-    return news_text
+    return "".join(news_text)
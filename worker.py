@@ -0,0 +1,86 @@
+# Green Grass Bot — Ties the music you're listening to with the concert it's playing at.
+# Copyright (C) 2021-2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""This is worker execution program file. Workers run daily jobs, partitioned by
+user_id, while main.py process receives updates. Needs cfg.WORKERS_QTY > 0 both for
+main.py and workers. Usage:
+    python worker.py <index>  run one worker, index from 0 to WORKERS_QTY-1
+    python worker.py all      run all WORKERS_QTY workers as subprocesses (local test)
+"""
+
+import multiprocessing
+import os
+import sys
+
+import config as cfg
+
+
+def run_worker(index: int) -> None:
+    """
+    Run one worker process. Each worker writes its own log file, because rotating
+    file handler can not be shared between processes.
+    Args:
+        index: worker index, from 0 to WORKERS_QTY-1
+    """
+    cfg.FILE_ROTATING_LOGGER = f'worker_{index}.log'
+    # pylint: disable=import-outside-toplevel
+    import asyncio
+
+    import i18n
+
+    from services.logger import apply_log_levels
+    from services.worker_service import start_worker
+
+    apply_log_levels()
+    i18n.load_path.append(cfg.PATH_TRANSLATIONS)
+    i18n.set('filename_format', cfg.FILENAME_FORMAT_I18N)
+    i18n.set('locale', cfg.LOCALE_DEFAULT)
+    try:
+        asyncio.run(start_worker(os.environ['BOT_TOKEN'], index, cfg.WORKERS_QTY))
+    except KeyboardInterrupt:
+        pass
+
+
+def main() -> None:
+    """
+    Parse argument and start worker(s).
+    """
+    if cfg.WORKERS_QTY < 1:
+        sys.exit('Set WORKERS_QTY in config.py to run workers')
+    if len(sys.argv) != 2:
+        sys.exit(__doc__)
+    if sys.argv[1] == 'all':
+        #  Not daemonic: workers start own parsing processes, see ParsePool
+        processes = [
+            multiprocessing.Process(target=run_worker, args=(index,))
+            for index in range(cfg.WORKERS_QTY)
+        ]
+        for process in processes:
+            process.start()
+        try:
+            for process in processes:
+                process.join()
+        finally:
+            for process in processes:
+                process.terminate()
+                process.join()
+        return None
+    index = int(sys.argv[1])
+    if not 0 <= index < cfg.WORKERS_QTY:
+        sys.exit(f'Worker index should be from 0 to {cfg.WORKERS_QTY - 1}')
+    run_worker(index)
+    return None
+
+
+if __name__ == '__main__':
+    main()